@@ -3,7 +3,8 @@ Main Flask application for the Ironforge Welding website.
 
 This module initializes the Flask app, registers blueprints for each
 page route, configures logging, sets up CSRF protection, rate limiting,
-and Flask-Mail, adds security headers, and defines custom error handlers.
+and Flask-Mail, sets up the rendered-page cache and static asset
+fingerprinting, adds security headers, and defines custom error handlers.
 
 Run this file directly to start the development server.
 
@@ -11,14 +12,49 @@ Usage:
     python app.py
 """
 
+import time
+
+# Start the clock before the heavy imports so the startup profile can
+# report their cost (see startup_profile.py).
+_IMPORTS_STARTED = time.perf_counter()
+
+# pylint: disable=wrong-import-position
 import logging
 import os
 from datetime import datetime
 
 from flask import Flask, render_template
+from flask.logging import default_handler
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from cache_policy import apply_cache_policy, register_cache_policy
 from config import CONFIG_MAP
-from extensions import csrf, limiter, mail
+from extensions import (
+    asset_audit,
+    asset_manifest,
+    compression,
+    content_store,
+    critical_css,
+    csrf,
+    early_hints,
+    image_meta,
+    limiter,
+    mail,
+    mail_digest,
+    mail_queue,
+    metrics,
+    page_cache,
+    responsive_images,
+    smtp_pool,
+    spam_filter,
+    submission_store,
+)
+from freeze import freeze_command
+from log_pipeline import build_handler, install_handler, register_request_logging
+from startup_profile import StartupProfile, startup_cli
+from warmup import configure_bytecode_cache, warm_up
+
+_IMPORTS_MS = (time.perf_counter() - _IMPORTS_STARTED) * 1000
 
 
 # ---------------------------------------------------------------------------
@@ -30,27 +66,42 @@ def configure_logging(app):
     """
     Configure application-wide logging.
 
-    Sets up a stream handler with a consistent format.  The log level
-    is DEBUG when the app is in debug mode, otherwise INFO.
+    Installs one handler on the root logger, so the route and extension
+    module loggers share it with the app logger.  By default a background
+    thread does the stream I/O (``LOG_QUEUE``); lines are plain text or
+    JSON (``LOG_FORMAT``) and INFO lines can be sampled per request
+    (``LOG_SAMPLE_RATE``).  See log_pipeline.py.  The log level is DEBUG
+    when the app is in debug mode, otherwise INFO.
 
     Args:
         app: The Flask application instance.
     """
     log_level = logging.DEBUG if app.debug else logging.INFO
-
-    # Create a formatter that includes timestamp, level, and message.
-    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-
-    # Stream handler for console output.
-    stream_handler = logging.StreamHandler()
-    stream_handler.setLevel(log_level)
-    stream_handler.setFormatter(formatter)
-
-    # Attach handler to the Flask app logger.
+    sample_rate = min(1.0, max(0.0, app.config.get("LOG_SAMPLE_RATE", 1.0)))
+
+    handler = build_handler(
+        log_format=app.config.get("LOG_FORMAT", "text"),
+        use_queue=app.config.get("LOG_QUEUE", True),
+        sample_rate=sample_rate,
+        level=log_level,
+    )
+    install_handler(handler, log_level)
+
+    # The app logger propagates to the root handler instead of Flask's
+    # own stderr handler, so nothing is written twice.
+    app.logger.removeHandler(default_handler)
     app.logger.setLevel(log_level)
-    app.logger.addHandler(stream_handler)
 
-    app.logger.info("Logging configured at %s level.", logging.getLevelName(log_level))
+    # Request ids, per-request sampling and the per-response line.
+    register_request_logging(app, sample_rate)
+
+    app.logger.info(
+        "Logging configured at %s level (%s, %s%s).",
+        logging.getLevelName(log_level),
+        app.config.get("LOG_FORMAT", "text"),
+        "queued" if app.config.get("LOG_QUEUE", True) else "synchronous",
+        ", INFO sampled at %g" % sample_rate if sample_rate < 1.0 else "",
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -100,12 +151,10 @@ def register_security_headers(app):
             "frame-ancestors 'self';"
         )
 
-        # Prevent browsers from caching sensitive pages.
-        response.headers["Cache-Control"] = (
-            "no-store, no-cache, must-revalidate, max-age=0"
-        )
-
-        return response
+        # Route-aware caching: long-lived for static files, revalidated
+        # (ETag / 304) for public pages, no-store for the contact form
+        # and anything carrying flash messages.  See cache_policy.py.
+        return apply_cache_policy(response)
 
     app.logger.info("Security headers registered.")
 
@@ -130,7 +179,11 @@ def create_app(config_name=None):
     Returns:
         A fully configured Flask application instance.
     """
-    app = Flask(__name__)
+    # Phase timings for ``flask startup profile`` / STARTUP_PROFILE.
+    profile = StartupProfile(imports_ms=_IMPORTS_MS)
+
+    with profile.phase("flask app"):
+        app = Flask(__name__)
 
     # Determine which configuration to use.
     if config_name is None:
@@ -145,25 +198,95 @@ def create_app(config_name=None):
         )
         config_class = CONFIG_MAP["development"]
 
-    app.config.from_object(config_class)
+    with profile.phase("config"):
+        app.config.from_object(config_class)
 
     # Set up logging before anything else.
-    configure_logging(app)
+    with profile.phase("logging"):
+        configure_logging(app)
     app.logger.info("App created with '%s' configuration.", config_name)
 
+    # Behind a reverse proxy (see server.py and the nginx example in
+    # freeze.py) take the client address from X-Forwarded-For, so rate
+    # limits and stored submissions see the visitor, not the proxy.
+    proxy_hops = app.config.get("PROXY_FIX_X_FOR", 0)
+    if proxy_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+        app.logger.info("Trusting %d X-Forwarded-For hop(s).", proxy_hops)
+
+    app.extensions["startup_profile"] = profile
+    app.cli.add_command(startup_cli)
+    app.cli.add_command(freeze_command)
+
+    # Share compiled templates between workers via instance/jinja-cache.
+    with profile.phase("bytecode cache"):
+        configure_bytecode_cache(app)
+
     # Initialise extensions.
-    csrf.init_app(app)
-    limiter.init_app(app)
-    mail.init_app(app)
-    app.logger.info("CSRF protection, rate limiter, and Flask-Mail initialised.")
+    with profile.phase("csrf + limiter"):
+        csrf.init_app(app)
+        limiter.init_app(app)
+
+    # Flask-Mail and the delivery stack are only imported and set up
+    # when email is switched on; otherwise contact_submit just logs.
+    if app.config.get("MAIL_ENABLED"):
+        with profile.phase("mail"):
+            mail.init_app(app)
+            smtp_pool.init_app(app)  # Before the queue, which picks it up.
+            mail_queue.init_app(app)
+            mail_digest.init_app(app)
+
+    with profile.phase("submission store"):
+        submission_store.init_app(app)
+    app.logger.info("CSRF protection and rate limiter initialised.")
+
+    # Site content from content/*.json, reloaded when the files change.
+    with profile.phase("content"):
+        content_store.init_app(app)
+
+    # The page cache wraps the CSRF template global, so it must be
+    # initialised after CSRF protection.  Cached pages are dropped
+    # whenever the content version changes.
+    with profile.phase("page cache"):
+        page_cache.init_app(app)
+        page_cache.depends_on(content_store.current_version)
+
+    # The quote form's signed timestamp is a page-cache hole, so the
+    # spam filter comes after the page cache.
+    with profile.phase("spam filter"):
+        spam_filter.init_app(app)
+
+    # Hash static files once so templates emit fingerprinted URLs.
+    with profile.phase("asset manifest"):
+        asset_manifest.init_app(app)
+
+    # Check that every static file the templates and content name
+    # exists; requests for missing ones get a cached 404.
+    with profile.phase("asset audit"):
+        asset_audit.init_app(app)
+
+    # Above-the-fold CSS per page template, inlined by base.html.
+    with profile.phase("critical css"):
+        critical_css.init_app(app)
+
+    # Resized image variants and the responsive_image() template helper.
+    with profile.phase("responsive images"):
+        responsive_images.init_app(app)
+
+    # Image sizes and loading placeholders (the image_meta() helper).
+    with profile.phase("image metadata"):
+        image_meta.init_app(app)
 
     # Log mail status so it's obvious in the console whether email
     # sending is active or suppressed.
     if app.config.get("MAIL_ENABLED"):
         app.logger.info(
-            "Email sending ENABLED — outbound via %s:%s.",
+            "Email sending ENABLED — outbound via %s:%s (%s).",
             app.config.get("MAIL_SERVER"),
             app.config.get("MAIL_PORT"),
+            "background queue, %d worker(s)" % mail_queue.workers
+            if mail_queue.enabled
+            else "inline",
         )
     else:
         app.logger.info(
@@ -171,14 +294,31 @@ def create_app(config_name=None):
             "Set MAIL_ENABLED=true to activate."
         )
 
-    # Register blueprints (route modules).
-    register_blueprints(app)
+    # Preload Link headers for each page's stylesheet, fonts and hero
+    # image, read from the templates themselves.
+    with profile.phase("early hints"):
+        early_hints.init_app(app)
 
-    # Register error handlers.
-    register_error_handlers(app)
-
-    # Add security headers to every response.
-    register_security_headers(app)
+    # Register blueprints (route modules).
+    with profile.phase("blueprints"):
+        register_blueprints(app)
+
+    # Compress text responses.  after_request hooks run in reverse
+    # order, so registering this before the security headers and cache
+    # policy makes it see their final body, ETag and 304s.
+    with profile.phase("compression"):
+        compression.init_app(app)
+
+    # Register error handlers, security headers and the cache policy.
+    with profile.phase("handlers + hooks"):
+        register_error_handlers(app)
+        register_cache_policy(app)
+        register_security_headers(app)
+
+    # Latency histograms and error counts at /metrics.  After the
+    # blueprints so every endpoint gets its own series.
+    with profile.phase("metrics"):
+        metrics.init_app(app)
 
     # Inject the current year into all templates for the footer copyright.
     @app.context_processor
@@ -186,6 +326,15 @@ def create_app(config_name=None):
         """Make the current year available to every template."""
         return {"current_year": datetime.now().year}
 
+    # Optionally compile every template and render every page now, so
+    # the first real visitor doesn't pay for it.
+    if app.config.get("TEMPLATE_WARMUP"):
+        with profile.phase("warm-up"):
+            warm_up(app)
+
+    if app.config.get("STARTUP_PROFILE"):
+        app.logger.info("%s", profile.report())
+
     return app
 
 
@@ -235,18 +384,21 @@ def register_error_handlers(app):
     def page_not_found(error):
         """Render a custom 404 page."""
         app.logger.warning("404 Not Found: %s", error)
+        metrics.inc("http_errors_total", "404")
         return render_template("errors/404.html"), 404
 
     @app.errorhandler(429)
     def rate_limit_exceeded(error):
         """Handle rate-limit (429 Too Many Requests) responses."""
         app.logger.warning("429 Rate limit hit: %s", error)
+        metrics.inc("http_errors_total", "429")
         return render_template("errors/429.html"), 429
 
     @app.errorhandler(500)
     def internal_server_error(error):
         """Render a custom 500 page."""
         app.logger.error("500 Internal Server Error: %s", error)
+        metrics.inc("http_errors_total", "500")
         return render_template("errors/500.html"), 500
 
 
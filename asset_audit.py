@@ -0,0 +1,190 @@
+"""
+Audit of static file references, and cheap 404s for the missing ones.
+
+Templates and content files name static files in several ways:
+
+* ``url_for('static', filename='...')`` in any template;
+* ``responsive_image('...')`` / ``image_url('...')`` in any template;
+* ``image_meta('...')`` in any template (relative to ``static/images/``);
+* the ``image`` field of services and projects in ``content/*.json``
+  (relative to ``static/images/``).
+
+:func:`find_missing` collects those references and reports the ones
+with no file behind them.  ``create_app`` runs the audit at start-up
+(``ASSET_AUDIT``: ``warn`` logs each missing file, ``fail`` refuses to
+start, ``off`` skips it) and ``flask assets audit`` runs it for CI,
+exiting non-zero when anything is missing.
+
+A missing hero video or poster would otherwise cost every page view a
+404 that renders ``errors/404.html`` and logs a warning.  Requests for
+files the audit found missing are answered before the view runs with a
+tiny ``404`` that browsers may cache for ``CACHE_CONTROL_MISSING``.
+Nothing is rendered or logged.  In debug mode a file that has appeared
+since start-up is served normally.
+"""
+
+import os
+import re
+from collections import defaultdict
+
+import click
+from flask import Response, current_app, g, request
+
+from assets import assets_cli
+
+# ``url_for('static', filename='x')`` with a literal filename.
+STATIC_REF_RE = re.compile(
+    r"url_for\(\s*['\"]static['\"]\s*,\s*filename\s*=\s*['\"]([^'\"]+)['\"]\s*[,)]"
+)
+# ``responsive_image('x', ...)`` / ``image_url('x', ...)`` with a literal path.
+IMAGE_HELPER_RE = re.compile(
+    r"\b(?:responsive_image|image_url)\(\s*['\"]([^'\"]+)['\"]\s*[,)]"
+)
+# ``image_meta('x')`` with a literal name, relative to static/images/.
+IMAGE_META_RE = re.compile(r"\bimage_meta\(\s*['\"]([^'\"]+)['\"]\s*\)")
+# HTML and Jinja comments (a commented-out <link> is never fetched).
+COMMENT_RE = re.compile(r"<!--.*?-->|\{#.*?#\}", re.S)
+
+
+def template_references(env):
+    """
+    Yield (logical path, "template:line") for every literal static reference.
+
+    Args:
+        env: The app's Jinja environment.
+    """
+    for name in env.list_templates(extensions=("html",)):
+        source, _filename, _uptodate = env.loader.get_source(env, name)
+        # Blank out comments but keep newlines so line numbers stay right.
+        source = COMMENT_RE.sub(lambda m: re.sub(r"[^\n]", " ", m.group(0)), source)
+        for pattern in (STATIC_REF_RE, IMAGE_HELPER_RE):
+            for match in pattern.finditer(source):
+                line = source.count("\n", 0, match.start()) + 1
+                yield match.group(1), "templates/%s:%d" % (name, line)
+        for match in IMAGE_META_RE.finditer(source):
+            line = source.count("\n", 0, match.start()) + 1
+            yield "images/" + match.group(1), "templates/%s:%d" % (name, line)
+
+
+def content_references(snapshot):
+    """
+    Yield (logical path, "content:id") for service and project images.
+
+    Args:
+        snapshot: A :class:`content.ContentSnapshot`.
+    """
+    for kind, records in (("services", snapshot.services), ("projects", snapshot.projects)):
+        for record in records:
+            if record.image:
+                yield "images/" + record.image, "content/%s.json#%s" % (kind, record.id)
+
+
+def find_missing(app):
+    """
+    Return every referenced static file that does not exist.
+
+    Args:
+        app: The Flask application instance.
+
+    Returns:
+        A dict mapping each missing logical path to the sorted list of
+        places that reference it.
+    """
+    references = list(template_references(app.jinja_env))
+    content = app.extensions.get("content")
+    if content is not None:
+        references.extend(content_references(content.snapshot()))
+
+    missing = defaultdict(set)
+    for logical, where in references:
+        if not os.path.isfile(os.path.join(app.static_folder, *logical.split("/"))):
+            missing[logical].add(where)
+    return {
+        logical: sorted(where, key=_place_key) for logical, where in sorted(missing.items())
+    }
+
+
+def _place_key(where):
+    """Sort "templates/x.html:101" after "templates/x.html:23"."""
+    path, _sep, line = where.rpartition(":")
+    return (path, int(line)) if line.isdigit() else (where, 0)
+
+
+class AssetAudit:
+    """
+    Runs the start-up audit and short-circuits requests for missing files.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`, after the content store and asset manifest.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.missing = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Audit the references and register the cheap-404 hook.
+
+        Args:
+            app: The Flask application instance.
+
+        Raises:
+            RuntimeError: If ``ASSET_AUDIT`` is ``fail`` and files are missing.
+        """
+        self.app = app
+        app.extensions["asset_audit"] = self
+        mode = app.config.get("ASSET_AUDIT", "warn").lower()
+        if mode == "off":
+            return
+
+        self.missing = find_missing(app)
+        for logical, where in self.missing.items():
+            app.logger.warning(
+                "Missing static file %s (referenced from %s).", logical, ", ".join(where)
+            )
+        if self.missing and mode == "fail":
+            raise RuntimeError(
+                "%d referenced static files are missing: %s"
+                % (len(self.missing), ", ".join(self.missing))
+            )
+        if self.missing:
+            app.before_request(self._known_missing)
+        app.logger.info(
+            "Static reference audit: %d missing file(s) will get cached 404s.",
+            len(self.missing),
+        )
+
+    def _known_missing(self):
+        """Answer requests for audited-missing files without rendering."""
+        if request.endpoint != "static":
+            return None
+        filename = (request.view_args or {}).get("filename")
+        if filename not in self.missing:
+            return None
+        if self.app.debug and os.path.isfile(os.path.join(self.app.static_folder, filename)):
+            return None  # Added since start-up.
+        # Picked up by cache_policy.resolve_policy().
+        g.asset_known_missing = True
+        return Response(b"Not Found\n", status=404, mimetype="text/plain")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@assets_cli.command("audit")
+def audit_command():
+    """Report static files referenced by templates or content but missing."""
+    missing = find_missing(current_app)
+    for logical, where in missing.items():
+        click.echo("MISSING %s" % logical)
+        for place in where:
+            click.echo("    %s" % place)
+    if missing:
+        raise click.ClickException("%d referenced static files are missing." % len(missing))
+    click.echo("All referenced static files exist.")
@@ -0,0 +1,486 @@
+"""
+Static asset fingerprinting for the Ironforge Welding website.
+
+At ``create_app`` time every file under ``static/`` is content-hashed
+and a manifest mapping logical names to fingerprinted names is built,
+e.g. ``css/styles.css`` -> ``css/styles.3f9a1c2b.css``.  With the
+manifest loaded:
+
+* ``url_for('static', filename=...)`` — in templates and Python alike —
+  emits the fingerprinted name, so a deploy that changes a file also
+  changes its URL.
+* Requests for a fingerprinted name are served from the original file
+  and marked ``immutable`` by the cache policy (one year).  Requests for
+  the plain name keep working with the ordinary static policy.
+
+Hashing ~14 MB of images on every worker start is wasteful, so the
+manifest is persisted to disk together with each file's size and mtime;
+only files whose size or mtime changed are rehashed.  ``flask assets
+manifest`` prebuilds the file during a deploy.
+
+Text assets (CSS, JS, SVG, ...) can also be precompressed once with
+``flask assets compress``, which writes ``.gz`` and ``.br`` siblings.
+The static view then negotiates ``Accept-Encoding`` and sends those
+bytes directly, so no worker compresses the same file per request.
+Brotli output requires the optional ``Brotli`` package; without it only
+gzip siblings are written and served.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import time
+
+import click
+from flask import current_app, g, request, send_from_directory
+from flask.cli import AppGroup
+
+try:  # Optional dependency — enables .br siblings.
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Module-level logger for asset handling.
+logger = logging.getLogger(__name__)
+
+# Number of hex digits of the SHA-256 digest kept in fingerprinted names.
+HASH_LENGTH = 8
+
+# Bump when the on-disk manifest format changes.
+MANIFEST_VERSION = 1
+
+# File types worth precompressing (images and video are already compressed).
+COMPRESSIBLE_EXTENSIONS = {
+    ".css",
+    ".js",
+    ".json",
+    ".map",
+    ".svg",
+    ".txt",
+    ".xml",
+    ".html",
+    ".ico",
+    ".webmanifest",
+}
+
+# Content-Encoding token -> sibling file suffix, in order of preference.
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# CLI group: ``flask assets <command>``.
+assets_cli = AppGroup("assets", help="Build and inspect static asset artefacts.")
+
+
+def fingerprint_name(filename, digest):
+    """
+    Insert a content hash before a file's extension.
+
+    Args:
+        filename: The logical static path, e.g. ``css/styles.css``.
+        digest: Hex digest of the file contents.
+
+    Returns:
+        The fingerprinted path, e.g. ``css/styles.3f9a1c2b.css``.
+    """
+    stem, ext = posixpath.splitext(filename)
+    return "%s.%s%s" % (stem, digest[:HASH_LENGTH], ext)
+
+
+def iter_static_files(static_folder):
+    """
+    Yield the logical (forward-slash) path of every file under ``static/``.
+
+    Hidden files and directories and precompressed ``.gz``/``.br``
+    siblings are skipped.
+
+    Args:
+        static_folder: Absolute path of the static folder.
+    """
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith(".") or filename.endswith((".gz", ".br")):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            yield os.path.relpath(full_path, static_folder).replace(os.sep, "/")
+
+
+def _hash_file(path):
+    """Return the hex SHA-256 digest of a file, read in 64 KB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(static_folder, previous=None):
+    """
+    Hash every static file, reusing digests from a previous manifest.
+
+    Args:
+        static_folder: Absolute path of the static folder.
+        previous: The ``files`` mapping from an earlier manifest, or None.
+
+    Returns:
+        A tuple of (files: dict, rehashed: int) where ``files`` maps each
+        logical path to ``{"size", "mtime", "hash", "path"}``.
+    """
+    previous = previous or {}
+    files = {}
+    rehashed = 0
+
+    for logical in iter_static_files(static_folder):
+        stat = os.stat(os.path.join(static_folder, logical))
+        old = previous.get(logical)
+        if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime_ns:
+            digest = old["hash"]
+        else:
+            digest = _hash_file(os.path.join(static_folder, logical))
+            rehashed += 1
+        files[logical] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest,
+            "path": fingerprint_name(logical, digest),
+        }
+
+    return files, rehashed
+
+
+def load_manifest(path):
+    """
+    Read a manifest file from disk.
+
+    Args:
+        path: Location of the JSON manifest.
+
+    Returns:
+        The ``files`` mapping, or an empty dict if the file is missing,
+        unreadable or written by an incompatible version.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(path, files):
+    """
+    Atomically write a manifest to disk.
+
+    The file is written to a temporary name and renamed into place so a
+    concurrently starting worker never reads a half-written manifest.
+
+    Args:
+        path: Location of the JSON manifest.
+        files: The ``files`` mapping produced by :func:`build_manifest`.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, handle, indent=1)
+    os.replace(tmp_path, path)
+
+
+def precompress_file(path, force=False):
+    """
+    Write ``.gz`` (and, if available, ``.br``) siblings for one file.
+
+    A sibling is only rewritten when it is missing, older than the
+    source, or ``force`` is set.  Siblings that would not be smaller than
+    the source are removed instead of written.
+
+    Args:
+        path: Absolute path of the source file.
+        force: Rewrite siblings even if they look up to date.
+
+    Returns:
+        The number of sibling files written.
+    """
+    written = 0
+    source_mtime = os.stat(path).st_mtime
+    data = None
+
+    for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        target = path + suffix
+        if not force and os.path.exists(target) and os.stat(target).st_mtime >= source_mtime:
+            continue
+
+        if data is None:
+            with open(path, "rb") as handle:
+                data = handle.read()
+        if encoding == "br":
+            compressed = brotli.compress(data, quality=11)
+        else:
+            # mtime=0 keeps the output byte-for-byte reproducible.
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+
+        if len(compressed) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+
+        tmp_path = "%s.%d.tmp" % (target, os.getpid())
+        with open(tmp_path, "wb") as handle:
+            handle.write(compressed)
+        os.replace(tmp_path, target)
+        written += 1
+
+    return written
+
+
+def precompress_static(static_folder, force=False):
+    """
+    Precompress every compressible text asset under ``static/``.
+
+    Args:
+        static_folder: Absolute path of the static folder.
+        force: Rewrite siblings even if they look up to date.
+
+    Returns:
+        A tuple of (files considered, siblings written).
+    """
+    considered = 0
+    written = 0
+    for logical in iter_static_files(static_folder):
+        if posixpath.splitext(logical)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        considered += 1
+        written += precompress_file(os.path.join(static_folder, logical), force)
+    return considered, written
+
+
+def find_precompressed(static_folder):
+    """
+    Map each text asset to the up-to-date compressed siblings it has.
+
+    Siblings older than their source file are ignored, so a stale
+    ``.gz`` is never served after the original was edited.
+
+    Args:
+        static_folder: Absolute path of the static folder.
+
+    Returns:
+        A dict of logical path -> tuple of available encodings, in order
+        of preference (e.g. ``("br", "gzip")``).
+    """
+    available = {}
+    for logical in iter_static_files(static_folder):
+        if posixpath.splitext(logical)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            continue
+        path = os.path.join(static_folder, logical)
+        source_mtime = os.stat(path).st_mtime
+        encodings = tuple(
+            encoding
+            for encoding, suffix in PRECOMPRESSED_ENCODINGS
+            if os.path.exists(path + suffix)
+            and os.stat(path + suffix).st_mtime >= source_mtime
+        )
+        if encodings:
+            available[logical] = encodings
+    return available
+
+
+class AssetManifest:
+    """
+    Fingerprinted static URLs backed by a disk-cached content manifest.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.files = {}
+        self.precompressed = {}
+        self._by_logical = {}
+        self._by_fingerprint = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Load or build the manifest and hook it into URL building and
+        static file serving.
+
+        Args:
+            app: The Flask application instance.
+        """
+        app.extensions["asset_manifest"] = self
+        app.cli.add_command(assets_cli)
+        app.view_functions["static"] = self._make_static_view(app)
+
+        if app.config.get("ASSET_PRECOMPRESSED", False):
+            self.precompressed = find_precompressed(app.static_folder)
+            app.logger.info(
+                "Serving precompressed variants for %d static files.",
+                len(self.precompressed),
+            )
+
+        self.enabled = app.config.get("ASSET_FINGERPRINTING", False)
+        if not self.enabled:
+            app.logger.info("Static asset fingerprinting DISABLED.")
+            return
+
+        started = time.perf_counter()
+        path = manifest_path(app)
+        previous = load_manifest(path)
+        files, rehashed = build_manifest(app.static_folder, previous)
+        self.load(files)
+        if rehashed or files.keys() != previous.keys():
+            try:
+                save_manifest(path, self.files)
+            except OSError:
+                # A read-only deploy still works; it just rehashes next time.
+                logger.warning("Could not write asset manifest to %s.", path)
+
+        app.url_defaults(self._fingerprint_url)
+
+        app.logger.info(
+            "Static asset manifest ready: %d files (%d rehashed) in %.0f ms.",
+            len(self.files),
+            rehashed,
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def load(self, files):
+        """
+        Install a ``files`` mapping and rebuild the lookup tables.
+
+        Args:
+            files: Mapping produced by :func:`build_manifest`.
+        """
+        self.files = files
+        self._by_logical = {name: entry["path"] for name, entry in files.items()}
+        self._by_fingerprint = {entry["path"]: name for name, entry in files.items()}
+
+    def url_for(self, filename):
+        """Return the fingerprinted name for ``filename`` (or it unchanged)."""
+        return self._by_logical.get(filename, filename)
+
+    def resolve(self, filename):
+        """
+        Map a requested static path back to a real file.
+
+        Args:
+            filename: The path from the URL.
+
+        Returns:
+            A tuple of (logical path, is_fingerprinted).
+        """
+        logical = self._by_fingerprint.get(filename)
+        if logical is None:
+            return filename, False
+        return logical, True
+
+    def _fingerprint_url(self, endpoint, values):
+        """``url_defaults`` hook rewriting static filenames in place."""
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = self.url_for(values["filename"])
+
+    def negotiate_encoding(self, logical):
+        """
+        Pick the best precompressed sibling the client accepts.
+
+        Args:
+            logical: The logical static path.
+
+        Returns:
+            A (encoding, suffix) pair, or None to send the file as is.
+        """
+        available = self.precompressed.get(logical)
+        if not available:
+            return None
+        accepted = request.accept_encodings
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            if encoding in available and accepted.quality(encoding) > 0:
+                return encoding, suffix
+        return None
+
+    def _make_static_view(self, app):
+        """
+        Wrap Flask's static view.
+
+        Fingerprinted names are resolved to the real file, and text
+        assets are sent as a precompressed sibling when the client's
+        ``Accept-Encoding`` allows it.
+        """
+        send_static_file = app.view_functions["static"]
+
+        def static(filename):
+            logical, fingerprinted = self.resolve(filename)
+            # Picked up by cache_policy.resolve_policy().
+            g.asset_fingerprinted = fingerprinted
+
+            negotiated = self.negotiate_encoding(logical)
+            if negotiated is None:
+                response = send_static_file(filename=logical)
+            else:
+                encoding, suffix = negotiated
+                response = send_from_directory(
+                    app.static_folder,
+                    logical + suffix,
+                    mimetype=mimetypes.guess_type(logical)[0],
+                    max_age=app.get_send_file_max_age(logical),
+                )
+                response.headers["Content-Encoding"] = encoding
+
+            if logical in self.precompressed:
+                response.vary.add("Accept-Encoding")
+            return response
+
+        return static
+
+
+def manifest_path(app):
+    """
+    Return where the asset manifest is cached on disk.
+
+    Args:
+        app: The Flask application instance.
+    """
+    return app.config.get("ASSET_MANIFEST_PATH") or os.path.join(
+        app.instance_path, "asset-manifest.json"
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@assets_cli.command("compress")
+@click.option("--force", is_flag=True, help="Rewrite siblings that look up to date.")
+def compress_command(force):
+    """Write .gz/.br siblings for every static text asset."""
+    considered, written = precompress_static(current_app.static_folder, force)
+    click.echo(
+        "Precompressed %d text assets (%d sibling files written)%s."
+        % (
+            considered,
+            written,
+            "" if brotli is not None else "; Brotli not installed, gzip only",
+        )
+    )
+
+
+@assets_cli.command("manifest")
+def manifest_command():
+    """Hash every static file and write the asset manifest."""
+    path = manifest_path(current_app)
+    files, rehashed = build_manifest(current_app.static_folder, load_manifest(path))
+    save_manifest(path, files)
+    click.echo(
+        "Wrote %s (%d files, %d rehashed)." % (path, len(files), rehashed)
+    )
@@ -0,0 +1,397 @@
+"""
+HTTP load benchmark for every public route.
+
+Starts the app from ``create_app("production")`` in a child process
+(werkzeug's threaded server on a free local port) with its state in a
+temporary directory and email pointed at a local SMTP sink, then drives
+each route in turn at a fixed concurrency:
+
+* ``/``, ``/services`` and ``/contact`` (GET);
+* ``/gallery?category=<slug>`` for every category in content/;
+* ``/contact`` (POST) with a valid CSRF token, form timestamp and a
+  distinct address each time (so the spam filter lets it through), so
+  the submission store, mail queue and SMTP transport are exercised;
+* a sample of ``/static/`` files, taken from the links on the home page
+  (so fingerprinted URLs are used when fingerprinting is on).
+
+For each route it reports throughput and p50/p95/p99 latency, and can
+write the results as JSON.  The rate limiter is switched off in the
+server so the benchmark measures the routes, not 429s.
+
+Comparison mode (``--baseline results.json``) fails with exit status 1
+when any route's p95 latency rises, or its throughput falls, by more
+than ``--threshold`` (default 20 %) against the stored run.
+
+Usage (from the project root):
+    python benchmarks/http_load.py [--requests 500] [--concurrency 8]
+        [--static-sample 5] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.2]
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import re
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CSRF_RE = re.compile(r'name="csrf_token" value="([^"]+)"')
+FORM_TS_RE = re.compile(r'name="form_ts" value="([^"]+)"')
+STATIC_RE = re.compile(r'(?:href|src)="(/static/[^"?#]+)')
+
+# Shared by all client threads so every quote request is distinct.
+SUBMISSION_NUMBERS = itertools.count()
+
+
+# ---------------------------------------------------------------------------
+# SMTP sink
+# ---------------------------------------------------------------------------
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb == b"EHLO":
+                self.reply("250-localhost")
+                self.reply("250 SIZE 10485760")
+            elif verb == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply("250 OK")
+            elif verb == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Threaded SMTP server on a free local port that counts messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+# ---------------------------------------------------------------------------
+# App server
+# ---------------------------------------------------------------------------
+
+
+def _serve(ready):
+    """Child process: create the production app and serve it."""
+    import logging  # pylint: disable=import-outside-toplevel
+
+    from werkzeug.serving import make_server  # pylint: disable=import-outside-toplevel
+
+    from app import create_app  # pylint: disable=import-outside-toplevel
+
+    app = create_app("production")
+    for lim in app.extensions.get("limiter", ()):
+        lim.enabled = False
+    # Per-request INFO lines would mostly measure the terminal.
+    logging.getLogger().setLevel(logging.ERROR)
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    ready.put(server.server_port)
+    server.serve_forever()
+
+
+def start_server(state_dir, smtp_port):
+    """
+    Start the app in a child process.
+
+    The environment is set before the child imports ``config``, which
+    reads it at import time.
+
+    Returns:
+        A tuple of (process, port).
+    """
+    os.environ.update(
+        {
+            "SECRET_KEY": "benchmark-secret-key",
+            "MAIL_ENABLED": "true",
+            "MAIL_SERVER": "127.0.0.1",
+            "MAIL_PORT": str(smtp_port),
+            "MAIL_USE_TLS": "false",
+            "MAIL_USE_SSL": "false",
+            "MAIL_USERNAME": "",  # No AUTH against the sink.
+            "MAIL_DEFAULT_SENDER": "benchmark@example.com",
+            "QUOTE_RECIPIENT_EMAIL": "quotes@example.com",
+            "MAIL_DIGEST_WINDOW": "0",
+            "SPAM_MIN_FILL_SECONDS": "0",  # The form is posted instantly.
+            "SUBMISSIONS_DB_PATH": os.path.join(state_dir, "submissions.sqlite3"),
+            "RATELIMIT_STORAGE_URI": "memory://",
+            "METRICS_DIR": os.path.join(state_dir, "metrics"),
+            "JINJA_BYTECODE_CACHE_DIR": os.path.join(state_dir, "jinja-cache"),
+        }
+    )
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready,), daemon=True)
+    process.start()
+    return process, ready.get(timeout=60)
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+
+class Client:
+    """One keep-alive connection with a cookie jar of its own."""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        """Send one request and return (status, body bytes)."""
+        headers = {"Accept-Encoding": "gzip, br"}
+        if self.cookies:
+            headers["Cookie"] = "; ".join("%s=%s" % kv for kv in self.cookies.items())
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Server closed an idle connection; retry once on a new one.
+            self.conn.close()
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+        data = response.read()
+        for header in response.headers.get_all("Set-Cookie") or ():
+            name, _, value = header.split(";", 1)[0].partition("=")
+            self.cookies[name.strip()] = value.strip()
+        return response.status, data
+
+
+def _contact_form(client):
+    """Return a request factory posting the contact form with a CSRF token."""
+    _status, html = client.request("GET", "/contact")
+    match = CSRF_RE.search(html.decode("utf-8"))
+    token = match.group(1) if match else ""
+    match = FORM_TS_RE.search(html.decode("utf-8"))
+    form_ts = match.group(1) if match else ""
+
+    def make():
+        n = next(SUBMISSION_NUMBERS)
+        return urlencode(
+            {
+                "csrf_token": token,
+                "form_ts": form_ts,
+                "name": "Benchmark %d" % n,
+                "email": "bench%d@example.com" % n,
+                "phone": "555-0100",
+                "service_type": "",
+                "message": "Benchmark quote request %d." % n,
+            }
+        )
+
+    return make
+
+
+def run_route(port, method, path, total, concurrency):
+    """
+    Send ``total`` requests to one route from ``concurrency`` threads.
+
+    Returns:
+        A dict of throughput, latency percentiles (ms) and error count.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = iter(range(total))
+    start = threading.Barrier(concurrency + 1)
+
+    def worker():
+        client = Client(port)
+        make_body = _contact_form(client) if method == "POST" else None
+        ok_status = (200, 302) if method == "POST" else (200,)
+        start.wait()
+        local, failed = [], 0
+        while next(remaining, None) is not None:
+            began = time.perf_counter()
+            try:
+                status, _data = client.request(
+                    method, path, make_body() if make_body else None
+                )
+            except (http.client.HTTPException, OSError):
+                status = 0
+            local.append(time.perf_counter() - began)
+            if status not in ok_status:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def routes(port, static_sample):
+    """Build the (name, method, path) list to benchmark."""
+    with open(os.path.join(ROOT, "content", "categories.json"), encoding="utf-8") as f:
+        slugs = [category["slug"] for category in json.load(f)]
+    _status, home = Client(port).request("GET", "/")
+    static = sorted(set(STATIC_RE.findall(home.decode("utf-8"))))[:static_sample]
+
+    result = [
+        ("GET /", "GET", "/"),
+        ("GET /services", "GET", "/services"),
+        ("GET /contact", "GET", "/contact"),
+    ]
+    result += [("GET /gallery?category=%s" % s, "GET", "/gallery?category=%s" % s) for s in slugs]
+    result.append(("POST /contact", "POST", "/contact"))
+    result += [("GET %s" % path, "GET", path) for path in static]
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+
+
+def compare(results, baseline, threshold):
+    """
+    Return a list of regression messages (empty when within threshold).
+
+    A route regresses when its p95 latency is more than ``threshold``
+    higher, or its throughput more than ``threshold`` lower, than in the
+    baseline.  Routes missing from either run are ignored.
+    """
+    regressions = []
+    for name, now in results["routes"].items():
+        before = baseline.get("routes", {}).get(name)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(
+                "%s: p95 %.2f ms -> %.2f ms" % (name, before["p95_ms"], now["p95_ms"])
+            )
+        if before["rps"] and now["rps"] < before["rps"] * (1 - threshold):
+            regressions.append("%s: %.0f req/s -> %.0f req/s" % (name, before["rps"], now["rps"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads per route")
+    parser.add_argument("--static-sample", type=int, default=5, help="static files to include")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed regression (0.2 = 20%%)"
+    )
+    args = parser.parse_args()
+
+    sink = SMTPSink()
+    with tempfile.TemporaryDirectory() as state_dir:
+        process, port = start_server(state_dir, sink.port)
+        try:
+            results = {
+                "meta": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                },
+                "routes": {},
+            }
+            print("%-48s %9s %9s %9s %9s %7s" % ("route", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+            for name, method, path in routes(port, args.static_sample):
+                stats = run_route(port, method, path, args.requests, args.concurrency)
+                results["routes"][name] = stats
+                print(
+                    "%-48s %9.1f %9.2f %9.2f %9.2f %7d"
+                    % (name, stats["rps"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["errors"])
+                )
+            # Give the mail queue a moment to drain into the sink.
+            time.sleep(1)
+            results["meta"]["emails_received"] = sink.messages
+            print("\nEmails received by the SMTP sink: %d" % sink.messages)
+        finally:
+            process.terminate()
+            process.join()
+    sink.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print("Results written to %s" % args.output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions beyond %.0f%%:" % (args.threshold * 100))
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\nNo route regressed beyond %.0f%% of the baseline." % (args.threshold * 100))
+
+
+if __name__ == "__main__":
+    main()
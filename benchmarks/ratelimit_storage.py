@@ -0,0 +1,107 @@
+"""
+Benchmark the SQLite rate-limit storage against ``memory://``.
+
+Two measurements:
+
+1. Throughput: how many limit checks per second a single process can do
+   with each backend and strategy (one ``hit()`` per simulated request,
+   as Flask-Limiter does for the 120/minute default limit).
+2. Correctness across processes: N worker processes each try to submit
+   the contact form 5 times against a "5 per minute" limit for the same
+   client.  A shared backend must allow exactly 5 in total; ``memory://``
+   allows 5 per worker.
+
+Usage (from the project root):
+    python benchmarks/ratelimit_storage.py [--checks 5000] [--workers 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import parse, storage, strategies  # noqa: E402
+
+import ratelimit_storage  # noqa: E402,F401  (registers sqlite://)
+
+STRATEGIES = {
+    "fixed-window": strategies.FixedWindowRateLimiter,
+    "moving-window": strategies.MovingWindowRateLimiter,
+}
+
+
+def throughput(uri, strategy, checks, clients=50):
+    """
+    Return limit checks per second for one backend and strategy.
+
+    Args:
+        uri: Storage URI.
+        strategy: Key of :data:`STRATEGIES`.
+        checks: Number of ``hit()`` calls to time.
+        clients: Number of distinct client keys to spread hits across.
+    """
+    limiter = STRATEGIES[strategy](storage.storage_from_string(uri))
+    limit = parse("120 per minute")
+    start = time.perf_counter()
+    for i in range(checks):
+        limiter.hit(limit, "10.0.0.%d" % (i % clients))
+    return checks / (time.perf_counter() - start)
+
+
+def _worker(uri, strategy, attempts, results):
+    """Try to submit the form ``attempts`` times from one process."""
+    limiter = STRATEGIES[strategy](storage.storage_from_string(uri))
+    limit = parse("5 per minute")
+    allowed = sum(1 for _ in range(attempts) if limiter.hit(limit, "contact", "203.0.113.9"))
+    results.put(allowed)
+
+
+def allowed_across_workers(uri, strategy, workers, attempts=5):
+    """Return how many submissions ``workers`` processes let through in total."""
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker, args=(uri, strategy, attempts, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return sum(results.get() for _ in processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", type=int, default=5000, help="hits per throughput run")
+    parser.add_argument("--workers", type=int, default=4, help="processes for the correctness run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {
+            "memory://": lambda: "memory://",
+            "sqlite://": lambda: "sqlite:///%s" % os.path.join(
+                directory, "ratelimit-%d.sqlite3" % time.monotonic_ns()
+            ),
+        }
+
+        print("Throughput (%d checks, 120/minute, 50 clients)" % args.checks)
+        for name, make_uri in backends.items():
+            for strategy in STRATEGIES:
+                rate = throughput(make_uri(), strategy, args.checks)
+                print("  %-10s %-14s %10.0f checks/s  %7.1f us/check" % (
+                    name, strategy, rate, 1e6 / rate))
+
+        print()
+        print("Contact form, 5/minute, %d workers x 5 attempts (shared limit allows 5)" % args.workers)
+        for name, make_uri in backends.items():
+            for strategy in STRATEGIES:
+                allowed = allowed_across_workers(make_uri(), strategy, args.workers)
+                print("  %-10s %-14s %3d allowed" % (name, strategy, allowed))
+
+
+if __name__ == "__main__":
+    main()
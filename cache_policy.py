@@ -0,0 +1,199 @@
+"""
+Per-endpoint HTTP caching policy for the Ironforge Welding website.
+
+Replaces the old blanket ``no-store`` header with a small policy table:
+
+* ``/static/*`` files are cacheable by browsers and proxies for a long
+  time (Flask's static handler already supplies ETag/Last-Modified).
+  Content-fingerprinted URLs (see ``assets.py``) and image derivatives
+  (see ``images.py``) are ``immutable``.
+* Public HTML pages (home, services, gallery) may be kept briefly by the
+  visitor's browser and are then revalidated.  They get a strong ETag
+  so a repeat visit costs a bodiless ``304 Not Modified``, and a
+  ``Last-Modified`` of the newest content file or template (the page
+  cache replaces it with the time the page was rendered).  The ETag
+  ignores the per-request CSRF token and form timestamp, which change
+  every second: it hashes the page cache's shell (holes unfilled) or,
+  for an uncached render, the body with those values blanked out.
+* The contact form, pages that carry flashed messages, error pages and
+  any endpoint not listed in the table are never stored.
+* Static files that templates reference but that do not exist (see
+  ``asset_audit.py``) get a briefly cacheable 404.
+
+The actual ``Cache-Control`` strings live in ``config.py`` so they can
+be tuned per environment.
+"""
+
+import hashlib
+import os
+import time
+
+from flask import current_app, g, request, session
+
+from page_cache import tree_signature
+
+# Map endpoint names to a policy name.  Endpoints not listed here fall
+# back to "no_store".
+CACHE_POLICIES = {
+    "static": "static",
+    "image_derivative": "immutable",
+    "home.index": "page",
+    "services.services": "page",
+    "gallery.gallery": "page",
+    "gallery.gallery_api": "page",
+    # Page-cached on the server, but the form carries a per-visitor
+    # CSRF token, so never stored by browsers or proxies.
+    "contact.contact": "no_store",
+    "contact.contact_submit": "no_store",
+}
+
+# Map policy names to the config key holding the Cache-Control value.
+POLICY_CONFIG_KEYS = {
+    "static": "CACHE_CONTROL_STATIC",
+    "immutable": "CACHE_CONTROL_IMMUTABLE",
+    "page": "CACHE_CONTROL_PAGES",
+    "no_store": "CACHE_CONTROL_NO_STORE",
+    "missing": "CACHE_CONTROL_MISSING",
+}
+
+
+def resolve_policy(response):
+    """
+    Decide which cache policy applies to the current response.
+
+    Args:
+        response: The outgoing Flask response.
+
+    Returns:
+        One of the policy names in ``POLICY_CONFIG_KEYS``.
+    """
+    policy = CACHE_POLICIES.get(request.endpoint, "no_store")
+
+    # Static files the start-up audit found missing (see asset_audit.py)
+    # get a short-lived cacheable 404 so browsers stop re-requesting them.
+    if g.get("asset_known_missing"):
+        return "missing"
+
+    # Error pages and redirects are never cached; neither is any page
+    # that showed (or still holds) per-visitor flash messages.
+    if response.status_code != 200 and not (
+        policy in ("static", "immutable") and response.status_code == 304
+    ):
+        return "no_store"
+    if policy == "page" and (g.get("had_flashes") or "_flashes" in session):
+        return "no_store"
+    if policy == "static" and g.get("asset_fingerprinted"):
+        return "immutable"
+    return policy
+
+
+def apply_cache_policy(response):
+    """
+    Set ``Cache-Control`` (and validators for HTML pages) on a response.
+
+    For cacheable HTML pages a strong ETag is computed by
+    :func:`page_etag` and the response is made conditional, so a matching
+    ``If-None-Match`` or ``If-Modified-Since`` turns it into a 304.
+
+    Args:
+        response: The outgoing Flask response.
+
+    Returns:
+        The (possibly converted to 304) response.
+    """
+    policy = resolve_policy(response)
+    response.headers["Cache-Control"] = current_app.config[POLICY_CONFIG_KEYS[policy]]
+
+    if (
+        policy == "page"
+        and request.method in ("GET", "HEAD")
+        and not response.is_streamed
+    ):
+        if response.last_modified is None:
+            clock = current_app.extensions.get("cache_policy")
+            if clock is not None:
+                response.last_modified = clock.last_modified()
+        response.set_etag(page_etag(response))
+        response = response.make_conditional(request)
+
+    return response
+
+
+def page_etag(response):
+    """
+    Compute a page's ETag, leaving out its per-request values.
+
+    Args:
+        response: The outgoing page response.
+
+    Returns:
+        A hex digest of the content version and the page's fixed text.
+    """
+    entry = g.get("page_cache_entry")
+    if entry is not None and entry[0].status == response.status_code:
+        body = entry[0].body.encode("utf-8")
+    else:
+        body = response.get_data()
+        for value in g.get("page_hole_values", ()):
+            body = body.replace(value.encode("utf-8"), b"")
+
+    content = current_app.extensions.get("content")
+    version = content.current_version() if content is not None else None
+    digest = hashlib.sha1(str(version).encode("ascii"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class PageClock:
+    """
+    When the rendered pages last changed: the newest content or template.
+
+    The template tree is re-scanned at most every ``check_interval``
+    seconds; the content time comes from the content store.
+
+    Args:
+        app: The Flask application instance.
+        check_interval: Seconds between template scans.
+    """
+
+    def __init__(self, app, check_interval=2.0):
+        self.app = app
+        self.check_interval = check_interval
+        self.template_dir = os.path.join(app.root_path, app.template_folder or "templates")
+        self._templates_mtime = 0.0
+        self._next_check = 0.0
+
+    def last_modified(self):
+        """Return the newest content or template mtime (epoch seconds)."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self._templates_mtime = tree_signature(self.template_dir)[1]
+        content = self.app.extensions.get("content")
+        content_mtime = content.last_modified() if content is not None else None
+        return max(self._templates_mtime, content_mtime or 0.0)
+
+
+def register_cache_policy(app):
+    """
+    Record, before each request, whether flashed messages are pending.
+
+    ``get_flashed_messages()`` removes the messages from the session
+    while the template renders, so the after-request hook cannot see
+    them any more.  Also sets up the :class:`PageClock` behind the
+    pages' ``Last-Modified``.
+
+    Args:
+        app: The Flask application instance.
+    """
+    app.extensions["cache_policy"] = PageClock(
+        app, float(app.config.get("PAGE_CACHE_CHECK_INTERVAL", 2.0))
+    )
+
+    @app.before_request
+    def remember_pending_flashes():
+        """Note whether this request will render flash messages."""
+        # Only HTML pages care; touching the session on static files and
+        # images would add "Vary: Cookie" to them.
+        if CACHE_POLICIES.get(request.endpoint) == "page":
+            g.had_flashes = "_flashes" in session
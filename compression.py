@@ -0,0 +1,245 @@
+"""
+On-the-fly compression of dynamic responses.
+
+Static text assets are precompressed offline (``flask assets compress``,
+see ``assets.py``), but rendered HTML and JSON went out as is.  This
+module compresses them in an ``after_request`` hook:
+
+* Only text responses (HTML, JSON, CSS, JS, SVG, plain text) of at
+  least ``COMPRESS_MIN_SIZE`` bytes are compressed; those always get
+  ``Vary: Accept-Encoding``.
+* Brotli (``COMPRESS_BR_LEVEL``, needs the optional ``Brotli``
+  package) is preferred over gzip (``COMPRESS_LEVEL``) when the client
+  accepts both.
+* Streamed and file responses, bodies without content (1xx, 204, 304),
+  responses that already have a ``Content-Encoding`` and those marked
+  ``Cache-Control: no-transform`` are left alone.
+* A strong ETag becomes weak: it was computed from the uncompressed
+  body by ``cache_policy.py`` and is shared by every encoding.
+
+Pages served from the page cache (see ``page_cache.py``) are compressed
+once per cached page, at the configured level, rather than per request
+(``TEMPLATE_WARMUP`` does it before the first visitor).  A page without
+holes keeps its finished gzip and Brotli bodies.  A page with holes
+(the CSRF token and the quote form's timestamp) keeps the fixed text
+between the holes as independently compressed raw-deflate blocks,
+each ending on a byte boundary.  A request then only compresses its
+few hole values and splices the blocks into one gzip stream, plus a
+CRC of the final body.  Brotli streams cannot be spliced, so such pages
+are sent as gzip whenever the client accepts it.
+"""
+
+import gzip
+import re
+import struct
+import zlib
+
+from flask import g, request
+
+try:  # Optional dependency — enables Content-Encoding: br.
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Response types worth compressing (images and video already are).
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/xml",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+}
+
+# gzip member header: deflate, no name, no mtime, unknown OS.
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+# An empty final deflate block (fixed Huffman, end-of-block only).
+DEFLATE_END = b"\x03\x00"
+
+
+def deflate_block(data, level):
+    """
+    Compress ``data`` into raw-deflate blocks that can be spliced.
+
+    The compressor starts with an empty window and ends with a sync
+    flush, so the output refers to nothing before it, ends on a byte
+    boundary and is not marked final.
+
+    Args:
+        data: Bytes to compress.
+        level: zlib compression level.
+
+    Returns:
+        The raw-deflate bytes (empty for empty input).
+    """
+    if not data:
+        return b""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_splice(blocks, data):
+    """
+    Wrap spliced raw-deflate blocks into a gzip body.
+
+    Args:
+        blocks: Output of :func:`deflate_block` for consecutive pieces of
+            ``data``, in order.
+        data: The uncompressed body the blocks decode to.
+
+    Returns:
+        A complete single-member gzip stream.
+    """
+    trailer = struct.pack("<II", zlib.crc32(data), len(data) & 0xFFFFFFFF)
+    return b"".join((GZIP_HEADER, *blocks, DEFLATE_END, trailer))
+
+
+class Compression:
+    """
+    Compresses text responses and reuses compressed cached pages.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.min_size = 1024
+        self.level = 6
+        self.br_level = 4
+        self.encodings = ("gzip",)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Read the settings and register the ``after_request`` hook.
+
+        ``after_request`` hooks run in reverse order of registration, so
+        call this *before* the cache policy is registered: the hook then
+        sees the final body, ETag and any 304.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.enabled = app.config.get("COMPRESS_ENABLED", True)
+        self.min_size = int(app.config.get("COMPRESS_MIN_SIZE", 1024))
+        self.level = int(app.config.get("COMPRESS_LEVEL", 6))
+        self.br_level = int(app.config.get("COMPRESS_BR_LEVEL", 4))
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        app.extensions["compression"] = self
+        if not self.enabled:
+            return
+
+        app.after_request(self.compress_response)
+        app.logger.info(
+            "Response compression ENABLED (%s, responses of %d+ bytes).",
+            ", ".join(self.encodings),
+            self.min_size,
+        )
+
+    def compress_response(self, response):
+        """
+        Compress an outgoing response if it is worth it and allowed.
+
+        Args:
+            response: The outgoing Flask response.
+
+        Returns:
+            The same response, possibly with a compressed body.
+        """
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.vary.add("Accept-Encoding")
+
+        accepted = [
+            encoding
+            for encoding in self.encodings
+            if request.accept_encodings.quality(encoding) > 0
+        ]
+        if not accepted:
+            return response
+
+        entry = g.get("page_cache_entry")
+        if entry is not None and entry[0].status == response.status_code:
+            encoding, body = self._from_cached_page(entry, data, accepted)
+        else:
+            encoding, body = accepted[0], self._compress(data, accepted[0])
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress(self, data, encoding):
+        """
+        Compress ``data`` at the configured gzip or Brotli level.
+
+        Args:
+            data: The uncompressed body.
+            encoding: ``"br"`` or ``"gzip"``.
+
+        Returns:
+            The compressed bytes.
+        """
+        if encoding == "br":
+            return brotli.compress(data, quality=self.br_level)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _from_cached_page(self, entry, data, accepted):
+        """
+        Build the compressed body from a cached page's stored blocks.
+
+        Args:
+            entry: ``(CachedPage, holes)`` recorded by ``page_cache.py``.
+            data: This request's uncompressed body.
+            accepted: Encodings the client accepts, best first.
+
+        Returns:
+            A tuple of (encoding, compressed body).
+        """
+        page, holes = entry
+        if not holes:
+            encoding = accepted[0]
+            body = page.encoded.get(encoding)
+            if body is None:
+                body = page.encoded[encoding] = self._compress(data, encoding)
+            return encoding, body
+
+        if "gzip" not in accepted:
+            return accepted[0], self._compress(data, accepted[0])
+
+        # Fixed text and placeholders alternate: [text, hole, text, ...].
+        blocks = page.encoded.get("gzip-blocks")
+        if blocks is None:
+            parts = re.split("(%s)" % "|".join(map(re.escape, holes)), page.body)
+            blocks = page.encoded["gzip-blocks"] = [
+                part if index % 2 else deflate_block(part.encode("utf-8"), self.level)
+                for index, part in enumerate(parts)
+            ]
+
+        spliced = [
+            deflate_block(holes[part].encode("utf-8"), self.level) if index % 2 else part
+            for index, part in enumerate(blocks)
+        ]
+        return "gzip", gzip_splice(spliced, data)
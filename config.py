@@ -8,6 +8,9 @@ environment variables with sensible defaults for local development.
 
 import os
 
+# Directory containing this file; Flask's instance folder lives beneath it.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class Config:
     """
@@ -20,7 +23,38 @@ class Config:
         TESTING: Flag to enable/disable testing mode.
         WTF_CSRF_ENABLED: Enable CSRF protection via Flask-WTF.
         RATELIMIT_STORAGE_URI: Backend for Flask-Limiter counters.
+        RATELIMIT_STRATEGY: Flask-Limiter windowing strategy.
+        PROXY_FIX_X_FOR: Trusted reverse-proxy hops in X-Forwarded-For.
         MAIL_*: Flask-Mail configuration for sending quote notifications.
+        MAIL_QUEUE_*: Background delivery queue for outbound email.
+        MAIL_POOL_*: Reusable SMTP connections.
+        MAIL_DIGEST_WINDOW: Seconds over which quote emails are batched.
+        SUBMISSIONS_*: SQLite store for quote requests.
+        SPAM_*: Bot and duplicate filter for the quote form.
+        PAGE_CACHE_*: Rendered-page cache for the static-content pages.
+        CACHE_CONTROL_*: Cache-Control values used by cache_policy.py.
+        ASSET_*: Content-hashed static URLs (see assets.py).
+        COMPRESS_*: gzip/Brotli compression of dynamic responses
+                    (see compression.py).
+        IMAGE_*: Responsive image derivatives (see images.py).
+        IMAGE_META_*, IMAGE_PLACEHOLDER_SIZE: Image size and placeholder
+                                              index (see image_meta.py).
+        GALLERY_PAGE_SIZE: Projects per gallery page / API response.
+        CONTENT_*: JSON content files and hot reload (see content.py).
+        JINJA_BYTECODE_CACHE*: Shared on-disk compiled-template cache.
+        TEMPLATE_WARMUP: Pre-render every page in create_app.
+        STARTUP_PROFILE: Log create_app phase timings.
+        FREEZE_DIR: Output of `flask freeze` (see freeze.py).
+        METRICS_*: Prometheus-style /metrics endpoint (see metrics.py).
+        LOG_*: Queued, optionally JSON and sampled logging
+               (see log_pipeline.py).
+        EARLY_HINTS: Preload Link headers / 103 Early Hints
+                     (see early_hints.py).
+        CRITICAL_CSS*: Inlined per-page critical CSS
+                       (see critical_css.py).
+        ASSET_AUDIT: Check static references at start-up: "warn",
+                     "fail" or "off" (see asset_audit.py).
+        SERVE_*: Pre-forking production server (see server.py).
     """
 
     # Pull secret key from environment variable; fall back to dev default.
@@ -32,9 +66,20 @@ class Config:
     # CSRF protection — enabled by default for all environments.
     WTF_CSRF_ENABLED = True
 
-    # Flask-Limiter: in-memory storage is fine for a single-process deploy.
-    # Switch to "redis://..." for multi-worker production setups.
+    # Flask-Limiter: in-memory storage is fine for a single-process deploy,
+    # but each worker then counts separately (N workers allow N x limit).
+    # ProductionConfig uses the shared SQLite backend from
+    # ratelimit_storage.py instead; "redis://..." also works where available.
     RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "memory://")
+    # "fixed-window" or "moving-window" (both supported by the SQLite store).
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "fixed-window")
+
+    # Number of reverse proxies in front of the app that append to
+    # X-Forwarded-For (1 for the nginx setup in freeze.py / server.py).
+    # 0 ignores the header: without a proxy clients could forge it, but
+    # behind one every request would come from 127.0.0.1 and share a
+    # single rate-limit bucket.
+    PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 0))
 
     # ------------------------------------------------------------------
     # Flask-Mail configuration
@@ -75,11 +120,276 @@ class Config:
     # When "false" (the default) the app logs the email instead.
     MAIL_ENABLED = os.environ.get("MAIL_ENABLED", "false").lower() == "true"
 
+    # Background delivery queue (see mail_queue.py).  When disabled,
+    # emails are sent inline on the request thread as before.
+    MAIL_QUEUE_ENABLED = (
+        os.environ.get("MAIL_QUEUE_ENABLED", "true").lower() == "true"
+    )
+    MAIL_QUEUE_WORKERS = int(os.environ.get("MAIL_QUEUE_WORKERS", 2))
+    MAIL_QUEUE_MAXSIZE = int(os.environ.get("MAIL_QUEUE_MAXSIZE", 100))
+    # Retries after the first attempt; delays are BACKOFF * 2**n seconds,
+    # capped at MAX_DELAY.
+    MAIL_QUEUE_MAX_RETRIES = int(os.environ.get("MAIL_QUEUE_MAX_RETRIES", 4))
+    MAIL_QUEUE_RETRY_BACKOFF = float(os.environ.get("MAIL_QUEUE_RETRY_BACKOFF", 2.0))
+    MAIL_QUEUE_RETRY_MAX_DELAY = float(
+        os.environ.get("MAIL_QUEUE_RETRY_MAX_DELAY", 60.0)
+    )
+
+    # Keep authenticated SMTP sessions open between messages (see
+    # smtp_pool.py).  Sessions idle longer than IDLE_TIMEOUT seconds are
+    # closed; those idle longer than HEALTH_CHECK_AFTER get a NOOP first.
+    MAIL_POOL_ENABLED = os.environ.get("MAIL_POOL_ENABLED", "true").lower() == "true"
+    MAIL_POOL_SIZE = int(os.environ.get("MAIL_POOL_SIZE", 2))
+    MAIL_POOL_IDLE_TIMEOUT = float(os.environ.get("MAIL_POOL_IDLE_TIMEOUT", 120))
+    MAIL_POOL_HEALTH_CHECK_AFTER = float(
+        os.environ.get("MAIL_POOL_HEALTH_CHECK_AFTER", 10)
+    )
+
+    # Digest mode: quote notifications arriving within this many seconds
+    # are folded into one email.  0 (the default) sends each one at once.
+    MAIL_DIGEST_WINDOW = float(os.environ.get("MAIL_DIGEST_WINDOW", 0))
+
+    # ------------------------------------------------------------------
+    # Quote submission store (see submissions.py)
+    # ------------------------------------------------------------------
+    # Every valid quote request is saved to SQLite so a failed email
+    # never loses a lead.  Rows are committed in batches by a background
+    # thread.  Inspect with "flask --app app submissions list".
+    # ------------------------------------------------------------------
+    SUBMISSIONS_ENABLED = (
+        os.environ.get("SUBMISSIONS_ENABLED", "true").lower() == "true"
+    )
+    # Default: instance/submissions.sqlite3
+    SUBMISSIONS_DB_PATH = os.environ.get("SUBMISSIONS_DB_PATH", "")
+    SUBMISSIONS_BATCH_SIZE = 50
+    SUBMISSIONS_FLUSH_INTERVAL = 0.5  # seconds
+    # Purge submissions older than this; 0 keeps them forever.
+    SUBMISSIONS_RETENTION_DAYS = int(os.environ.get("SUBMISSIONS_RETENTION_DAYS", 730))
+
+    # ------------------------------------------------------------------
+    # Quote-form spam filter (see spam_filter.py)
+    # ------------------------------------------------------------------
+    SPAM_FILTER_ENABLED = (
+        os.environ.get("SPAM_FILTER_ENABLED", "true").lower() == "true"
+    )
+    # Submissions faster than this after the form was rendered are bots.
+    SPAM_MIN_FILL_SECONDS = float(os.environ.get("SPAM_MIN_FILL_SECONDS", 3))
+    # Forms older than this (seconds) must be reloaded.
+    SPAM_MAX_FORM_AGE = int(os.environ.get("SPAM_MAX_FORM_AGE", 86400))
+    SPAM_SCORE_THRESHOLD = int(os.environ.get("SPAM_SCORE_THRESHOLD", 5))
+    # Identical messages are dropped for this long (seconds), per process.
+    SPAM_DEDUPE_TTL = int(os.environ.get("SPAM_DEDUPE_TTL", 3600))
+    SPAM_DEDUPE_MAX_ENTRIES = 1024
+
+    # ------------------------------------------------------------------
+    # Rendered-page cache
+    # ------------------------------------------------------------------
+    # Home, services and gallery only change on deploy, so their HTML is
+    # rendered once and reused.  The cache is cleared automatically when
+    # a template file changes.  PAGE_CACHE_TTL=0 means no time expiry.
+    # ------------------------------------------------------------------
+    PAGE_CACHE_ENABLED = (
+        os.environ.get("PAGE_CACHE_ENABLED", "true").lower() == "true"
+    )
+    PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 64))
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 3600))
+    # How often (seconds) to check templates for changes.
+    PAGE_CACHE_CHECK_INTERVAL = 2
+
+    # ------------------------------------------------------------------
+    # HTTP caching policy (see cache_policy.py for the endpoint table)
+    # ------------------------------------------------------------------
+    # Static files: one week in any cache.
+    CACHE_CONTROL_STATIC = "public, max-age=604800"
+    # Content-fingerprinted static URLs never change: cache for a year.
+    CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+    # Public HTML: kept briefly by the browser, then revalidated with
+    # the page's ETag (cheap 304).  "private" because the page embeds a
+    # per-session CSRF token.
+    CACHE_CONTROL_PAGES = "private, max-age=60, must-revalidate"
+    # Contact form, flash pages and errors: never stored.
+    CACHE_CONTROL_NO_STORE = "no-store, no-cache, must-revalidate, max-age=0"
+    # 404s for referenced-but-missing static files (see asset_audit.py).
+    CACHE_CONTROL_MISSING = "public, max-age=300"
+
+    # ------------------------------------------------------------------
+    # Static asset fingerprinting
+    # ------------------------------------------------------------------
+    # url_for('static', ...) emits content-hashed names such as
+    # css/styles.3f9a1c2b.css.  The manifest is cached on disk (default:
+    # instance/asset-manifest.json); prebuild it with
+    # "flask --app app assets manifest".
+    # ------------------------------------------------------------------
+    ASSET_FINGERPRINTING = (
+        os.environ.get("ASSET_FINGERPRINTING", "true").lower() == "true"
+    )
+    ASSET_MANIFEST_PATH = os.environ.get("ASSET_MANIFEST_PATH", "")
+    # Serve .gz/.br siblings written by "flask --app app assets compress"
+    # when the browser accepts them.
+    ASSET_PRECOMPRESSED = (
+        os.environ.get("ASSET_PRECOMPRESSED", "true").lower() == "true"
+    )
+
+    # ------------------------------------------------------------------
+    # Response compression
+    # ------------------------------------------------------------------
+    # Rendered pages and JSON of COMPRESS_MIN_SIZE bytes or more are sent
+    # with Brotli (quality COMPRESS_BR_LEVEL, if the Brotli package is
+    # installed) or gzip (COMPRESS_LEVEL).  Page-cached pages are
+    # compressed once and reused.  Every page-cached HTML page has at
+    # least the CSRF hole from base.html, and holes can only be spliced
+    # into gzip, so in practice those pages are sent as gzip and Brotli
+    # is used for the other responses (e.g. /api/gallery, error pages).
+    COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "true").lower() == "true"
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+    COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get("COMPRESS_BR_LEVEL", 4))
+
+    # ------------------------------------------------------------------
+    # Responsive image derivatives
+    # ------------------------------------------------------------------
+    # Generate with "flask --app app assets images" (requires Pillow).
+    # Until then templates fall back to the original static images.
+    # ------------------------------------------------------------------
+    IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", "")
+    IMAGE_WIDTHS = (320, 480, 640, 960, 1280, 1600)
+
+    # Intrinsic width/height, dominant colour and a blurred placeholder
+    # for every file in static/images, built at start-up and cached in
+    # IMAGE_META_PATH (default: instance/image-meta.json).  Placeholders
+    # are IMAGE_PLACEHOLDER_SIZE px on the long side and need Pillow.
+    IMAGE_META_ENABLED = (
+        os.environ.get("IMAGE_META_ENABLED", "true").lower() == "true"
+    )
+    IMAGE_META_PATH = os.environ.get("IMAGE_META_PATH", "")
+    IMAGE_PLACEHOLDER_SIZE = int(os.environ.get("IMAGE_PLACEHOLDER_SIZE", 16))
+
+    # ------------------------------------------------------------------
+    # Gallery pagination
+    # ------------------------------------------------------------------
+    # /gallery and /api/gallery serve this many projects per page; the
+    # gallery script fetches further pages as the visitor scrolls.
+    GALLERY_PAGE_SIZE = int(os.environ.get("GALLERY_PAGE_SIZE", 12))
+
+    # ------------------------------------------------------------------
+    # Site content
+    # ------------------------------------------------------------------
+    # Services, gallery projects/categories and testimonials are read
+    # from JSON files in CONTENT_DIR (default: content/ next to app.py).
+    # With CONTENT_RELOAD on, each worker re-reads them within
+    # CONTENT_CHECK_INTERVAL seconds of an edit — no restart needed.
+    CONTENT_DIR = os.environ.get("CONTENT_DIR", "")
+    CONTENT_RELOAD = os.environ.get("CONTENT_RELOAD", "true").lower() == "true"
+    CONTENT_CHECK_INTERVAL = float(os.environ.get("CONTENT_CHECK_INTERVAL", 2))
+
+    # ------------------------------------------------------------------
+    # Template compilation
+    # ------------------------------------------------------------------
+    # Compiled templates are cached on disk (default:
+    # instance/jinja-cache) and shared by every worker.  TEMPLATE_WARMUP
+    # compiles all templates and renders every page before create_app
+    # returns; it adds a little to startup, so it is opt-in.
+    JINJA_BYTECODE_CACHE = (
+        os.environ.get("JINJA_BYTECODE_CACHE", "true").lower() == "true"
+    )
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get("JINJA_BYTECODE_CACHE_DIR", "")
+    TEMPLATE_WARMUP = os.environ.get("TEMPLATE_WARMUP", "false").lower() == "true"
+
+    # Log how long each create_app phase took (see startup_profile.py;
+    # `flask startup profile` prints a fuller report on demand).
+    STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "false").lower() == "true"
+
+    # ------------------------------------------------------------------
+    # Static export
+    # ------------------------------------------------------------------
+    # `flask freeze` writes the public pages and assets here for nginx
+    # (default: instance/frozen).  Run it with FLASK_ENV=production so
+    # asset links are fingerprinted.
+    FREEZE_DIR = os.environ.get("FREEZE_DIR", "")
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    # Latency histograms and error counts at /metrics.  Each worker
+    # writes to its own file under METRICS_DIR (default
+    # instance/metrics) and the endpoint sums them.  Without
+    # METRICS_TOKEN only direct loopback clients may scrape (requests
+    # relayed by a reverse proxy are refused); with it, scrapers send
+    # "Authorization: Bearer <token>".  Set a token in production.
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_DIR = os.environ.get("METRICS_DIR", "")
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+    # ------------------------------------------------------------------
+    # Logging
+    # ------------------------------------------------------------------
+    # LOG_QUEUE moves stream I/O to a background thread.  LOG_FORMAT is
+    # "text" or "json" (one object per line with request_id and
+    # duration_ms).  LOG_SAMPLE_RATE keeps INFO/DEBUG lines for that
+    # fraction of requests; warnings and errors are always kept.
+    LOG_QUEUE = os.environ.get("LOG_QUEUE", "true").lower() == "true"
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+    LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+
+    # ------------------------------------------------------------------
+    # Early hints
+    # ------------------------------------------------------------------
+    # Send "Link: rel=preload" headers for each page's stylesheet, font
+    # origins and hero image (and a 103 response when the server can).
+    EARLY_HINTS = os.environ.get("EARLY_HINTS", "true").lower() == "true"
+
+    # ------------------------------------------------------------------
+    # Critical CSS
+    # ------------------------------------------------------------------
+    # Inline the rules each page needs above the fold and load the full
+    # stylesheet without blocking render.  Results are cached in
+    # CRITICAL_CSS_DIR (default instance/critical-css) and rebuilt when
+    # styles.css or the page's templates change; `flask assets critical`
+    # builds them ahead of time.  The fold is the layout plus the first
+    # CRITICAL_CSS_FOLD_SECTIONS <section>s of the page.
+    CRITICAL_CSS = os.environ.get("CRITICAL_CSS", "true").lower() == "true"
+    CRITICAL_CSS_DIR = os.environ.get("CRITICAL_CSS_DIR", "")
+    CRITICAL_CSS_FOLD_SECTIONS = int(os.environ.get("CRITICAL_CSS_FOLD_SECTIONS", 2))
+
+    # ------------------------------------------------------------------
+    # Static reference audit
+    # ------------------------------------------------------------------
+    # At start-up, check that every static file named by a template or
+    # content file exists.  "warn" logs each missing file and answers
+    # requests for it with a cached 404; "fail" refuses to start (for
+    # CI); "off" skips the check.  `flask assets audit` runs it on demand.
+    ASSET_AUDIT = os.environ.get("ASSET_AUDIT", "warn").lower()
+
+    # ------------------------------------------------------------------
+    # Production server (python server.py)
+    # ------------------------------------------------------------------
+    # The master preloads the app and forks SERVE_WORKERS processes (0 =
+    # one per CPU), each handling up to SERVE_THREADS requests at once.
+    # Idle keep-alive connections are closed after SERVE_KEEPALIVE
+    # seconds.  A worker is replaced after SERVE_MAX_REQUESTS requests
+    # (plus up to SERVE_MAX_REQUESTS_JITTER, so they don't all recycle
+    # together; 0 disables).  Stopping workers get SERVE_GRACEFUL_TIMEOUT
+    # seconds to finish.  SERVE_EARLY_HINTS sends 103 responses straight
+    # from the server (off by default: some HTTP clients mishandle them).
+    SERVE_BIND = os.environ.get("SERVE_BIND", "127.0.0.1:8000")
+    SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 0))
+    SERVE_THREADS = int(os.environ.get("SERVE_THREADS", 4))
+    SERVE_KEEPALIVE = float(os.environ.get("SERVE_KEEPALIVE", 5))
+    SERVE_MAX_REQUESTS = int(os.environ.get("SERVE_MAX_REQUESTS", 1000))
+    SERVE_MAX_REQUESTS_JITTER = int(os.environ.get("SERVE_MAX_REQUESTS_JITTER", 100))
+    SERVE_GRACEFUL_TIMEOUT = float(os.environ.get("SERVE_GRACEFUL_TIMEOUT", 30))
+    SERVE_EARLY_HINTS = (
+        os.environ.get("SERVE_EARLY_HINTS", "false").lower() == "true"
+    )
+
 
 class DevelopmentConfig(Config):
     """Development configuration with debug mode enabled."""
 
     DEBUG = True
+    PAGE_CACHE_ENABLED = False  # Always render fresh while editing.
+    # Plain URLs so edited CSS/JS is picked up without a restart.
+    ASSET_FINGERPRINTING = False
 
 
 class ProductionConfig(Config):
@@ -92,6 +402,13 @@ class ProductionConfig(Config):
 
     DEBUG = False
 
+    # Counters shared by every worker process via instance/ratelimit.sqlite3.
+    RATELIMIT_STORAGE_URI = os.environ.get(
+        "RATELIMIT_STORAGE_URI",
+        "sqlite:///" + os.path.join(BASE_DIR, "instance", "ratelimit.sqlite3"),
+    )
+    RATELIMIT_STRATEGY = os.environ.get("RATELIMIT_STRATEGY", "moving-window")
+
 
 class TestingConfig(Config):
     """Testing configuration with CSRF disabled for test runners."""
@@ -99,6 +416,10 @@ class TestingConfig(Config):
     TESTING = True
     WTF_CSRF_ENABLED = False  # Disable CSRF during automated tests.
     MAIL_ENABLED = False  # Never send real emails in tests.
+    PAGE_CACHE_ENABLED = False  # Each test renders its own pages.
+    SUBMISSIONS_ENABLED = False  # Don't write test data to the real DB.
+    METRICS_ENABLED = False  # Don't write metric files from tests.
+    SPAM_FILTER_ENABLED = False  # Tests post forms instantly.
 
 
 # Map environment names to configuration classes for easy lookup.
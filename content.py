@@ -0,0 +1,370 @@
+"""
+File-backed site content for the Ironforge Welding website.
+
+Services, gallery categories, projects and testimonials used to be
+hard-coded lists in the route modules, so every wording change needed a
+deploy and a worker restart.  They now live in JSON files under
+``content/`` (or ``CONTENT_DIR``):
+
+* Each file is loaded into immutable, tuple-backed records
+  (``namedtuple``), with lookups by id and per-category gallery pages
+  precomputed once per load.
+* Every ``CONTENT_CHECK_INTERVAL`` seconds the store compares the files'
+  mtimes and sizes with the loaded set and, if anything changed, builds
+  a complete new ``ContentSnapshot`` and swaps it in with a single
+  assignment.  A request pins the snapshot it first sees (on ``g``), so
+  it never mixes old and new data.  A file that fails to parse or
+  validate is logged and the previous snapshot stays in service.
+* Each successful load bumps ``version``; the page cache depends on it
+  so cached pages are dropped when the content changes.
+
+Every worker process checks the files on its own, so no restart or
+signal is needed after editing them.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import g, has_app_context
+
+# Module-level logger for the content store.
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------------
+# Field names match the keys in the JSON files and the attribute names
+# used by the templates.
+
+Service = namedtuple(
+    "Service",
+    "id title short_description long_description icon image image_alt",
+)
+Category = namedtuple("Category", "slug label")
+Project = namedtuple("Project", "id title category image image_alt description")
+Testimonial = namedtuple("Testimonial", "id name role quote rating")
+
+# File name -> record type, in load order.
+CONTENT_FILES = (
+    ("services.json", Service),
+    ("categories.json", Category),
+    ("projects.json", Project),
+    ("testimonials.json", Testimonial),
+)
+
+
+class ContentError(ValueError):
+    """A content file is missing, malformed or inconsistent."""
+
+
+# ---------------------------------------------------------------------------
+# Gallery index
+# ---------------------------------------------------------------------------
+
+
+class GalleryIndex:
+    """
+    Projects grouped by category, with cursor positions precomputed.
+
+    Args:
+        projects: Project records in display order.
+        categories: Category records; the ``all`` slug lists every project.
+    """
+
+    __slots__ = ("slugs", "by_category", "positions")
+
+    def __init__(self, projects, categories):
+        self.slugs = frozenset(cat.slug for cat in categories)
+        self.by_category = {
+            slug: tuple(p for p in projects if slug == "all" or p.category == slug)
+            for slug in self.slugs
+        }
+        # Cursor -> position within each category, for O(1) resumption.
+        self.positions = {
+            slug: {p.id: i for i, p in enumerate(items)}
+            for slug, items in self.by_category.items()
+        }
+
+    def page(self, category, cursor=None, limit=12):
+        """
+        Return one page of projects for a category.
+
+        Args:
+            category: A valid category slug.
+            cursor: Id of the first project to return; None for page one.
+            limit: Maximum projects per page.
+
+        Returns:
+            A tuple of (projects, next_cursor); ``next_cursor`` is None on
+            the last page.
+
+        Raises:
+            KeyError: If ``cursor`` is not a project in this category.
+        """
+        items = self.by_category[category]
+        start = self.positions[category][cursor] if cursor else 0
+        end = start + limit
+        next_cursor = items[end].id if end < len(items) else None
+        return items[start:end], next_cursor
+
+
+# ---------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------
+
+
+class ContentSnapshot:
+    """
+    One consistent, fully loaded set of site content.
+
+    Attributes:
+        version: Load counter; higher is newer.
+        services: Tuple of ``Service`` records in display order.
+        services_by_id: Dict of service id -> ``Service``.
+        categories: Tuple of ``Category`` records.
+        projects: Tuple of ``Project`` records in display order.
+        projects_by_id: Dict of project id -> ``Project``.
+        gallery: ``GalleryIndex`` over the projects.
+        testimonials: Tuple of ``Testimonial`` records.
+    """
+
+    __slots__ = (
+        "version",
+        "services",
+        "services_by_id",
+        "categories",
+        "projects",
+        "projects_by_id",
+        "gallery",
+        "testimonials",
+    )
+
+    def __init__(self, version, services, categories, projects, testimonials):
+        self.version = version
+        self.services = services
+        self.services_by_id = _index_by_id(services, "service")
+        self.categories = categories
+        self.projects = projects
+        self.projects_by_id = _index_by_id(projects, "project")
+        self.gallery = GalleryIndex(projects, categories)
+        self.testimonials = testimonials
+
+        unknown = {p.category for p in projects} - self.gallery.slugs
+        if unknown:
+            raise ContentError(
+                "projects.json uses unknown categories: %s" % ", ".join(sorted(unknown))
+            )
+        if "all" not in self.gallery.slugs:
+            raise ContentError("categories.json must include the 'all' category")
+
+
+def _index_by_id(records, kind):
+    """Return a dict of id -> record, rejecting duplicate ids."""
+    index = {}
+    for record in records:
+        if record.id in index:
+            raise ContentError("duplicate %s id '%s'" % (kind, record.id))
+        index[record.id] = record
+    return index
+
+
+def load_records(path, record_type):
+    """
+    Load one JSON file into a tuple of records.
+
+    Args:
+        path: Path of a JSON file holding a list of objects.
+        record_type: The namedtuple class for each object.
+
+    Returns:
+        A tuple of ``record_type`` instances.
+
+    Raises:
+        ContentError: If the file is malformed or an object has missing
+            or unexpected keys.
+    """
+    name = os.path.basename(path)
+    try:
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+    except (OSError, ValueError) as error:
+        raise ContentError("cannot load %s: %s" % (name, error)) from error
+
+    if not isinstance(items, list):
+        raise ContentError("%s must contain a JSON list" % name)
+    try:
+        return tuple(record_type(**item) for item in items)
+    except TypeError as error:
+        raise ContentError("bad record in %s: %s" % (name, error)) from error
+
+
+def load_snapshot(directory, version):
+    """
+    Load every content file into a new snapshot.
+
+    Args:
+        directory: Folder holding the JSON files.
+        version: Version number for the snapshot.
+
+    Raises:
+        ContentError: If any file is missing, malformed or inconsistent.
+    """
+    services, categories, projects, testimonials = (
+        load_records(os.path.join(directory, name), record_type)
+        for name, record_type in CONTENT_FILES
+    )
+    return ContentSnapshot(version, services, categories, projects, testimonials)
+
+
+def directory_signature(directory):
+    """
+    Return a cheap signature of the content files (name, mtime, size).
+
+    A missing file is recorded as ``None`` so its reappearance counts
+    as a change.
+    """
+    signature = []
+    for name, _record_type in CONTENT_FILES:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except OSError:
+            signature.append((name, None))
+            continue
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+
+class ContentStore:
+    """
+    Holds the current ``ContentSnapshot`` and reloads it on file changes.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.reload_enabled = True
+        self.check_interval = 2.0
+
+        self._snapshot = None
+        self._signature = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Load the content files named in the app config.
+
+        Args:
+            app: The Flask application instance.
+
+        Raises:
+            ContentError: If the content cannot be loaded at startup.
+        """
+        self.directory = app.config.get("CONTENT_DIR") or os.path.join(
+            app.root_path, "content"
+        )
+        self.reload_enabled = app.config.get("CONTENT_RELOAD", True)
+        self.check_interval = float(app.config.get("CONTENT_CHECK_INTERVAL", 2.0))
+
+        self._signature = directory_signature(self.directory)
+        self._snapshot = load_snapshot(self.directory, version=1)
+        self._next_check = time.monotonic() + self.check_interval
+
+        app.extensions["content"] = self
+        app.logger.info(
+            "Content loaded from %s: %d services, %d projects, %d testimonials.",
+            self.directory,
+            len(self._snapshot.services),
+            len(self._snapshot.projects),
+            len(self._snapshot.testimonials),
+        )
+
+    def snapshot(self):
+        """
+        Return the content snapshot for the current request.
+
+        The first call in a request (or app context) pins the snapshot
+        on ``g``; later calls in the same context return the same one
+        even if a reload happens in between.
+        """
+        if not has_app_context():
+            self._maybe_reload()
+            return self._snapshot
+        snapshot = g.get("content")
+        if snapshot is None:
+            self._maybe_reload()
+            snapshot = g.content = self._snapshot
+        return snapshot
+
+    def current_version(self):
+        """Return the latest content version (a page cache version source)."""
+        self._maybe_reload()
+        return self._snapshot.version
+
+    def last_modified(self):
+        """Return the newest mtime (epoch seconds) of the loaded content files."""
+        mtimes = [entry[1] for entry in self._signature or () if len(entry) == 3]
+        return max(mtimes) / 1e9 if mtimes else None
+
+    def _maybe_reload(self):
+        """Reload the files if they changed, at most once per interval."""
+        if not self.reload_enabled:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        # Another thread already checking: keep serving the current data.
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            signature = directory_signature(self.directory)
+            if signature != self._signature:
+                self.reload(signature)
+        finally:
+            self._reload_lock.release()
+
+    def reload(self, signature=None):
+        """
+        Load a new snapshot and swap it in, keeping the old one on error.
+
+        Args:
+            signature: The directory signature the load corresponds to;
+                       computed if None.
+
+        Returns:
+            True if new content was loaded.
+        """
+        if signature is None:
+            signature = directory_signature(self.directory)
+        # Record the signature even on failure so a broken file is
+        # reported once, not on every check.
+        self._signature = signature
+        try:
+            snapshot = load_snapshot(self.directory, self._snapshot.version + 1)
+        except ContentError as error:
+            logger.error(
+                "Content reload failed (%s); keeping version %d.",
+                error,
+                self._snapshot.version,
+            )
+            return False
+        # A single reference assignment: readers see the old snapshot or
+        # the new one, never a mix.
+        self._snapshot = snapshot
+        logger.info("Content reloaded (version %d).", snapshot.version)
+        return True
@@ -0,0 +1,464 @@
+"""
+Per-page critical CSS, inlined into ``<head>``.
+
+``styles.css`` is one render-blocking stylesheet shared by every page.
+For each page template this module works out which rules can apply to
+the part of the page that is visible on load and inlines just those;
+``base.html`` then loads the full stylesheet without blocking
+rendering (``media="print"``, switched to ``all`` by ``main.js``, with
+a ``<noscript>`` fallback).
+
+Above the fold is taken to be the layout (navigation and flash
+messages, everything in ``base.html`` before ``</main>``) plus the
+first ``CRITICAL_CSS_FOLD_SECTIONS`` top-level ``<section>`` elements
+of the page's ``content`` block — the hero and whatever follows it.
+The element names, classes, ids and attributes used there are read
+from the template source, so classes in ``{% if %}`` branches count,
+and a rule is kept when every part of one of its selectors can match
+(pseudo-classes are ignored, so ``:hover`` states come along).
+``@media`` blocks are filtered the same way; ``@font-face`` and any
+``@keyframes`` used by a kept rule are kept too.
+
+Results are cached in ``instance/critical-css/`` (or
+``CRITICAL_CSS_DIR``) under a hash of the stylesheet and the page's
+template sources, so they are regenerated only when one of those
+changes, and every worker shares them.  ``flask assets critical``
+builds them ahead of time.
+"""
+
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import threading
+import time
+
+import click
+from flask import current_app
+from jinja2 import pass_context
+from markupsafe import Markup
+
+from assets import assets_cli
+
+logger = logging.getLogger(__name__)
+
+# Stylesheet the critical subset is taken from (relative to static/).
+STYLESHEET = "css/styles.css"
+
+# Bump to invalidate every cached file when the extraction changes.
+EXTRACTOR_VERSION = "1"
+
+# At-rules whose blocks contain ordinary rules to filter.
+GROUPING_AT_RULES = ("@media", "@supports", "@layer", "@container")
+
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+JINJA_RE = re.compile(r"\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}", re.S)
+EXTENDS_RE = re.compile(r"\{%-?\s*extends\s+['\"]([^'\"]+)['\"]")
+CONTENT_BLOCK_RE = re.compile(
+    r"\{%-?\s*block\s+content\s*-?%\}(.*?)\{%-?\s*endblock(?:\s+content)?\s*-?%\}", re.S
+)
+TAG_RE = re.compile(r"<([a-zA-Z][\w-]*)([^>]*)>", re.S)
+ATTR_RE = re.compile(r"([\w:-]+)(?:\s*=\s*(\"[^\"]*\"|'[^']*'))?")
+PSEUDO_RE = re.compile(r"::?[\w-]+(?:\([^)]*\))?")
+SIMPLE_RE = re.compile(r"^([\w-]+|\*)|\.([\w-]+)|#([\w-]+)|\[([\w-]+)[^\]]*\]")
+URL_RE = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+ANIMATION_RE = re.compile(r"animation(?:-name)?\s*:([^;]+)")
+
+
+# ---------------------------------------------------------------------------
+# CSS parsing
+# ---------------------------------------------------------------------------
+
+
+def _skip_string(text, pos):
+    """Return the index just past the string literal starting at ``pos``."""
+    quote = text[pos]
+    pos += 1
+    while pos < len(text) and text[pos] != quote:
+        pos += 2 if text[pos] == "\\" else 1
+    return pos + 1
+
+
+def parse_css(text, pos=0):
+    """
+    Parse a stylesheet into a flat tree of rules.
+
+    Args:
+        text: CSS source with comments already removed.
+        pos: Where to start (used for nested blocks).
+
+    Returns:
+        A tuple of (items, end position).  Items are
+        ``("rule", selector, declarations)``,
+        ``("group", prelude, children)`` for ``@media`` and friends,
+        ``("block", prelude, body)`` for other at-rules with a block,
+        and ``("statement", text)`` for ``@import``-style statements.
+    """
+    items = []
+    length = len(text)
+    while pos < length:
+        while pos < length and text[pos].isspace():
+            pos += 1
+        if pos >= length:
+            break
+        if text[pos] == "}":
+            return items, pos + 1
+
+        start = pos
+        while pos < length and text[pos] not in "{;}":
+            pos = _skip_string(text, pos) if text[pos] in "\"'" else pos + 1
+        prelude = " ".join(text[start:pos].split())
+        if pos >= length or text[pos] == "}":
+            continue
+        if text[pos] == ";":
+            items.append(("statement", prelude))
+            pos += 1
+            continue
+
+        pos += 1  # Past "{".
+        if prelude.lower().startswith(GROUPING_AT_RULES):
+            children, pos = parse_css(text, pos)
+            items.append(("group", prelude, children))
+            continue
+
+        body_start, depth = pos, 1
+        while pos < length and depth:
+            if text[pos] in "\"'":
+                pos = _skip_string(text, pos)
+                continue
+            depth += {"{": 1, "}": -1}.get(text[pos], 0)
+            pos += 1
+        body = text[body_start:pos - 1]
+        items.append(("block" if prelude.startswith("@") else "rule", prelude, body))
+    return items, pos
+
+
+def _split_top_level(text, separator=","):
+    """Split on ``separator`` outside parentheses and brackets."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _minify_declarations(body):
+    """Collapse whitespace in a declaration block."""
+    body = " ".join(body.split())
+    body = re.sub(r"\s*;\s*", ";", body)
+    body = re.sub(r"\s*([{}])\s*", r"\1", body)
+    body = re.sub(r"(^|;)\s*([\w-]+)\s*:\s*", r"\1\2:", body)
+    return body.strip(";")
+
+
+# ---------------------------------------------------------------------------
+# Above-the-fold markup
+# ---------------------------------------------------------------------------
+
+
+class FoldTokens:
+    """
+    Element names, classes, ids and attributes used above the fold.
+
+    Class values built from template expressions (``flash-{{ c }}``)
+    are kept as prefixes that match any class starting with them.
+    """
+
+    def __init__(self, source):
+        self.tags = {"html", "body", "*"}
+        self.classes = set()
+        self.class_prefixes = set()
+        self.ids = set()
+        self.attributes = set()
+
+        for tag, attrs in TAG_RE.findall(source):
+            self.tags.add(tag.lower())
+            for name, value in ATTR_RE.findall(attrs):
+                name = name.lower()
+                self.attributes.add(name)
+                value = JINJA_RE.sub("\x00", value[1:-1] if value else "")
+                if name == "class":
+                    for token in value.split():
+                        if "\x00" in token:
+                            prefix = token.split("\x00", 1)[0]
+                            if prefix:
+                                self.class_prefixes.add(prefix)
+                        else:
+                            self.classes.add(token)
+                elif name == "id" and "\x00" not in value:
+                    self.ids.add(value.strip())
+
+    def has_class(self, name):
+        return name in self.classes or any(name.startswith(p) for p in self.class_prefixes)
+
+    def compound_matches(self, compound):
+        """True if every simple selector in ``compound`` can match."""
+        compound = PSEUDO_RE.sub("", compound)
+        for tag, cls, ident, attr in SIMPLE_RE.findall(compound):
+            if tag and tag.lower() not in self.tags:
+                return False
+            if cls and not self.has_class(cls):
+                return False
+            if ident and ident not in self.ids:
+                return False
+            if attr and attr.lower() not in self.attributes:
+                return False
+        return True
+
+    def selector_matches(self, selector):
+        """True if every compound of a complex selector can match."""
+        compounds = re.split(r"\s*[>+~]\s*|\s+", selector.strip())
+        return all(self.compound_matches(c) for c in compounds if c)
+
+
+def fold_source(chain, sections):
+    """
+    Return the above-the-fold template source for a template chain.
+
+    Args:
+        chain: Template sources, the page first and its outermost
+               layout last.
+        sections: How many top-level ``<section>`` elements of each
+                  content block count as above the fold.
+    """
+    layout = chain[-1]
+    layout = layout.split("</main>", 1)[0]
+    parts = [CONTENT_BLOCK_RE.sub("", layout)]
+    for source in chain[:-1]:
+        match = CONTENT_BLOCK_RE.search(source)
+        if not match:
+            continue
+        content = match.group(1)
+        ends = [m.end() for m in re.finditer(r"</section\s*>", content)]
+        if len(ends) >= sections:
+            content = content[: ends[sections - 1]]
+        parts.append(content)
+    return "\n".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Extraction
+# ---------------------------------------------------------------------------
+
+
+def extract_critical(css, tokens, stylesheet_url="/static/css/"):
+    """
+    Return the subset of ``css`` that can apply to the fold, minified.
+
+    Args:
+        css: Full stylesheet source.
+        tokens: A :class:`FoldTokens`.
+        stylesheet_url: URL directory of the stylesheet, used to make
+                        relative ``url()`` references absolute (the
+                        CSS moves into the page).
+    """
+    items, _end = parse_css(COMMENT_RE.sub("", css))
+
+    def absolute(match):
+        quote, url = match.group(1), match.group(2)
+        if url.startswith(("data:", "/", "http:", "https:", "#")):
+            return match.group(0)
+        return "url(%s%s%s)" % (quote, posixpath.normpath(stylesheet_url + url), quote)
+
+    def select(items):
+        out = []
+        for item in items:
+            kind = item[0]
+            if kind == "statement":
+                out.append(item[1] + ";")
+            elif kind == "rule":
+                selectors = [s for s in _split_top_level(item[1]) if tokens.selector_matches(s)]
+                if selectors:
+                    out.append("%s{%s}" % (",".join(selectors), _minify_declarations(item[2])))
+            elif kind == "group":
+                children = select(item[2])
+                if children:
+                    out.append("%s{%s}" % (item[1], "".join(children)))
+            elif item[1].lower().startswith("@font-face"):
+                out.append("%s{%s}" % (item[1], _minify_declarations(item[2])))
+            elif item[1].lower().startswith("@keyframes"):
+                keyframes.append(item)
+        return out
+
+    keyframes = []
+    selected = select(items)
+    used = set()
+    for match in ANIMATION_RE.finditer("".join(selected)):
+        used.update(re.findall(r"[\w-]+", match.group(1)))
+    for _kind, prelude, body in keyframes:
+        if prelude.split(None, 1)[-1] in used:
+            selected.append("%s{%s}" % (prelude, " ".join(body.split())))
+    return URL_RE.sub(absolute, "".join(selected))
+
+
+class CriticalCSS:
+    """
+    Builds, caches and serves per-template critical CSS.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`, which adds the ``critical_css()`` template global.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.app = None
+        self.directory = None
+        self.sections = 2
+        self._cache = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the template global and the ``flask assets critical`` command.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        self.enabled = app.config.get("CRITICAL_CSS", True)
+        self.directory = app.config.get("CRITICAL_CSS_DIR") or os.path.join(
+            app.instance_path, "critical-css"
+        )
+        self.sections = max(1, int(app.config.get("CRITICAL_CSS_FOLD_SECTIONS", 2)))
+        app.extensions["critical_css"] = self
+        app.add_template_global(self.template_global, "critical_css")
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            app.logger.info("Critical CSS inlining ENABLED (cache in %s).", self.directory)
+
+    def _chain(self, name):
+        """Return [(source, filename)] for ``name`` and every template it extends."""
+        env = self.app.jinja_env
+        chain = []
+        while name:
+            source, filename, _uptodate = env.loader.get_source(env, name)
+            chain.append((source, filename))
+            parent = EXTENDS_RE.search(source)
+            name = parent.group(1) if parent else None
+        return chain
+
+    def _signature(self, chain):
+        """Stat signature of the stylesheet and templates (for debug mode)."""
+        paths = [os.path.join(self.app.static_folder, STYLESHEET)]
+        paths += [filename for _source, filename in chain]
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def for_template(self, name):
+        """
+        Return the critical CSS for template ``name``, building it if needed.
+
+        Args:
+            name: Template name, e.g. ``"home.html"``.
+        """
+        cached = self._cache.get(name)
+        # Templates and CSS only change on deploy outside debug mode, so
+        # the in-process copy is trusted; in debug mode edits are noticed.
+        if cached is not None and not self.app.debug:
+            return cached[1]
+        chain = self._chain(name)
+        signature = self._signature(chain) if self.app.debug else None
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(os.path.join(self.app.static_folder, STYLESHEET), "rb") as f:
+            css = f.read()
+        digest = hashlib.sha1(EXTRACTOR_VERSION.encode() + str(self.sections).encode())
+        digest.update(css)
+        for source, _filename in chain:
+            digest.update(b"\0" + source.encode("utf-8"))
+        path = os.path.join(
+            self.directory,
+            "%s.%s.css" % (name.replace("/", "_"), digest.hexdigest()[:16]),
+        )
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                critical = f.read()
+        except OSError:
+            started = time.perf_counter()
+            tokens = FoldTokens(fold_source([source for source, _f in chain], self.sections))
+            directory = posixpath.dirname(STYLESHEET)
+            critical = extract_critical(
+                css.decode("utf-8"),
+                tokens,
+                "%s/%s/" % (self.app.static_url_path, directory),
+            )
+            self._write(path, name, critical)
+            logger.info(
+                "Critical CSS for %s: %d of %d bytes (%.0f ms).",
+                name,
+                len(critical),
+                len(css),
+                (time.perf_counter() - started) * 1000,
+            )
+
+        self._cache[name] = (signature, critical)
+        return critical
+
+    def _write(self, path, name, critical):
+        """Write atomically and remove older files for the same template."""
+        prefix = os.path.basename(path).rsplit(".", 2)[0] + "."
+        # Written from request threads, which may race on the same page.
+        tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(critical)
+        os.replace(tmp_path, path)
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(".css") and entry != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+        logger.debug("Wrote critical CSS for %s to %s.", name, path)
+
+    @pass_context
+    def template_global(self, context):
+        """
+        ``critical_css()`` in templates: the current page's critical CSS.
+
+        Returns an empty string when disabled or if extraction fails, in
+        which case ``base.html`` links the stylesheet normally.
+        """
+        if not self.enabled or not context.name:
+            return ""
+        try:
+            critical = self.for_template(context.name)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Critical CSS extraction failed for %s.", context.name)
+            return ""
+        # Nothing in CSS needs "</"; escaping it keeps </style> out.
+        return Markup(critical.replace("</", "<\\/"))
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@assets_cli.command("critical")
+def critical_command():
+    """Build the critical CSS for every page template."""
+    critical = current_app.extensions["critical_css"]
+    env = current_app.jinja_env
+    built = 0
+    for name in env.list_templates(extensions=("html",)):
+        source, _filename, _uptodate = env.loader.get_source(env, name)
+        if not EXTENDS_RE.search(source):
+            continue  # Layouts are not pages.
+        css = critical.for_template(name)
+        click.echo("  %-24s %6d bytes" % (name, len(css)))
+        built += 1
+    click.echo("Critical CSS ready for %d templates in %s." % (built, critical.directory))
@@ -0,0 +1,272 @@
+"""
+Preload ``Link`` headers and 103 Early Hints for critical assets.
+
+The critical sub-resources of a page are read from its template source
+(and the templates it extends), so the list follows the markup instead
+of being maintained by hand:
+
+* ``<link rel="stylesheet">`` — the site stylesheet and the Google
+  Fonts CSS (``rel=preload; as=style``);
+* ``<link rel="preconnect">`` — the font origins (``rel=preconnect``);
+* the first ``<video poster>`` or ``<img src>`` pointing at a static
+  file — the hero poster / above-the-fold image (``as=image``);
+* any ``<link rel="preload">`` written in the template.
+
+HTML comments and ``{# #}`` blocks are ignored, static references go
+through ``url_for`` (so they carry the fingerprinted URL), and files
+missing from ``static/`` are left out rather than preloaded into a 404.
+
+Which template an endpoint renders is learned from Flask's
+``before_render_template`` signal the first time it renders a ``200``
+page (warm-up does this for every page at start-up).  From then on
+every ``200`` HTML response from that endpoint carries the ``Link``
+header, including page-cache hits, and proxies/CDNs that turn
+``Link: rel=preload`` into ``103 Early Hints`` (e.g. Cloudflare, nginx
+``early_hints``) can do so.
+
+When the WSGI server offers an early-hints callable in the environ
+(``wsgi.early_hints``) the same links are also sent as an interim
+``103`` response before the view runs.  Results are cached per process,
+except in debug mode where edited templates are re-read.
+"""
+
+import os
+import re
+
+from flask import before_render_template, g, has_request_context, request, url_for
+
+# Environ key of the server's early-hints callable.  It is called with a
+# list of (header name, value) tuples.
+EARLY_HINTS_ENVIRON_KEY = "wsgi.early_hints"
+
+COMMENT_RE = re.compile(r"<!--.*?-->|\{#.*?#\}", re.S)
+EXTENDS_RE = re.compile(r"\{%-?\s*extends\s+['\"]([^'\"]+)['\"]")
+TAG_RE = re.compile(r"<(link|video|img)\b((?:[^>{]|\{\{.*?\}\}|\{%.*?%\})*)>", re.S | re.I)
+ATTR_RE = re.compile(r"([\w-]+)(?:\s*=\s*(\"[^\"]*\"|'[^']*'))?", re.S)
+STATIC_URL_RE = re.compile(
+    r"^\{\{\s*url_for\(\s*['\"]static['\"]\s*,\s*filename\s*=\s*['\"]([^'\"]+)['\"]\s*\)\s*\}\}$"
+)
+
+
+class Hint:
+    """
+    One critical resource found in a template.
+
+    Args:
+        rel: ``"preload"`` or ``"preconnect"``.
+        target: Absolute URL, or a static filename when ``static`` is set.
+        static: True if ``target`` is a file under ``static/``.
+        as_: Preload destination (``style``, ``image``, ``font``...).
+        crossorigin: Add the ``crossorigin`` parameter.
+    """
+
+    __slots__ = ("rel", "target", "static", "as_", "crossorigin")
+
+    def __init__(self, rel, target, static=False, as_=None, crossorigin=False):
+        self.rel = rel
+        self.target = target
+        self.static = static
+        self.as_ = as_
+        self.crossorigin = crossorigin
+
+    def __repr__(self):
+        return "<Hint %s %s%s>" % (self.rel, self.target, " as=%s" % self.as_ if self.as_ else "")
+
+
+def _attributes(text):
+    """Return a tag's attributes as a dict (valueless ones map to "")."""
+    attrs = {}
+    # Hide template expressions so their contents aren't read as attributes.
+    expressions = []
+
+    def stash(match):
+        expressions.append(match.group(0))
+        return "\x00%d\x00" % (len(expressions) - 1)
+
+    text = re.sub(r"\{\{.*?\}\}|\{%.*?%\}", stash, text, flags=re.S)
+    for name, value in ATTR_RE.findall(text):
+        value = value[1:-1] if value else ""
+        attrs[name.lower()] = re.sub(
+            "\x00(\\d+)\x00", lambda m: expressions[int(m.group(1))], value
+        )
+    return attrs
+
+
+def _target(value):
+    """Return (target, is_static) for an attribute value, or None if dynamic."""
+    value = value.strip()
+    match = STATIC_URL_RE.match(value)
+    if match:
+        return match.group(1), True
+    if value.startswith(("https://", "http://", "//")) and "{" not in value:
+        return value, False
+    return None
+
+
+def scan_source(source):
+    """
+    Find the critical resources in one template's source.
+
+    Args:
+        source: Template source text.
+
+    Returns:
+        A tuple of (parent template name or None, list of :class:`Hint`).
+    """
+    source = COMMENT_RE.sub("", source)
+    parent = EXTENDS_RE.search(source)
+    hints = []
+    have_image = False
+    for tag, body in TAG_RE.findall(source):
+        attrs = _attributes(body)
+        tag = tag.lower()
+        if tag == "link":
+            rel = attrs.get("rel", "").lower().split()
+            found = _target(attrs.get("href", ""))
+            if not found:
+                continue
+            target, static = found
+            crossorigin = "crossorigin" in attrs
+            if "stylesheet" in rel:
+                hints.append(Hint("preload", target, static, "style", crossorigin))
+            elif "preconnect" in rel:
+                hints.append(Hint("preconnect", target, static, None, crossorigin))
+            elif "preload" in rel:
+                hints.append(Hint("preload", target, static, attrs.get("as"), crossorigin))
+        elif not have_image:
+            found = _target(attrs.get("poster" if tag == "video" else "src", ""))
+            if found:
+                hints.append(Hint("preload", found[0], found[1], "image"))
+                have_image = True
+    return (parent.group(1) if parent else None), hints
+
+
+class EarlyHints:
+    """
+    Adds preload ``Link`` headers (and 103 Early Hints) per endpoint.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.app = None
+        self.endpoint_templates = {}
+        self._template_hints = {}
+        self._links = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Register the signal receiver and request hooks.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        self.enabled = app.config.get("EARLY_HINTS", True)
+        app.extensions["early_hints"] = self
+        if not self.enabled:
+            return
+
+        before_render_template.connect(self._remember_template, app)
+        app.before_request(self._send_early_hints)
+        app.after_request(self._add_link_header)
+        app.logger.info("Preload Link headers / 103 Early Hints ENABLED.")
+
+    # ------------------------------------------------------------------
+    # Template analysis
+    # ------------------------------------------------------------------
+
+    def template_hints(self, name):
+        """
+        Return the critical resources of ``name`` and the templates it extends.
+
+        The outermost layout comes first, matching document order.
+        """
+        hints = self._template_hints.get(name)
+        if hints is None:
+            source, _filename, _uptodate = self.app.jinja_env.loader.get_source(
+                self.app.jinja_env, name
+            )
+            parent, own = scan_source(source)
+            inherited = self.template_hints(parent) if parent else []
+            if any(h.as_ == "image" for h in inherited):
+                own = [h for h in own if h.as_ != "image"]
+            # The same file may be linked twice (e.g. the async and
+            # <noscript> stylesheet links); hint it once.
+            seen = set()
+            hints = []
+            for hint in inherited + own:
+                if (hint.rel, hint.target) not in seen:
+                    seen.add((hint.rel, hint.target))
+                    hints.append(hint)
+            if not self.app.debug:
+                self._template_hints[name] = hints
+        return hints
+
+    def links(self, name):
+        """
+        Return the ``Link`` header values for template ``name``.
+
+        Static targets are resolved with ``url_for`` (fingerprinted URLs)
+        and dropped if the file does not exist.  Needs a request context.
+        """
+        links = self._links.get(name)
+        if links is None:
+            links = []
+            for hint in self.template_hints(name):
+                if hint.static:
+                    if not os.path.isfile(os.path.join(self.app.static_folder, hint.target)):
+                        continue
+                    url = url_for("static", filename=hint.target)
+                else:
+                    url = hint.target
+                value = "<%s>; rel=%s" % (url, hint.rel)
+                if hint.as_:
+                    value += "; as=%s" % hint.as_
+                if hint.crossorigin:
+                    value += "; crossorigin"
+                links.append(value)
+            if not self.app.debug:
+                self._links[name] = links
+        return links
+
+    # ------------------------------------------------------------------
+    # Hooks
+    # ------------------------------------------------------------------
+
+    def _remember_template(self, _app, template, **_extra):
+        """Note the first (outermost) template rendered for this request."""
+        if has_request_context() and "early_hints_template" not in g:
+            g.early_hints_template = template.name
+
+    def _send_early_hints(self):
+        """Send a 103 response when the server supports it."""
+        send = request.environ.get(EARLY_HINTS_ENVIRON_KEY)
+        name = self.endpoint_templates.get(request.endpoint)
+        if send is None or name is None or request.method != "GET":
+            return
+        links = self.links(name)
+        if links:
+            send([("Link", value) for value in links])
+
+    def _add_link_header(self, response):
+        """Add ``Link`` preload headers to successful HTML responses."""
+        if response.status_code != 200 or response.mimetype != "text/html":
+            return response
+        # Learn the mapping from a successful render only, so an error
+        # page (e.g. a 429) is never taken for the endpoint's template.
+        name = self.endpoint_templates.get(request.endpoint)
+        if name is None:
+            name = g.get("early_hints_template")
+            if name is None or request.endpoint is None:
+                return response
+            self.endpoint_templates[request.endpoint] = name
+        links = self.links(name)
+        if links:
+            response.headers["Link"] = ", ".join(links)
+        return response
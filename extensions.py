@@ -9,9 +9,26 @@ extension objects (e.g. the rate limiter decorator or the mail instance).
 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_mail import Mail
 from flask_wtf.csrf import CSRFProtect
 
+import ratelimit_storage  # noqa: F401  (registers the sqlite:// scheme)
+from asset_audit import AssetAudit
+from assets import AssetManifest
+from compression import Compression
+from content import ContentStore
+from critical_css import CriticalCSS
+from early_hints import EarlyHints
+from image_meta import ImageMetadata
+from images import ResponsiveImages
+from lazy import LazyExtension
+from mail_digest import MailDigest
+from mail_queue import MailQueue
+from metrics import Metrics
+from page_cache import PageCache
+from smtp_pool import SMTPPool
+from spam_filter import SpamFilter
+from submissions import SubmissionStore
+
 # CSRF protection — guards all POST forms against cross-site request forgery.
 csrf = CSRFProtect()
 
@@ -23,5 +40,53 @@ limiter = Limiter(
 )
 
 # Flask-Mail — used to send quote-request notification emails.
-# Initialised without an app; call mail.init_app(app) in the factory.
-mail = Mail()
+# Lazy: flask_mail is only imported when create_app initialises it,
+# which it does only when MAIL_ENABLED is true.
+mail = LazyExtension("flask_mail", "Mail")
+
+# Pooled SMTP sessions — reused across messages by the mail queue.
+smtp_pool = SMTPPool(mail)
+
+# Background delivery queue — sends quote emails off the request thread.
+mail_queue = MailQueue(mail)
+
+# Optional digest mode — folds bursts of quote notifications into one email.
+mail_digest = MailDigest(mail_queue)
+
+# Honeypot, fill-time and duplicate checks in front of the quote pipeline.
+spam_filter = SpamFilter()
+
+# Site content (services, projects, testimonials) loaded from content/*.json
+# and reloaded when the files change.
+content_store = ContentStore()
+
+# Request/template/email latency histograms served at /metrics.
+metrics = Metrics()
+
+# Rendered-page cache — serves the static-content pages without
+# re-rendering them.  Call page_cache.init_app(app) after csrf.init_app.
+page_cache = PageCache()
+
+# Static asset manifest — fingerprints url_for('static', ...) URLs.
+asset_manifest = AssetManifest()
+
+# Preload Link headers / 103 Early Hints for each page's critical assets.
+early_hints = EarlyHints()
+
+# Start-up audit of static references; cheap 404s for missing files.
+asset_audit = AssetAudit()
+
+# Per-page critical CSS inlined into <head> (the critical_css() helper).
+critical_css = CriticalCSS()
+
+# gzip/Brotli compression of rendered pages and JSON responses.
+compression = Compression()
+
+# Responsive images — serves resized derivatives and the srcset helper.
+responsive_images = ResponsiveImages()
+
+# Intrinsic sizes and blurred placeholders for static images (image_meta()).
+image_meta = ImageMetadata()
+
+# Quote submission store — SQLite with batched (write-behind) commits.
+submission_store = SubmissionStore()
@@ -0,0 +1,364 @@
+"""
+Static export ("freeze") of the non-interactive pages.
+
+Home, services and the gallery are pure functions of the content files,
+so ``flask freeze`` renders them once into a directory that nginx can
+serve with no Python on the hot path:
+
+* every argument-free GET page (``/`` -> ``index.html``,
+  ``/services`` -> ``services/index.html``, ...);
+* each gallery category and page
+  (``/gallery?category=repair&cursor=proj-13`` ->
+  ``gallery/category/repair/proj-13.html``) and the matching
+  ``/api/gallery`` JSON pages, so filtering and infinite scroll keep
+  working;
+* the 404, 429 and 500 error pages;
+* the static files under their fingerprinted names (with any
+  precompressed ``.gz``/``.br`` siblings, for ``gzip_static`` /
+  ``brotli_static``) and the ``/img/`` derivatives, with ``.webp`` /
+  ``.avif`` alternatives next to each JPEG;
+* ``nginx.conf.example``, mapping the URLs above onto the files.
+
+The contact page stays dynamic: its form needs a per-visitor CSRF
+token, and nginx should proxy ``/contact`` to the app.
+
+Rebuilds are incremental.  ``.freeze-manifest.json`` in the output
+directory records a content hash for every rendered file and the
+source size/mtime for every copied one; unchanged files are not
+rewritten, and files no longer produced are deleted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import click
+from flask import current_app, g, render_template
+from flask.cli import with_appcontext
+
+from images import DERIVATIVE_FORMATS, derivative_name, url_name
+from page_cache import CSRF_PLACEHOLDER
+
+# Name of the incremental-build manifest inside the output directory.
+MANIFEST_NAME = ".freeze-manifest.json"
+
+# Endpoints that are not frozen as plain pages.  The gallery and its
+# API are expanded per category/cursor below; the rest stay dynamic or
+# are exported as files.
+SKIP_ENDPOINTS = {
+    "static",
+    "image_derivative",
+    "metrics",
+    "contact.contact",
+    "contact.contact_submit",
+    "gallery.gallery",
+    "gallery.gallery_api",
+}
+
+NGINX_EXAMPLE = """\
+# Example nginx server block for a frozen export.
+# root points at the export directory; /contact goes to the app,
+# which must run with PROXY_FIX_X_FOR=1 so it sees the visitor's
+# address from X-Forwarded-For (rate limits, stored submissions).
+
+map $http_accept $img_suffix {
+    default "";
+    "~image/avif" ".avif";
+    "~image/webp" ".webp";
+}
+
+server {
+    root /path/to/export;
+    error_page 404 /404.html;
+    error_page 429 /429.html;
+    error_page 500 502 503 /500.html;
+
+    gzip_static on;
+    # brotli_static on;   # with ngx_brotli
+
+    location /static/ {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+    location /img/ {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        add_header Vary Accept;
+        try_files $uri$img_suffix $uri =404;
+    }
+    location = /gallery {
+        set $page /gallery/index.html;
+        if ($arg_category) { set $page /gallery/category/$arg_category.html; }
+        if ($arg_cursor) { set $page /gallery/category/$arg_category/$arg_cursor.html; }
+        try_files $page /gallery/index.html;
+    }
+    location = /api/gallery {
+        default_type application/json;
+        set $page /api/gallery/index.json;
+        if ($arg_category) { set $page /api/gallery/$arg_category.json; }
+        if ($arg_cursor) { set $page /api/gallery/$arg_category/$arg_cursor.json; }
+        try_files $page =404;
+    }
+    location /contact {
+        proxy_pass http://127.0.0.1:8000;
+        proxy_set_header Host $host;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    }
+    location / {
+        try_files $uri $uri/index.html =404;
+    }
+}
+"""
+
+
+class Freezer:
+    """
+    Writes a static export incrementally.
+
+    Args:
+        app: The Flask application to render.
+        output: Export directory.
+        force: Rewrite every file even if it looks unchanged.
+    """
+
+    def __init__(self, app, output, force=False):
+        self.app = app
+        self.output = output
+        self.force = force
+        self.previous = {}
+        self.manifest = {}
+        self.written = 0
+        self.unchanged = 0
+
+        try:
+            with open(os.path.join(output, MANIFEST_NAME), encoding="utf-8") as f:
+                self.previous = json.load(f)
+        except (OSError, ValueError):
+            self.previous = {}
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def write(self, relpath, data):
+        """
+        Write rendered bytes unless the same bytes are already there.
+
+        Args:
+            relpath: Path inside the export, with forward slashes.
+            data: File contents (bytes).
+        """
+        digest = "sha1:" + hashlib.sha1(data).hexdigest()
+        self.manifest[relpath] = digest
+        target = os.path.join(self.output, *relpath.split("/"))
+        if not self.force and self.previous.get(relpath) == digest and os.path.exists(target):
+            self.unchanged += 1
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = target + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+        self.written += 1
+
+    def copy(self, relpath, source):
+        """
+        Copy a file unless the source's size and mtime are unchanged.
+
+        Args:
+            relpath: Path inside the export, with forward slashes.
+            source: Absolute path of the file to copy.
+        """
+        stat = os.stat(source)
+        signature = "stat:%d:%d" % (stat.st_size, stat.st_mtime_ns)
+        self.manifest[relpath] = signature
+        target = os.path.join(self.output, *relpath.split("/"))
+        if not self.force and self.previous.get(relpath) == signature and os.path.exists(target):
+            self.unchanged += 1
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = target + ".tmp"
+        shutil.copy2(source, tmp_path)
+        os.replace(tmp_path, target)
+        self.written += 1
+
+    def finish(self):
+        """
+        Delete files left over from the previous build and save the manifest.
+
+        Returns:
+            The number of stale files removed.
+        """
+        removed = 0
+        for relpath in set(self.previous) - set(self.manifest):
+            try:
+                os.remove(os.path.join(self.output, *relpath.split("/")))
+                removed += 1
+            except OSError:
+                pass
+        tmp_path = os.path.join(self.output, MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=0, sort_keys=True)
+        os.replace(tmp_path, os.path.join(self.output, MANIFEST_NAME))
+        return removed
+
+    # ------------------------------------------------------------------
+    # Rendering
+    # ------------------------------------------------------------------
+
+    def render(self, url):
+        """
+        Render ``url`` through the full request pipeline.
+
+        The CSRF token is rendered as the page-cache placeholder and then
+        blanked: a frozen page is shared by every visitor, so it must not
+        carry anyone's token.
+
+        Returns:
+            A tuple of (status code, body bytes).
+        """
+        with self.app.test_request_context(url):
+            g.page_cache_rendering = True
+            response = self.app.full_dispatch_request()
+            body = response.get_data()
+        return response.status_code, body.replace(CSRF_PLACEHOLDER.encode(), b"")
+
+    def freeze_page(self, url, relpath):
+        """Render one URL into the export; refuse anything but a 200."""
+        status, body = self.render(url)
+        if status != 200:
+            raise click.ClickException("%s returned %d" % (url, status))
+        self.write(relpath, body)
+
+    def freeze_pages(self):
+        """Render every argument-free GET page."""
+        for rule in self.app.url_map.iter_rules():
+            if rule.endpoint in SKIP_ENDPOINTS or rule.arguments or "GET" not in rule.methods:
+                continue
+            path = rule.rule.strip("/")
+            self.freeze_page(rule.rule, (path + "/" if path else "") + "index.html")
+
+    def freeze_gallery(self):
+        """Render every gallery category/page and its JSON twin."""
+        content = self.app.extensions["content"].snapshot()
+        page_size = max(1, int(self.app.config.get("GALLERY_PAGE_SIZE", 12)))
+
+        self.freeze_page("/gallery", "gallery/index.html")
+        self.freeze_page("/api/gallery", "api/gallery/index.json")
+        for category in content.categories:
+            slug = category.slug
+            cursor = None
+            while True:
+                query = "category=%s" % slug + ("&cursor=%s" % cursor if cursor else "")
+                suffix = "%s/%s" % (slug, cursor) if cursor else slug
+                self.freeze_page("/gallery?" + query, "gallery/category/%s.html" % suffix)
+                self.freeze_page("/api/gallery?" + query, "api/gallery/%s.json" % suffix)
+                _projects, cursor = content.gallery.page(slug, cursor, page_size)
+                if cursor is None:
+                    break
+
+    def freeze_error_pages(self):
+        """Render the custom error pages."""
+        status, body = self.render("/__freeze__/missing-page")
+        if status != 404:
+            raise click.ClickException("404 page returned %d" % status)
+        self.write("404.html", body)
+        for code in (429, 500):
+            with self.app.test_request_context("/"):
+                g.page_cache_rendering = True
+                html = render_template("errors/%d.html" % code)
+            self.write("%d.html" % code, html.replace(CSRF_PLACEHOLDER, "").encode("utf-8"))
+
+    def copy_static(self):
+        """Copy static files under their served (fingerprinted) names."""
+        manifest = self.app.extensions["asset_manifest"]
+        static_folder = self.app.static_folder
+        for root, _dirs, files in os.walk(static_folder):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, static_folder).replace(os.sep, "/")
+                # Precompressed siblings follow the file they belong to.
+                base, ext = os.path.splitext(logical)
+                if ext in (".gz", ".br"):
+                    served = manifest.url_for(base) + ext
+                else:
+                    served = manifest.url_for(logical)
+                self.copy("static/" + served, source)
+                if served != logical:
+                    # Keep the plain name too, for links built outside url_for.
+                    self.copy("static/" + logical, source)
+
+    def copy_images(self):
+        """Copy image derivatives under their ``/img/`` URLs."""
+        images = self.app.extensions["responsive_images"]
+        for logical, entry in images.sources.items():
+            name = url_name(logical, entry["hash"])
+            for width in entry["widths"]:
+                for fmt, ext, _mimetype in DERIVATIVE_FORMATS:
+                    if fmt not in entry["formats"]:
+                        continue
+                    source = os.path.join(
+                        images.cache_dir, derivative_name(logical, entry["hash"], width, ext)
+                    )
+                    # The JPEG sits at the URL itself; nginx picks a
+                    # .webp/.avif sibling from the Accept header.
+                    relpath = "img/%d/%s" % (width, name)
+                    self.copy(relpath if fmt == "jpeg" else relpath + ext, source)
+
+
+@contextmanager
+def _freezing(app):
+    """Bypass the page cache and rate limiter while rendering."""
+    page_cache = app.extensions.get("page_cache")
+    cache_enabled = getattr(page_cache, "enabled", False)
+    limiters = [(lim, lim.enabled) for lim in app.extensions.get("limiter", ())]
+    if page_cache is not None:
+        page_cache.enabled = False
+    for lim, _enabled in limiters:
+        lim.enabled = False
+    try:
+        yield
+    finally:
+        if page_cache is not None:
+            page_cache.enabled = cache_enabled
+        for lim, enabled in limiters:
+            lim.enabled = enabled
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@click.command("freeze")
+@click.option(
+    "--output",
+    default=None,
+    help="Export directory (default: FREEZE_DIR or instance/frozen).",
+)
+@click.option("--force", is_flag=True, help="Rewrite every file.")
+@with_appcontext
+def freeze_command(output, force):
+    """Export the public pages and assets as static files for nginx."""
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    output = output or app.config.get("FREEZE_DIR") or os.path.join(app.instance_path, "frozen")
+    if not app.extensions["asset_manifest"].enabled:
+        click.echo("Warning: ASSET_FINGERPRINTING is off; asset links are not fingerprinted.")
+
+    os.makedirs(output, exist_ok=True)
+    freezer = Freezer(app, output, force)
+    with _freezing(app):
+        freezer.freeze_pages()
+        freezer.freeze_gallery()
+        freezer.freeze_error_pages()
+    freezer.copy_static()
+    freezer.copy_images()
+    freezer.write("nginx.conf.example", NGINX_EXAMPLE.encode("utf-8"))
+    removed = freezer.finish()
+
+    click.echo(
+        "Froze %d files into %s (%d written, %d unchanged, %d removed)."
+        % (len(freezer.manifest), output, freezer.written, freezer.unchanged, removed)
+    )
@@ -0,0 +1,445 @@
+"""
+Intrinsic dimensions and loading placeholders for static images.
+
+Every ``<img>`` used to carry hard-coded ``width``/``height`` attributes
+(600x400 in the gallery, 400x200 for services), whatever the photo's
+real shape, and showed nothing until the lazy image arrived.  This
+module keeps an index of every file under ``static/images`` with:
+
+* ``width``/``height`` — the intrinsic size, read from the file header
+  (JPEG, PNG or GIF) with the EXIF orientation applied, so browsers can
+  reserve the right aspect ratio before the image loads;
+* ``color`` — the dominant colour, as ``#rrggbb``;
+* ``placeholder`` — a blurred thumbnail a few pixels across, as a
+  base64 ``data:image/webp`` URI of about 100-150 bytes (an optimised
+  JPEG of about 450 bytes if Pillow was built without WebP).
+
+The colour and placeholder need Pillow and are only made for opaque
+photographs; without Pillow the index still has the dimensions.
+
+The index is built in ``create_app`` and cached on disk (default:
+``instance/image-meta.json``).  Entries are keyed by file size and
+mtime, so a restart only decodes images that were added or changed.
+In debug mode an image edited since start-up is re-read on next use.
+
+Templates use the ``image_meta(image)`` helper, keyed by the ``image``
+field of a service or project (relative to ``static/images``)::
+
+    <img {{ responsive_image(...) }} {{ image_meta(project.image) }} ...>
+
+It renders the ``width``, ``height`` and a ``style`` that paints the
+placeholder as the element's background until the photo covers it
+(CSP already allows ``img-src data:`` and inline styles).
+``/api/gallery`` returns the same values for the script-built cards.
+"""
+
+import base64
+import io
+import json
+import os
+import struct
+import threading
+import time
+
+from markupsafe import Markup
+
+from assets import iter_static_files
+
+# Only files under this static sub-directory are indexed.
+IMAGE_DIR = "images"
+
+# Bump when the index format or placeholder encoding changes.
+INDEX_VERSION = 2
+
+# Placeholders are made for these (opaque, photographic) types only.
+PLACEHOLDER_EXTENSIONS = {".jpg", ".jpeg"}
+
+# JPEG start-of-frame markers (the ones that carry the image size).
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# EXIF orientations that rotate the image by 90 degrees.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+# ---------------------------------------------------------------------------
+# Header parsing
+# ---------------------------------------------------------------------------
+
+
+def read_dimensions(path):
+    """
+    Read an image's displayed size from its header, without decoding it.
+
+    Args:
+        path: Absolute path of a JPEG, PNG or GIF file.
+
+    Returns:
+        A (width, height) tuple, or None for unknown or corrupt files.
+    """
+    try:
+        with open(path, "rb") as handle:
+            head = handle.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+            if head[:2] == b"\xff\xd8":
+                handle.seek(2)
+                return _jpeg_dimensions(handle)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def _jpeg_dimensions(handle):
+    """Walk JPEG segments to the start-of-frame, noting EXIF orientation."""
+    orientation = 1
+    while True:
+        byte = handle.read(1)
+        while byte and byte != b"\xff":
+            byte = handle.read(1)
+        while byte == b"\xff":
+            byte = handle.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # Stand-alone markers have no length.
+        if marker in (0xD9, 0xDA):
+            return None  # End of image / scan data before any frame.
+        (length,) = struct.unpack(">H", handle.read(2))
+        segment = handle.read(length - 2)
+        if marker == 0xE1 and segment[:6] == b"Exif\x00\x00":
+            orientation = _exif_orientation(segment[6:])
+        elif marker in SOF_MARKERS:
+            height, width = struct.unpack(">HH", segment[1:5])
+            if orientation in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            return width, height
+
+
+def _exif_orientation(tiff):
+    """Return the Orientation tag from IFD0 of an EXIF block (1 if absent)."""
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return 1
+    endian = "<" if tiff[:2] == b"II" else ">"
+    (offset,) = struct.unpack(endian + "I", tiff[4:8])
+    if offset + 2 > len(tiff):
+        return 1
+    (count,) = struct.unpack(endian + "H", tiff[offset : offset + 2])
+    for index in range(count):
+        entry = offset + 2 + 12 * index
+        if entry + 12 > len(tiff):
+            break
+        tag, _type, _count, value = struct.unpack(endian + "HHIH", tiff[entry : entry + 10])
+        if tag == 0x0112:
+            return value
+    return 1
+
+
+# ---------------------------------------------------------------------------
+# Colour and placeholder (Pillow)
+# ---------------------------------------------------------------------------
+
+
+def _pillow():
+    """
+    Import Pillow on first use.
+
+    Returns:
+        A tuple of the (Image, ImageFilter, ImageOps, features) modules,
+        or None if Pillow is not installed.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from PIL import Image, ImageFilter, ImageOps, features
+    except ImportError:  # pragma: no cover - depends on the environment
+        return None
+    return Image, ImageFilter, ImageOps, features
+
+
+def make_preview(path, size):
+    """
+    Compute the dominant colour and blurred placeholder of a photo.
+
+    JPEGs are decoded at a reduced scale (``draft``), so even a 20
+    megapixel original takes a few milliseconds.
+
+    Args:
+        path: Absolute path of the image.
+        size: Longest side of the placeholder in pixels.
+
+    Returns:
+        A tuple of (``#rrggbb``, ``data:`` URI), or None when Pillow is
+        missing or cannot read the file.
+    """
+    pillow = _pillow()
+    if pillow is None:
+        return None
+    Image, ImageFilter, ImageOps, features = pillow
+    try:
+        with Image.open(path) as original:
+            original.draft("RGB", (64, 64))
+            image = ImageOps.exif_transpose(original).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    image.thumbnail((64, 64))
+
+    # The most common of a few median-cut colours beats a plain average,
+    # which turns a dark photo with bright sparks into mud.
+    quantized = image.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _count, index = max(quantized.getcolors())
+    palette = quantized.getpalette()
+    color = "#%02x%02x%02x" % tuple(palette[index * 3 : index * 3 + 3])
+
+    image.thumbnail((size, size))
+    image = image.filter(ImageFilter.GaussianBlur(0.5))
+    buffer = io.BytesIO()
+    # A 16px JPEG is mostly header tables; WebP's are a few bytes.
+    if features.check("webp"):
+        image.save(buffer, "WEBP", quality=40, method=6)
+        mimetype = "image/webp"
+    else:  # pragma: no cover - depends on the Pillow build
+        image.save(buffer, "JPEG", quality=40, optimize=True)
+        mimetype = "image/jpeg"
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return color, "data:%s;base64,%s" % (mimetype, encoded)
+
+
+def describe_image(path, placeholder_size):
+    """
+    Build the index entry for one image file.
+
+    Args:
+        path: Absolute path of the image.
+        placeholder_size: Longest side of the placeholder in pixels.
+
+    Returns:
+        A dict with ``size``, ``mtime``, ``width`` and ``height`` (None
+        if unreadable) and, for photos when Pillow is available,
+        ``color`` and ``placeholder``.
+    """
+    stat = os.stat(path)
+    dimensions = read_dimensions(path)
+    entry = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "width": dimensions[0] if dimensions else None,
+        "height": dimensions[1] if dimensions else None,
+    }
+    if dimensions and os.path.splitext(path)[1].lower() in PLACEHOLDER_EXTENSIONS:
+        preview = make_preview(path, placeholder_size)
+        if preview is not None:
+            entry["color"], entry["placeholder"] = preview
+    return entry
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+
+def load_index(path):
+    """
+    Read the on-disk metadata index.
+
+    Args:
+        path: Location of the index JSON file.
+
+    Returns:
+        The ``images`` mapping, or an empty dict if unavailable.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return data.get("images", {})
+
+
+def save_index(path, images):
+    """
+    Atomically write the metadata index.
+
+    Args:
+        path: Location of the index JSON file.
+        images: Mapping of image name to entry.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({"version": INDEX_VERSION, "images": images}, handle, indent=1)
+    os.replace(tmp_path, path)
+
+
+class ImageMetadata:
+    """
+    Index of static image sizes, colours and placeholders.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.app = None
+        self.index_path = None
+        self.placeholder_size = 16
+        self.images = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Build (or refresh) the index and register the ``image_meta`` helper.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        self.enabled = app.config.get("IMAGE_META_ENABLED", True)
+        self.index_path = index_path(app)
+        self.placeholder_size = int(app.config.get("IMAGE_PLACEHOLDER_SIZE", 16))
+        app.extensions["image_meta"] = self
+        app.add_template_global(self.image_meta, "image_meta")
+        if not self.enabled:
+            return
+
+        started = time.perf_counter()
+        built = self.build()
+        app.logger.info(
+            "Image metadata index ready: %d images (%d read) in %.0f ms.",
+            len(self.images),
+            built,
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def build(self):
+        """
+        Refresh the index from ``static/images``, reusing unchanged entries.
+
+        Returns:
+            The number of images that had to be read.
+        """
+        static_folder = self.app.static_folder
+        cached = load_index(self.index_path)
+        images = {}
+        built = 0
+        for logical in iter_static_files(os.path.join(static_folder, IMAGE_DIR)):
+            path = os.path.join(static_folder, IMAGE_DIR, *logical.split("/"))
+            entry = cached.get(logical)
+            if entry is None or not self._is_current(entry, path):
+                entry = describe_image(path, self.placeholder_size)
+                built += 1
+            images[logical] = entry
+
+        self.images = images
+        if built or images.keys() != cached.keys():
+            try:
+                save_index(self.index_path, images)
+            except OSError as exc:
+                self.app.logger.warning(
+                    "Could not write image metadata index %s: %s", self.index_path, exc
+                )
+        return built
+
+    @staticmethod
+    def _is_current(entry, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]
+
+    def lookup(self, image):
+        """
+        Return the index entry for an image, or None.
+
+        Args:
+            image: Path relative to ``static/images`` — the ``image``
+                field of a service or project.
+        """
+        entry = self.images.get(image)
+        if not self.app.debug:
+            return entry
+
+        # Debug mode: pick up images added or edited since start-up.
+        path = os.path.join(self.app.static_folder, IMAGE_DIR, *image.split("/"))
+        if entry is not None and self._is_current(entry, path):
+            return entry
+        if not os.path.isfile(path):
+            return None
+        entry = describe_image(path, self.placeholder_size)
+        with self._lock:
+            images = dict(self.images)
+            images[image] = entry
+            self.images = images
+        return entry
+
+    # ------------------------------------------------------------------
+    # Template / API helpers
+    # ------------------------------------------------------------------
+
+    def dimensions(self, image):
+        """Return the (width, height) of an image, or (None, None)."""
+        entry = self.lookup(image) if self.enabled else None
+        if entry is None:
+            return None, None
+        return entry["width"], entry["height"]
+
+    def placeholder_style(self, image):
+        """
+        Return an inline ``style`` value that paints the placeholder.
+
+        The background is positioned like ``object-fit: cover`` so the
+        blurred preview lines up with the photo that replaces it.
+
+        Args:
+            image: Path relative to ``static/images``.
+
+        Returns:
+            A CSS declaration, or ``""`` when the image has none.
+        """
+        entry = self.lookup(image) if self.enabled else None
+        if entry is None or "color" not in entry:
+            return ""
+        return "background: %s url(%s) center / cover no-repeat" % (
+            entry["color"],
+            entry["placeholder"],
+        )
+
+    def image_meta(self, image):
+        """
+        Render ``width``, ``height`` and placeholder attributes for an ``<img>``.
+
+        Args:
+            image: Path relative to ``static/images``.
+
+        Returns:
+            A ``Markup`` string of HTML attributes (empty for unknown
+            images, which the asset audit reports separately).
+        """
+        width, height = self.dimensions(image)
+        if width is None:
+            return Markup("")
+        attributes = Markup('width="%d" height="%d"') % (width, height)
+        style = self.placeholder_style(image)
+        if style:
+            attributes += Markup(' style="%s"') % style
+        return attributes
+
+
+def index_path(app):
+    """
+    Return the location of the image metadata index.
+
+    Args:
+        app: The Flask application instance.
+    """
+    return app.config.get("IMAGE_META_PATH") or os.path.join(
+        app.instance_path, "image-meta.json"
+    )
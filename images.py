@@ -0,0 +1,464 @@
+"""
+Responsive image derivatives for the Ironforge Welding website.
+
+The photos in ``static/images`` are multi-megabyte originals, but the
+templates display them at 400–600 px.  This module provides:
+
+* An offline generator (``flask assets images``) that writes resized
+  JPEG, WebP and — when Pillow supports it — AVIF variants of every
+  photographic source into a cache directory (default
+  ``instance/image-cache``), one file per width bucket, plus an
+  ``index.json`` describing what was generated.
+* A ``/img/<width>/<filename>`` view that serves those variants.  The
+  format is negotiated from the ``Accept`` header (AVIF, then WebP,
+  then JPEG) and ``Vary: Accept`` is set.  Filenames carry the source's
+  content hash, so responses are cached as immutable.
+* A ``responsive_image`` Jinja helper that emits ``src``, ``srcset`` and
+  ``sizes`` attributes for a static image.  Sources without derivatives
+  fall back to the plain static URL, so templates work before the
+  generator has ever run.
+
+Pillow is only needed by the generator; serving and the template helper
+work without it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import time
+
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from markupsafe import Markup, escape
+
+from assets import assets_cli, iter_static_files
+
+# Module-level logger for the image pipeline.
+logger = logging.getLogger(__name__)
+
+# Source file types that get derivatives (photographs only).
+SOURCE_EXTENSIONS = {".jpg", ".jpeg"}
+
+# Output formats in order of preference: (format, extension, mimetype).
+DERIVATIVE_FORMATS = (
+    ("avif", ".avif", "image/avif"),
+    ("webp", ".webp", "image/webp"),
+    ("jpeg", ".jpg", "image/jpeg"),
+)
+
+# Encoder settings per output format.
+ENCODER_OPTIONS = {
+    "avif": {"quality": 50},
+    "webp": {"quality": 75, "method": 6},
+    "jpeg": {"quality": 80, "optimize": True, "progressive": True},
+}
+
+# Bump when the index format or derivative naming changes.
+INDEX_VERSION = 1
+
+
+def derivative_name(logical, digest, width, ext):
+    """
+    Build the cache-relative name of one derivative file.
+
+    Args:
+        logical: Static path of the source, e.g. ``images/gate.jpg``.
+        digest: Hex digest of the source contents.
+        width: Width bucket in pixels.
+        ext: Output extension including the dot.
+
+    Returns:
+        E.g. ``images/gate.3f9a1c2b-640.webp``.
+    """
+    stem = posixpath.splitext(logical)[0]
+    return "%s.%s-%d%s" % (stem, digest[:8], width, ext)
+
+
+def url_name(logical, digest):
+    """Return the hashed name used in ``/img/`` URLs for a source."""
+    stem, ext = posixpath.splitext(logical)
+    return "%s.%s%s" % (stem, digest[:8], ext)
+
+
+def _pillow():
+    """
+    Import Pillow on first use.
+
+    Pillow is optional and only the offline generator needs it, so it
+    is not imported by the web workers at all.
+
+    Returns:
+        A tuple of the (Image, ImageOps, features) modules, or None if
+        Pillow is not installed.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from PIL import Image, ImageOps, features
+    except ImportError:  # pragma: no cover - depends on the environment
+        return None
+    return Image, ImageOps, features
+
+
+def _available_formats(features):
+    """Return the output formats this Pillow build can encode."""
+    formats = []
+    for fmt, _ext, _mimetype in DERIVATIVE_FORMATS:
+        try:
+            supported = fmt == "jpeg" or features.check(fmt)
+        except (ValueError, KeyError):
+            supported = False
+        if supported:
+            formats.append(fmt)
+    return formats
+
+
+def generate_derivatives(static_folder, cache_dir, widths, force=False):
+    """
+    Write resized variants of every photographic static image.
+
+    Each source gets one variant per width bucket smaller than itself,
+    plus one at its own width (capped at the largest bucket), in every
+    supported format.  Sources whose size and mtime match the existing
+    index are skipped unless ``force`` is set.
+
+    Args:
+        static_folder: Absolute path of the static folder.
+        cache_dir: Directory receiving the derivatives and ``index.json``.
+        widths: Iterable of width buckets in pixels.
+        force: Regenerate every source.
+
+    Returns:
+        A tuple of (sources processed, files written).
+
+    Raises:
+        RuntimeError: If Pillow is not installed.
+    """
+    pillow = _pillow()
+    if pillow is None:
+        raise RuntimeError("Pillow is required to generate image derivatives.")
+    Image, ImageOps, features = pillow  # pylint: disable=invalid-name
+
+    widths = sorted(set(int(w) for w in widths))
+    formats = _available_formats(features)
+    previous = load_index(cache_dir)
+    index = {}
+    processed = 0
+    written = 0
+
+    for logical in iter_static_files(static_folder):
+        if posixpath.splitext(logical)[1].lower() not in SOURCE_EXTENSIONS:
+            continue
+        path = os.path.join(static_folder, logical)
+        stat = os.stat(path)
+        old = previous.get(logical)
+        if (
+            not force
+            and old
+            and old["size"] == stat.st_size
+            and old["mtime"] == stat.st_mtime_ns
+            and old["formats"] == formats
+        ):
+            index[logical] = old
+            continue
+
+        with open(path, "rb") as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original).convert("RGB")
+        src_width, src_height = image.size
+
+        buckets = [w for w in widths if w < src_width]
+        buckets.append(min(src_width, widths[-1]))
+        buckets = sorted(set(buckets))
+
+        for width in buckets:
+            height = max(1, round(src_height * width / src_width))
+            resized = image if width == src_width else image.resize(
+                (width, height), Image.LANCZOS
+            )
+            for fmt, ext, _mimetype in DERIVATIVE_FORMATS:
+                if fmt not in formats:
+                    continue
+                target = os.path.join(cache_dir, derivative_name(logical, digest, width, ext))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                resized.save(target, format=fmt.upper(), **ENCODER_OPTIONS[fmt])
+                written += 1
+
+        index[logical] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": digest,
+            "width": src_width,
+            "height": src_height,
+            "widths": buckets,
+            "formats": formats,
+        }
+        processed += 1
+
+    save_index(cache_dir, index)
+    return processed, written
+
+
+def load_index(cache_dir):
+    """
+    Read ``index.json`` from the derivative cache directory.
+
+    Args:
+        cache_dir: The derivative cache directory.
+
+    Returns:
+        The ``sources`` mapping, or an empty dict if unavailable.
+    """
+    try:
+        with open(os.path.join(cache_dir, "index.json"), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return data.get("sources", {})
+
+
+def save_index(cache_dir, sources):
+    """
+    Atomically write ``index.json`` into the derivative cache directory.
+
+    Args:
+        cache_dir: The derivative cache directory.
+        sources: Mapping produced by :func:`generate_derivatives`.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, "index.json")
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({"version": INDEX_VERSION, "sources": sources}, handle, indent=1)
+    os.replace(tmp_path, path)
+
+
+class ResponsiveImages:
+    """
+    Serves image derivatives and exposes the ``responsive_image`` helper.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.cache_dir = None
+        self.sources = {}
+        self._by_url = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Load the derivative index and register the view and helper.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.cache_dir = cache_dir(app)
+        app.extensions["responsive_images"] = self
+        app.add_url_rule(
+            "/img/<int:width>/<path:filename>",
+            endpoint="image_derivative",
+            view_func=self.serve,
+        )
+        app.add_template_global(self.responsive_image, "responsive_image")
+        app.add_template_global(self.image_url, "image_url")
+
+        started = time.perf_counter()
+        self.load(app.static_folder)
+        app.logger.info(
+            "Responsive image index ready: %d sources in %.0f ms.",
+            len(self.sources),
+            (time.perf_counter() - started) * 1000,
+        )
+
+    def load(self, static_folder):
+        """
+        Load ``index.json``, keeping only entries whose source is unchanged.
+
+        Args:
+            static_folder: Absolute path of the static folder.
+        """
+        sources = {}
+        for logical, entry in load_index(self.cache_dir).items():
+            try:
+                stat = os.stat(os.path.join(static_folder, logical))
+            except OSError:
+                continue
+            if stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]:
+                sources[logical] = entry
+
+        self.sources = sources
+        self._by_url = {
+            url_name(logical, entry["hash"]): logical for logical, entry in sources.items()
+        }
+
+    # ------------------------------------------------------------------
+    # Template helpers
+    # ------------------------------------------------------------------
+
+    def image_url(self, filename, width):
+        """
+        Return the URL of the best derivative no wider than ``width``.
+
+        Args:
+            filename: Static path of the source, e.g. ``images/gate.jpg``.
+            width: Desired width in pixels.
+
+        Returns:
+            A derivative URL, or the plain static URL when the source has
+            no derivatives.
+        """
+        entry = self.sources.get(filename)
+        if entry is None:
+            return url_for("static", filename=filename)
+        fitting = [w for w in entry["widths"] if w <= width] or entry["widths"][:1]
+        return url_for(
+            "image_derivative",
+            width=fitting[-1],
+            filename=url_name(filename, entry["hash"]),
+        )
+
+    def image_attributes(self, filename, default_width=640):
+        """
+        Return the ``src`` and ``srcset`` values for a source image.
+
+        Used by :meth:`responsive_image` and by JSON endpoints whose
+        client builds the ``<img>`` itself.
+
+        Args:
+            filename: Static path of the source, e.g. ``images/gate.jpg``.
+            default_width: Width used for the ``src`` fallback.
+
+        Returns:
+            A tuple of (src, srcset); ``srcset`` is ``""`` when the source
+            has no derivatives.
+        """
+        src = self.image_url(filename, default_width)
+        entry = self.sources.get(filename)
+        if entry is None:
+            return src, ""
+
+        name = url_name(filename, entry["hash"])
+        srcset = ", ".join(
+            "%s %dw" % (url_for("image_derivative", width=w, filename=name), w)
+            for w in entry["widths"]
+        )
+        return src, srcset
+
+    def responsive_image(self, filename, sizes, default_width=640):
+        """
+        Render ``src``/``srcset``/``sizes`` attributes for an ``<img>``.
+
+        Args:
+            filename: Static path of the source, e.g. ``images/gate.jpg``.
+            sizes: The ``sizes`` attribute describing the display width.
+            default_width: Width used for the ``src`` fallback.
+
+        Returns:
+            A ``Markup`` string of HTML attributes.
+        """
+        src, srcset = self.image_attributes(filename, default_width)
+        if not srcset:
+            return Markup('src="%s"') % src
+        return Markup('src="%s" srcset="%s" sizes="%s"') % (
+            src,
+            srcset,
+            escape(sizes),
+        )
+
+    # ------------------------------------------------------------------
+    # View
+    # ------------------------------------------------------------------
+
+    def negotiate_format(self, entry):
+        """
+        Pick the best derivative format the client's ``Accept`` allows.
+
+        Modern formats must be named explicitly — a wildcard such as
+        ``image/*`` or ``*/*`` only earns JPEG, since older browsers send
+        wildcards without being able to decode AVIF or WebP.
+
+        Args:
+            entry: The index entry for the requested source.
+
+        Returns:
+            A (format, extension, mimetype) tuple.
+        """
+        accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+        for fmt, ext, mimetype in DERIVATIVE_FORMATS:
+            if fmt not in entry["formats"]:
+                continue
+            if fmt == "jpeg" or mimetype in accepted:
+                return fmt, ext, mimetype
+        return DERIVATIVE_FORMATS[-1]
+
+    def serve(self, width, filename):
+        """
+        Serve one image derivative in the negotiated format.
+
+        Args:
+            width: Width bucket from the URL.
+            filename: Hashed source name from the URL.
+
+        Returns:
+            The image response, or 404 for unknown sources or widths.
+        """
+        logical = self._by_url.get(filename)
+        if logical is None:
+            abort(404)
+        entry = self.sources[logical]
+        if width not in entry["widths"]:
+            abort(404)
+
+        _fmt, ext, mimetype = self.negotiate_format(entry)
+        response = send_from_directory(
+            self.cache_dir,
+            derivative_name(logical, entry["hash"], width, ext),
+            mimetype=mimetype,
+        )
+        response.vary.add("Accept")
+        return response
+
+
+def cache_dir(app):
+    """
+    Return the directory holding image derivatives.
+
+    Args:
+        app: The Flask application instance.
+    """
+    return app.config.get("IMAGE_CACHE_DIR") or os.path.join(
+        app.instance_path, "image-cache"
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@assets_cli.command("images")
+@click.option("--force", is_flag=True, help="Regenerate every source image.")
+def images_command(force):
+    """Generate resized JPEG/WebP/AVIF variants of static photos."""
+    if _pillow() is None:
+        raise click.ClickException("Pillow is required: pip install Pillow")
+    target = cache_dir(current_app)
+    processed, written = generate_derivatives(
+        current_app.static_folder,
+        target,
+        current_app.config.get("IMAGE_WIDTHS", (320, 640, 960, 1280)),
+        force,
+    )
+    click.echo(
+        "Wrote %d derivative files for %d source images to %s."
+        % (written, processed, target)
+    )
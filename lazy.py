@@ -0,0 +1,62 @@
+"""
+Deferred construction of optional Flask extensions.
+
+``extensions.py`` creates every extension object at import time, which
+means importing the extension's package in every worker even when the
+feature is switched off.  :class:`LazyExtension` stands in for such an
+object: the package is imported and the real instance created the first
+time anything touches it (normally ``init_app``, which ``create_app``
+only calls when the feature is enabled).
+
+Example::
+
+    mail = LazyExtension("flask_mail", "Mail")
+    ...
+    if app.config["MAIL_ENABLED"]:
+        mail.init_app(app)   # flask_mail is imported here
+"""
+
+import importlib
+import threading
+
+
+class LazyExtension:
+    """
+    Proxy that imports and instantiates an extension on first use.
+
+    Args:
+        module: Dotted module path, e.g. ``"flask_mail"``.
+        name: Class name inside the module, e.g. ``"Mail"``.
+        args: Positional arguments for the constructor.
+        kwargs: Keyword arguments for the constructor.
+    """
+
+    def __init__(self, module, name, *args, **kwargs):
+        self._module = module
+        self._name = name
+        self._args = args
+        self._kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """True once the real extension has been created."""
+        return self._instance is not None
+
+    def load(self):
+        """Import the module and create the extension (once)."""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    cls = getattr(importlib.import_module(self._module), self._name)
+                    self._instance = cls(*self._args, **self._kwargs)
+        return self._instance
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the proxy itself.
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return "<LazyExtension %s.%s (%s)>" % (self._module, self._name, state)
@@ -0,0 +1,224 @@
+"""
+Non-blocking, structured logging for the Ironforge Welding website.
+
+``configure_logging`` in ``app.py`` builds the pipeline from three
+settings:
+
+* ``LOG_QUEUE`` — request threads only put records on an in-memory
+  queue; a background listener thread formats them and does the stream
+  I/O, so a slow stdout/pipe never sits on the request path.
+* ``LOG_FORMAT`` — ``text`` (the familiar one-line format) or ``json``
+  (one JSON object per line with ``request_id`` and ``duration_ms``).
+* ``LOG_SAMPLE_RATE`` — fraction of requests whose INFO/DEBUG lines are
+  kept (e.g. ``0.1``).  The decision is made once per request, so a
+  sampled request keeps all its lines; warnings and errors are always
+  kept.
+
+Every request gets an id (the incoming ``X-Request-ID`` header when it
+looks sane, otherwise a random one), echoed back in the response's
+``X-Request-ID`` header and attached to every record logged while the
+request is handled, together with the milliseconds elapsed so far.  One
+``requests`` line per response records the method, path, status and
+total duration.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+# The one-line text format used since the first release.
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# Incoming request ids are echoed into logs and headers; only accept
+# short, boring ones.
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Logger for the per-response summary line.
+request_logger = logging.getLogger("requests")
+
+
+class JSONFormatter(logging.Formatter):
+    """Format each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+            entry["duration_ms"] = record.duration_ms
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Attach the request id and elapsed time, and apply INFO sampling.
+
+    Runs in the thread that logged the record (the listener thread has
+    no request context).
+
+    Args:
+        sample_rate: Fraction of INFO/DEBUG records to keep, 0.0–1.0.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        sampled = True
+        if has_request_context() and "request_id" in g:
+            record.request_id = g.request_id
+            record.duration_ms = round((time.perf_counter() - g.request_started) * 1000, 2)
+            sampled = g.log_sampled
+        else:
+            record.request_id = None
+            record.duration_ms = None
+            if self.sample_rate < 1.0:
+                sampled = random.random() < self.sample_rate
+        return sampled or record.levelno >= logging.WARNING
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` that owns its ``QueueListener``.
+
+    The listener thread is started on first use and restarted after a
+    fork, since threads do not survive into a forked worker.
+
+    Args:
+        target: The handler that does the actual I/O.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._listener = QueueListener(
+                    self.queue, self.target, respect_handler_level=True
+                )
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        """Merge args and render the traceback; keep the extra attributes."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self):
+        """Flush queued records and stop the listener thread."""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+def build_handler(log_format="text", use_queue=True, sample_rate=1.0, level=logging.INFO):
+    """
+    Create the handler for the root logger.
+
+    Args:
+        log_format: ``"text"`` or ``"json"``.
+        use_queue: Do the stream I/O on a background thread.
+        sample_rate: Fraction of requests whose INFO lines are kept.
+        level: Minimum level written.
+
+    Returns:
+        A configured ``logging.Handler``.
+    """
+    stream_handler = logging.StreamHandler()
+    stream_handler.setLevel(level)
+    stream_handler.setFormatter(
+        JSONFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    )
+    handler = BackgroundQueueHandler(stream_handler) if use_queue else stream_handler
+    handler.setLevel(level)
+    handler.addFilter(RequestContextFilter(sample_rate))
+    handler.log_pipeline = True  # Marks handlers installed by this module.
+    return handler
+
+
+def install_handler(handler, level):
+    """
+    Make ``handler`` the root logger's pipeline handler.
+
+    Replaces a handler installed by an earlier ``create_app`` in the same
+    process, so repeated app creation does not duplicate every line.
+    """
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        if getattr(old, "log_pipeline", False):
+            root.removeHandler(old)
+            if isinstance(old, BackgroundQueueHandler):
+                old.stop()
+    root.addHandler(handler)
+    root.setLevel(level)
+    if isinstance(handler, BackgroundQueueHandler):
+        atexit.register(handler.stop)
+
+
+def register_request_logging(app, sample_rate=1.0):
+    """
+    Assign request ids, make the sampling decision and log each response.
+
+    Args:
+        app: The Flask application instance.
+        sample_rate: Fraction of requests whose INFO lines are kept.
+    """
+
+    @app.before_request
+    def assign_request_id():
+        """Start the request clock and pick (or accept) a request id."""
+        g.request_started = time.perf_counter()
+        incoming = request.headers.get("X-Request-ID", "")
+        g.request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        g.log_sampled = sample_rate >= 1.0 or random.random() < sample_rate
+
+    @app.after_request
+    def log_response(response):
+        """Echo the request id and log one summary line."""
+        if "request_id" in g:
+            response.headers["X-Request-ID"] = g.request_id
+            request_logger.info(
+                "%s %s %d", request.method, request.full_path.rstrip("?"), response.status_code
+            )
+        return response
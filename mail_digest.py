@@ -0,0 +1,141 @@
+"""
+Digest delivery for quote notifications.
+
+When ``MAIL_DIGEST_WINDOW`` is greater than zero, quote notifications are
+not queued one by one.  The first notification opens a window of that
+many seconds; every notification arriving inside the window is folded
+into a single email to ``QUOTE_RECIPIENT_EMAIL``, which is handed to the
+mail queue when the window closes.  A window that collected only one
+notification sends it unchanged, with its ``Reply-To`` intact.
+
+Each process keeps its own window, so with several workers the owner
+may receive one digest per worker for the same burst.  Pending
+notifications are flushed at interpreter exit.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+# Module-level logger for digest delivery.
+logger = logging.getLogger(__name__)
+
+# Separator placed between notifications in a digest body.
+DIGEST_SEPARATOR = "\n\n" + "=" * 60 + "\n\n"
+
+
+class _Notification:
+    """One quote notification waiting in the digest window."""
+
+    __slots__ = ("subject", "body", "reply_to", "description")
+
+    def __init__(self, subject, body, reply_to, description):
+        self.subject = subject
+        self.body = body
+        self.reply_to = reply_to
+        self.description = description
+
+
+class MailDigest:
+    """
+    Folds notifications arriving within a time window into one email.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+
+    Args:
+        mail_queue: The ``MailQueue`` that delivers finished messages.
+    """
+
+    def __init__(self, mail_queue, app=None):
+        self.mail_queue = mail_queue
+        self.app = None
+        self.window = 0.0
+
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        """True when notifications are being batched."""
+        return self.window > 0
+
+    def init_app(self, app):
+        """
+        Read the digest window from the app config.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        self.window = float(app.config.get("MAIL_DIGEST_WINDOW", 0))
+        app.extensions["mail_digest"] = self
+        atexit.register(self.flush)
+
+    def add(self, subject, body, reply_to, description=""):
+        """
+        Add a notification to the current window, opening one if needed.
+
+        Args:
+            subject: Subject the notification would have on its own.
+            body: Plain-text body.
+            reply_to: The customer's address.
+            description: Short text identifying it in logs.
+        """
+        notification = _Notification(subject, body, reply_to, description)
+        with self._lock:
+            if self._pid != os.getpid():
+                # A timer inherited from a parent process never fires here.
+                self._pending = []
+                self._timer = None
+                self._pid = os.getpid()
+            self._pending.append(notification)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Send everything collected in the current window (timer callback)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            pending, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+
+        # Deferred: flask_mail is only imported when mail is enabled.
+        from flask_mail import Message  # pylint: disable=import-outside-toplevel
+
+        with self.app.app_context():
+            recipient = self.app.config.get("QUOTE_RECIPIENT_EMAIL")
+            if len(pending) == 1:
+                only = pending[0]
+                message = Message(
+                    subject=only.subject,
+                    recipients=[recipient],
+                    body=only.body,
+                    reply_to=only.reply_to,
+                )
+                description = only.description
+            else:
+                message = Message(
+                    subject="%d New Quote Requests" % len(pending),
+                    recipients=[recipient],
+                    body=DIGEST_SEPARATOR.join(n.body for n in pending),
+                )
+                description = "digest of %d (%s)" % (
+                    len(pending),
+                    ", ".join(n.description for n in pending),
+                )
+                logger.info("Sending quote digest with %d notifications.", len(pending))
+            self.mail_queue.submit(message, description=description)
@@ -0,0 +1,316 @@
+"""
+Background delivery queue for outbound email.
+
+``contact_submit`` used to call ``mail.send()`` inline, so one slow SMTP
+handshake held a worker for seconds and a burst of quote requests could
+exhaust the pool.  Messages are now placed on a bounded in-process queue
+and delivered by a small pool of daemon threads:
+
+* Transient failures (network errors, 4xx replies) are retried with
+  exponential backoff; permanent ones (authentication, refused
+  recipients) are not.
+* When the queue is full, or a message runs out of retries, its full
+  text is logged at ERROR level so the lead is never silently lost.
+* :meth:`MailQueue.stats` reports queue depth and delivery counters;
+  the same figures are exported on ``/metrics`` as
+  ``mail_queue_depth`` and ``mail_queue_messages_total{event}``.
+
+Worker threads are started lazily on the first enqueue — and restarted
+if the process has forked since — so preloading the app in a master
+process never leaks threads into workers.
+
+For end-to-end checks without network access, point ``MAIL_SERVER`` at
+the local sink in ``smtp_sink.py``.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+
+# Module-level logger for mail delivery.
+logger = logging.getLogger(__name__)
+
+# Delivery events counted by :meth:`MailQueue.stats` and /metrics.
+EVENTS = ("enqueued", "sent", "retried", "failed", "dropped")
+
+# SMTP errors that will not go away by retrying.
+PERMANENT_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPNotSupportedError,
+)
+
+
+class _Job:
+    """One message waiting for delivery."""
+
+    __slots__ = ("message", "description", "attempts")
+
+    def __init__(self, message, description):
+        self.message = message
+        self.description = description
+        self.attempts = 0
+
+
+class MailQueue:
+    """
+    Bounded background queue delivering Flask-Mail messages.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+
+    Args:
+        mail: The Flask-Mail ``Mail`` instance used for delivery.
+    """
+
+    def __init__(self, mail, app=None):
+        self.mail = mail
+        self.transport = None  # Set by init_app (mail.send or the pool).
+        self.app = None
+        self.enabled = False
+        self.workers = 2
+        self.max_retries = 4
+        self.backoff = 2.0
+        self.max_delay = 60.0
+
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(EVENTS, 0)
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Read queue settings from the app config.
+
+        If an enabled ``SMTPPool`` is registered on the app (see
+        ``smtp_pool.py``) messages are sent through it, reusing SMTP
+        sessions; otherwise each message uses ``mail.send()``.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        pool = app.extensions.get("smtp_pool")
+        self.transport = pool.send if pool is not None and pool.enabled else self.mail.send
+        self.enabled = app.config.get("MAIL_QUEUE_ENABLED", True)
+        self.workers = max(1, int(app.config.get("MAIL_QUEUE_WORKERS", 2)))
+        self.max_retries = int(app.config.get("MAIL_QUEUE_MAX_RETRIES", 4))
+        self.backoff = float(app.config.get("MAIL_QUEUE_RETRY_BACKOFF", 2.0))
+        self.max_delay = float(app.config.get("MAIL_QUEUE_RETRY_MAX_DELAY", 60.0))
+        self._queue = queue.Queue(maxsize=int(app.config.get("MAIL_QUEUE_MAXSIZE", 100)))
+        app.extensions["mail_queue"] = self
+        atexit.register(self.shutdown)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(self, message, description=""):
+        """
+        Queue a message for background delivery.
+
+        When the queue is disabled the message is delivered inline in a
+        single attempt, as before.
+
+        Args:
+            message: A ``flask_mail.Message``.
+            description: Short text identifying the message in logs
+                         (e.g. the customer's email address).
+
+        Returns:
+            True if the message was queued (or delivered inline), False
+            if it was dropped because the queue is full.
+        """
+        job = _Job(message, description)
+        if not self.enabled:
+            self._deliver(job, inline=True)
+            return True
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count("dropped")
+            logger.error(
+                "Mail queue full — dropping message for %s.  Contents:\n%s",
+                description,
+                message.body,
+            )
+            return False
+
+        self._count("enqueued")
+        return True
+
+    def stats(self):
+        """
+        Return a snapshot of the queue metrics.
+
+        Returns:
+            A dict with ``depth`` plus the ``enqueued``, ``sent``,
+            ``retried``, ``failed`` and ``dropped`` counters.
+        """
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["depth"] = self._queue.qsize() if self._queue is not None else 0
+        return snapshot
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued message has been handled.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait forever.
+
+        Returns:
+            True if the queue drained, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue is not None and self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=10.0):
+        """
+        Give queued messages a chance to go out before the process exits.
+
+        Args:
+            timeout: Maximum seconds to wait for the queue to drain.
+        """
+        if self._pid != os.getpid() or not self._threads:
+            return
+        if not self.join(timeout):
+            logger.error(
+                "Mail queue shutdown with %d message(s) undelivered.",
+                self._queue.qsize(),
+            )
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ensure_workers(self):
+        """Start worker threads in this process if not already running."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the inherited queue may hold copies of the
+            # parent's jobs; start from an empty one.
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    name="mail-queue-%d" % index,
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def _worker(self):
+        """Deliver queued messages forever."""
+        while True:
+            job = self._queue.get()
+            try:
+                with self.app.app_context():
+                    self._deliver(job)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Unexpected error in mail queue worker.")
+            finally:
+                self._queue.task_done()
+                self._report_depth()
+
+    def _send(self, message):
+        """Hand one message to the transport, timing it for /metrics."""
+        metrics = self.app.extensions.get("metrics")
+        if metrics is None:
+            self.transport(message)
+            return
+        with metrics.timer("quote_email_seconds", "smtp_send"):
+            self.transport(message)
+
+    def _deliver(self, job, inline=False):
+        """
+        Send one message, retrying transient failures with backoff.
+
+        Args:
+            job: The ``_Job`` to deliver.
+            inline: True when called from a request thread (no retries,
+                    so the request is not held up by backoff sleeps).
+        """
+        max_attempts = 1 if inline else self.max_retries + 1
+        while True:
+            job.attempts += 1
+            try:
+                self._send(job.message)
+            except PERMANENT_ERRORS as exc:
+                error = exc
+                break
+            except (smtplib.SMTPException, OSError) as exc:
+                error = exc
+                if job.attempts >= max_attempts:
+                    break
+                delay = min(self.max_delay, self.backoff * 2 ** (job.attempts - 1))
+                self._count("retried")
+                logger.warning(
+                    "Mail delivery for %s failed (attempt %d); retrying in %.1fs.",
+                    job.description,
+                    job.attempts,
+                    delay,
+                )
+                time.sleep(delay)
+                continue
+            except Exception as exc:  # pylint: disable=broad-except
+                # Anything else (bad message, library bug) is not
+                # worth retrying and must not crash the request.
+                error = exc
+                break
+            else:
+                self._count("sent")
+                logger.info(
+                    "Email sent to %s for %s.",
+                    ", ".join(job.message.recipients),
+                    job.description,
+                )
+                return
+
+        # Out of retries or a permanent error.  Log the full traceback
+        # and message so the lead survives in the application logs.
+        self._count("failed")
+        logger.error(
+            "Failed to send email for %s after %d attempt(s).  Contents:\n%s",
+            job.description,
+            job.attempts,
+            job.message.body,
+            exc_info=error,
+        )
+
+    def _count(self, name):
+        """Increment one of the delivery counters (also on /metrics)."""
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.inc("mail_queue_messages_total", name)
+        if name == "enqueued":
+            self._report_depth()
+
+    def _report_depth(self):
+        """Publish this process's queue depth to /metrics."""
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None and self._queue is not None:
+            metrics.set("mail_queue_depth", None, self._queue.qsize())
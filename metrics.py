@@ -0,0 +1,432 @@
+"""
+Prometheus-style metrics for the Ironforge Welding website.
+
+Records, per worker process:
+
+* ``http_request_duration_seconds{endpoint}`` — request latency
+  histogram for every endpoint in the URL map;
+* ``template_render_seconds{template}`` — time inside
+  ``render_template`` per template (via Flask's template signals);
+* ``quote_email_seconds{step}`` — time in ``send_quote_email`` on the
+  request thread and in the SMTP send on the mail queue thread;
+* ``http_errors_total{status}`` — responses from the 404/429/500
+  handlers in ``app.py``;
+* ``contact_submissions_total{outcome}`` — quote form submissions
+  accepted or dropped by ``spam_filter.py``;
+* ``mail_queue_messages_total{event}`` and the ``mail_queue_depth``
+  gauge — background email delivery (see ``mail_queue.py``).
+
+and serves the sum over all workers at ``/metrics`` in the Prometheus
+text format.
+
+Cheap enough to leave on: every metric/label pair is assigned a fixed
+slot range when the app is created, so recording an observation is a
+``bisect`` plus three float increments into a preallocated array — no
+per-request allocation and no growth.  Labels not known at start-up are
+recorded under ``other``.
+
+Multi-worker aggregation: each process keeps its array in an mmap'd
+file ``METRICS_DIR/worker-<pid>.bin`` (default ``instance/metrics``);
+the file is opened lazily and reopened after a fork.  ``/metrics``
+reads and sums every file with a matching layout.  When a process opens
+its file it adopts the files of dead workers (e.g. ones recycled by
+``SERVE_MAX_REQUESTS``): their values are added to its own and the
+files removed, so totals never go backwards and the directory holds
+about one file per live process.
+
+``/metrics`` requires ``Authorization: Bearer <token>`` when
+``METRICS_TOKEN`` is set.  Without a token it answers direct loopback
+clients only: requests carrying ``X-Forwarded-For`` or ``Forwarded``
+came through a reverse proxy (which connects from loopback itself) and
+are refused.
+"""
+
+import bisect
+import hashlib
+import hmac
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from flask import Response, abort, before_render_template, g, request, template_rendered
+
+from mail_queue import EVENTS as MAIL_EVENTS
+from spam_filter import OUTCOMES as SPAM_OUTCOMES
+
+# Histogram bucket upper bounds in seconds (+Inf is implicit).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Slots per histogram series: one per bucket, +Inf, sum and count.
+HISTOGRAM_SLOTS = len(BUCKETS) + 3
+
+# File header: magic and layout hash, so files from a different layout
+# (e.g. an older deploy) are ignored.
+HEADER = struct.Struct("<8s8s")
+MAGIC = b"IFMETRC1"
+
+# Label used for values not registered at start-up.
+OTHER = "other"
+
+# name -> (label name, help text).
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("endpoint", "Request latency by endpoint."),
+    "template_render_seconds": ("template", "Time spent rendering each template."),
+    "quote_email_seconds": ("step", "Time spent sending quote notification email."),
+}
+COUNTERS = {
+    "http_errors_total": ("status", "Error responses by status code."),
+    "contact_submissions_total": ("outcome", "Quote form submissions by spam-filter outcome."),
+    "mail_queue_messages_total": ("event", "Background mail queue events."),
+}
+# Unlabelled; each worker stores its latest value and /metrics sums them.
+GAUGES = {
+    "mail_queue_depth": (None, "Quote emails waiting in the background mail queue."),
+}
+
+# Loopback addresses allowed to scrape when no token is configured.
+LOOPBACK = {"127.0.0.1", "::1"}
+
+# Headers a reverse proxy adds; their presence means the loopback peer
+# is the proxy, not the scraper.
+PROXY_HEADERS = ("X-Forwarded-For", "Forwarded", "X-Real-IP")
+
+
+class Metrics:
+    """
+    Fixed-layout, mmap-backed metrics shared across worker processes.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`, which must run after the blueprints are registered
+    so every endpoint gets its own series.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.token = ""
+
+        self._offsets = {}
+        self._gauge_offsets = set()
+        self._series = []
+        self._size = 0
+        self._layout = b""
+        self._values = None
+        self._mmap = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """
+        Build the slot layout and hook request, template and error timing.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.enabled = app.config.get("METRICS_ENABLED", False)
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+
+        self.directory = app.config.get("METRICS_DIR") or os.path.join(
+            app.instance_path, "metrics"
+        )
+        self.token = app.config.get("METRICS_TOKEN", "")
+        os.makedirs(self.directory, exist_ok=True)
+
+        app.add_url_rule("/metrics", endpoint="metrics", view_func=self.serve)
+        limiter = app.extensions.get("limiter")
+        for lim in limiter or ():
+            lim.exempt(app.view_functions["metrics"])
+
+        endpoints = sorted(rule.endpoint for rule in app.url_map.iter_rules())
+        templates = app.jinja_env.list_templates(extensions=("html",))
+        self._build_layout(
+            {
+                "http_request_duration_seconds": endpoints,
+                "template_render_seconds": templates,
+                "quote_email_seconds": ["send_quote_email", "smtp_send"],
+                "http_errors_total": ["404", "429", "500"],
+                "contact_submissions_total": list(SPAM_OUTCOMES),
+                "mail_queue_messages_total": list(MAIL_EVENTS),
+                "mail_queue_depth": [None],
+            }
+        )
+
+        # First in line, so requests rejected by an earlier hook (e.g.
+        # the rate limiter's 429) are timed too.
+        app.before_request_funcs.setdefault(None, []).insert(0, self._start_timer)
+        app.after_request(self._stop_timer)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.logger.info("Metrics ENABLED at /metrics (%d series).", len(self._series))
+
+    def _build_layout(self, labels):
+        """Assign every (metric, label) pair its slot range."""
+        offset = 0
+        for name in list(HISTOGRAMS) + list(COUNTERS) + list(GAUGES):
+            width = HISTOGRAM_SLOTS if name in HISTOGRAMS else 1
+            names = labels[name] if name in GAUGES else set(labels[name]) | {OTHER}
+            for label in sorted(names):
+                if name in GAUGES:
+                    self._gauge_offsets.add(offset)
+                self._offsets[(name, label)] = offset
+                self._series.append((name, label, offset))
+                offset += width
+        self._size = offset
+        layout = repr(self._series).encode("utf-8") + repr(BUCKETS).encode("utf-8")
+        self._layout = hashlib.sha1(layout).digest()[:8]
+
+    # ------------------------------------------------------------------
+    # Per-process storage
+    # ------------------------------------------------------------------
+
+    def _worker_values(self):
+        """Return this process's slot array, opening its file if needed."""
+        if self._pid == os.getpid():
+            return self._values
+        with self._lock:
+            if self._pid != os.getpid():
+                path = os.path.join(self.directory, "worker-%d.bin" % os.getpid())
+                length = HEADER.size + self._size * 8
+                with open(path, "w+b") as f:
+                    f.truncate(length)
+                    self._mmap = mmap.mmap(f.fileno(), length)
+                self._mmap[: HEADER.size] = HEADER.pack(MAGIC, self._layout)
+                self._values = memoryview(self._mmap)[HEADER.size :].cast("d")
+                self._pid = os.getpid()
+                self._adopt_dead_worker_files(self._values)
+        return self._values
+
+    def _adopt_dead_worker_files(self, values):
+        """
+        Fold the files of processes that no longer exist into ``values``.
+
+        Each dead file is first claimed by renaming it, which only one
+        of several workers starting together can do, so nothing is
+        counted twice.  Gauges describe the dead process and are not
+        carried over; files with another layout are just removed.
+
+        Args:
+            values: This process's slot array.
+        """
+        expected = HEADER.pack(MAGIC, self._layout)
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".bin")):
+                continue
+            try:
+                pid = int(name[len("worker-") : -len(".bin")])
+                os.kill(pid, 0)
+                continue  # Still running.
+            except ValueError:
+                continue
+            except PermissionError:
+                continue  # Alive, owned by another user.
+            except ProcessLookupError:
+                pass
+
+            path = os.path.join(self.directory, name)
+            claimed = "%s.%d.adopt" % (path, os.getpid())
+            try:
+                os.rename(path, claimed)
+                with open(claimed, "rb") as f:
+                    data = f.read()
+                os.remove(claimed)
+            except OSError:
+                continue  # Adopted by another worker.
+            if data[: HEADER.size] != expected or len(data) != HEADER.size + self._size * 8:
+                continue
+            for i, value in enumerate(array("d", data[HEADER.size :])):
+                if i not in self._gauge_offsets:
+                    values[i] += value
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def observe(self, name, label, seconds):
+        """
+        Record one observation in a histogram.
+
+        Args:
+            name: Histogram name (a key of ``HISTOGRAMS``).
+            label: Label value; unknown values count as ``other``.
+            seconds: The observed duration.
+        """
+        if not self.enabled:
+            return
+        offset = self._offsets.get((name, label))
+        if offset is None:
+            offset = self._offsets[(name, OTHER)]
+        values = self._worker_values()
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            values[offset + bucket] += 1
+            values[offset + HISTOGRAM_SLOTS - 2] += seconds
+            values[offset + HISTOGRAM_SLOTS - 1] += 1
+
+    def inc(self, name, label, amount=1):
+        """
+        Increment a counter.
+
+        Args:
+            name: Counter name (a key of ``COUNTERS``).
+            label: Label value; unknown values count as ``other``.
+            amount: How much to add.
+        """
+        if not self.enabled:
+            return
+        offset = self._offsets.get((name, label))
+        if offset is None:
+            offset = self._offsets[(name, OTHER)]
+        values = self._worker_values()
+        with self._lock:
+            values[offset] += amount
+
+    def set(self, name, label, value):
+        """
+        Set this process's value of a gauge.
+
+        Args:
+            name: Gauge name (a key of ``GAUGES``).
+            label: Label value (``None`` for unlabelled gauges).
+            value: The current value.
+        """
+        if not self.enabled:
+            return
+        offset = self._offsets[(name, label)]
+        values = self._worker_values()
+        with self._lock:
+            values[offset] = value
+
+    @contextmanager
+    def timer(self, name, label):
+        """Time the enclosed block into histogram ``name``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - started)
+
+    # ------------------------------------------------------------------
+    # Hooks
+    # ------------------------------------------------------------------
+
+    def _start_timer(self):
+        g.metrics_started = time.perf_counter()
+
+    def _stop_timer(self, response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            self.observe(
+                "http_request_duration_seconds",
+                request.endpoint or OTHER,
+                time.perf_counter() - started,
+            )
+        return response
+
+    def _template_started(self, _app, template, **_extra):
+        g.setdefault("metrics_templates", []).append(time.perf_counter())
+
+    def _template_finished(self, _app, template, **_extra):
+        stack = g.get("metrics_templates")
+        if stack:
+            self.observe(
+                "template_render_seconds",
+                template.name,
+                time.perf_counter() - stack.pop(),
+            )
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def aggregate(self):
+        """
+        Sum the slot arrays of every worker with the current layout.
+
+        Returns:
+            An ``array('d')`` of ``self._size`` totals.
+        """
+        totals = array("d", bytes(self._size * 8))
+        expected = HEADER.pack(MAGIC, self._layout)
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".bin")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if data[: HEADER.size] != expected or len(data) != HEADER.size + self._size * 8:
+                continue
+            values = array("d", data[HEADER.size :])
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+    def render(self):
+        """Return every series in the Prometheus text exposition format."""
+        totals = self.aggregate()
+        lines = []
+        current = None
+        for name, label, offset in self._series:
+            if name in HISTOGRAMS:
+                kind, (label_name, help_text) = "histogram", HISTOGRAMS[name]
+            elif name in COUNTERS:
+                kind, (label_name, help_text) = "counter", COUNTERS[name]
+            else:
+                kind, (label_name, help_text) = "gauge", GAUGES[name]
+            if name != current:
+                lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, kind))
+                current = name
+            if label_name is None:
+                lines.append("%s %s" % (name, _number(totals[offset])))
+                continue
+            labels = '%s="%s"' % (label_name, _escape(label))
+            if kind != "histogram":
+                lines.append("%s{%s} %s" % (name, labels, _number(totals[offset])))
+                continue
+            cumulative = 0.0
+            for i, bound in enumerate(BUCKETS + (None,)):
+                cumulative += totals[offset + i]
+                lines.append(
+                    '%s_bucket{%s,le="%s"} %s'
+                    % (name, labels, "+Inf" if bound is None else repr(bound), _number(cumulative))
+                )
+            lines.append("%s_sum{%s} %s" % (name, labels, repr(totals[offset + HISTOGRAM_SLOTS - 2])))
+            lines.append("%s_count{%s} %s" % (name, labels, _number(totals[offset + HISTOGRAM_SLOTS - 1])))
+        return "\n".join(lines) + "\n"
+
+    def serve(self):
+        """The ``/metrics`` view (direct loopback or bearer token only)."""
+        if self.token:
+            supplied = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied, "Bearer " + self.token):
+                abort(403)
+        elif request.remote_addr not in LOOPBACK or any(
+            header in request.headers for header in PROXY_HEADERS
+        ):
+            abort(403)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _escape(value):
+    """Escape a label value for the exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    """Format a count without a trailing ``.0``."""
+    return "%d" % value if value == int(value) else repr(value)
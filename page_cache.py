@@ -0,0 +1,414 @@
+"""
+Rendered-page cache for the Ironforge Welding website.
+
+The home, services and gallery pages are pure functions of the content
+lists defined in ``routes/`` and the Jinja templates, so re-rendering
+them on every request is wasted work.  This module provides a small,
+bounded, in-process cache of fully rendered pages:
+
+* Entries are keyed by endpoint, host and the *normalised* values of
+  the query arguments a view declares (e.g. the gallery ``category``
+  slug): stripped, then mapped by the view's ``normalise`` callable to
+  the values it will actually render (e.g. case-folded), so
+  ``?category=x1``, ``?category=x2`` ... share the fallback page's
+  entry instead of each taking a slot.  Requests carrying any other
+  query argument bypass the cache.
+* The cache holds at most ``PAGE_CACHE_MAX_ENTRIES`` pages and evicts
+  the least recently used entry when full.
+* Every cached page depends on the template files on disk plus any
+  extra version sources registered with :meth:`PageCache.depends_on`.
+  When one of them changes the whole cache is dropped.
+* Concurrent misses for the same key are collapsed ("single flight")
+  so a cold cache under a burst renders each page exactly once.
+* Requests that have flashed messages waiting are never served from,
+  nor stored in, the cache — those messages are per-visitor.
+
+Per-session values that appear in the shared page are "holes": while a
+page renders for the cache they come out as placeholders, which are
+substituted on every request, so one visitor never receives another
+visitor's token.  The CSRF token (``base.html`` and the quote form) is
+built in; other extensions add theirs with :meth:`PageCache.add_hole`
+(e.g. the quote form's signed timestamp, see ``spam_filter.py``).  That
+is what lets the contact page be cached: the shell is rendered once and
+each request costs a string substitution.
+
+Each served page records itself and its hole values in
+``g.page_cache_entry``, so ``compression.py`` can compress the fixed
+parts of a page once and reuse them on every hit, and ``cache_policy.py``
+can derive the ETag from the shell.  A page rendered outside the cache
+records the hole values it printed with :func:`note_hole_value` instead.
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, request, session
+from flask_wtf.csrf import generate_csrf
+
+# Module-level logger for the cache.
+logger = logging.getLogger(__name__)
+
+# Placeholder rendered in place of the per-session CSRF token while a
+# page is being rendered for the shared cache.
+CSRF_PLACEHOLDER = "__PAGE_CACHE_CSRF_TOKEN__"
+
+
+class CachedPage:
+    """
+    A single rendered page stored in the cache.
+
+    Attributes:
+        body: The rendered HTML, still containing hole placeholders.
+        status: The HTTP status code the view returned.
+        created_at: ``time.time()`` when the page was rendered.
+        encoded: Compressed forms of ``body`` by Content-Encoding, filled
+                 in on first use by ``compression.py``.
+    """
+
+    __slots__ = ("body", "status", "created_at", "encoded")
+
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+        self.created_at = time.time()
+        self.encoded = {}
+
+
+class _Flight:
+    """Book-keeping for one in-progress render shared by waiting requests."""
+
+    __slots__ = ("event", "page")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.page = None
+
+
+class PageCache:
+    """
+    Bounded LRU cache of rendered pages with single-flight rendering.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`, like the other Flask extensions.
+    """
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._version_sources = []
+        self._holes = {CSRF_PLACEHOLDER: generate_csrf}
+        self._version = None
+        self._next_check = 0.0
+
+        self.enabled = False
+        self.max_entries = 64
+        self.ttl = 0
+        self.check_interval = 2.0
+        self.hits = 0
+        self.misses = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def init_app(self, app):
+        """
+        Read cache settings from the app config and hook into Jinja.
+
+        Must be called after ``csrf.init_app(app)`` so the CSRF template
+        global can be wrapped.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.enabled = app.config.get("PAGE_CACHE_ENABLED", False)
+        self.max_entries = max(1, int(app.config.get("PAGE_CACHE_MAX_ENTRIES", 64)))
+        self.ttl = float(app.config.get("PAGE_CACHE_TTL", 0))
+        self.check_interval = float(app.config.get("PAGE_CACHE_CHECK_INTERVAL", 2.0))
+
+        # Any change to a template file invalidates every cached page.
+        template_dir = os.path.join(app.root_path, app.template_folder or "templates")
+        self.depends_on(functools.partial(tree_signature, template_dir))
+
+        # Render the CSRF token as a placeholder while filling the cache.
+        original_csrf_token = app.jinja_env.globals.get("csrf_token", generate_csrf)
+
+        def csrf_token():
+            if g.get("page_cache_rendering"):
+                return CSRF_PLACEHOLDER
+            return note_hole_value(original_csrf_token())
+
+        # Flask-WTF exposes csrf_token both as a Jinja global and through
+        # a context processor; override both (later processors win).
+        app.jinja_env.globals["csrf_token"] = csrf_token
+        app.context_processor(lambda: {"csrf_token": csrf_token})
+
+        app.extensions["page_cache"] = self
+        app.logger.info(
+            "Page cache %s (max %d entries).",
+            "ENABLED" if self.enabled else "DISABLED",
+            self.max_entries,
+        )
+
+    def add_hole(self, placeholder, fill):
+        """
+        Register a per-request value that cached pages leave open.
+
+        The template helper producing the value must emit ``placeholder``
+        instead while ``g.page_cache_rendering`` is set.
+
+        Args:
+            placeholder: Unique marker string rendered into cached pages.
+            fill: Zero-argument callable returning this request's value.
+        """
+        self._holes[placeholder] = fill
+
+    def depends_on(self, source):
+        """
+        Register an extra version source for every cached page.
+
+        Args:
+            source: A zero-argument callable returning a hashable value.
+                    When the value changes, the cache is cleared.
+        """
+        self._version_sources.append(source)
+
+    # ------------------------------------------------------------------
+    # Cache operations
+    # ------------------------------------------------------------------
+
+    def fill_holes(self, page):
+        """
+        Fill the per-request holes in a cached page.
+
+        Args:
+            page: The ``CachedPage`` to serve.
+
+        Returns:
+            A tuple of (html, holes): the final HTML string for this
+            request and a dict mapping each placeholder found in the
+            page to the value it was replaced with.
+        """
+        body = page.body
+        holes = {}
+        for placeholder, fill in self._holes.items():
+            if placeholder in body:
+                holes[placeholder] = fill()
+                body = body.replace(placeholder, holes[placeholder])
+        return body, holes
+
+    def clear(self):
+        """Drop every cached page."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self):
+        """Clear the cache if a template or registered source changed."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        version = tuple(source() for source in self._version_sources)
+        if version != self._version:
+            if self._version is not None:
+                logger.info("Page cache dependencies changed — clearing cache.")
+            self.clear()
+            self._version = version
+
+    def get(self, key):
+        """
+        Return the cached page for ``key`` or ``None``.
+
+        Expired entries are discarded; hits are moved to the MRU end.
+        """
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                return None
+            if self.ttl and time.time() - page.created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def set(self, key, page):
+        """Store ``page`` under ``key``, evicting the LRU entry if full."""
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached page for ``key``, rendering it at most once.
+
+        If another thread is already rendering the same key, wait for
+        its result instead of rendering again.  If that render fails
+        the waiter falls back to rendering on its own.
+
+        Args:
+            key: The cache key.
+            render: Zero-argument callable producing a ``CachedPage``.
+
+        Returns:
+            A tuple of (page: CachedPage, hit: bool).
+        """
+        self._check_version()
+
+        page = self.get(key)
+        if page is not None:
+            self.hits += 1
+            return page, True
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+
+        if not leader:
+            flight.event.wait(timeout=30)
+            if flight.page is not None:
+                self.hits += 1
+                return flight.page, True
+            return render(), False
+
+        self.misses += 1
+        try:
+            page = render()
+            if page.status == 200:
+                self.set(key, page)
+                flight.page = page
+            return page, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+
+# ---------------------------------------------------------------------------
+# View decorator
+# ---------------------------------------------------------------------------
+
+
+def cached_page(query_args=(), normalise=None):
+    """
+    Serve the decorated view from the shared page cache.
+
+    Args:
+        query_args: Names of the query arguments that affect the page.
+                    Their stripped values form the cache key.  Requests
+                    carrying any other query argument are rendered
+                    normally and not cached.
+        normalise: Optional callable taking that ``{name: value}`` dict
+                   and returning the values the view will really use
+                   (e.g. an unknown category replaced by its fallback),
+                   or None to render the request without caching it.
+
+    Returns:
+        The decorator.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get("page_cache")
+            if (
+                cache is None
+                or not cache.enabled
+                or "_flashes" in session
+                or any(name not in query_args for name in request.args)
+            ):
+                return view(*args, **kwargs)
+
+            values = {
+                name: request.args.get(name, "").strip() for name in query_args
+            }
+            if normalise is not None:
+                values = normalise(values)
+                if values is None:
+                    return view(*args, **kwargs)
+
+            key = (
+                request.endpoint,
+                request.host_url,
+                tuple(sorted(values.items())),
+                tuple(sorted(kwargs.items())),
+            )
+
+            def render():
+                g.page_cache_rendering = True
+                try:
+                    rv = make_response(view(*args, **kwargs))
+                finally:
+                    g.page_cache_rendering = False
+                return CachedPage(rv.get_data(as_text=True), rv.status_code)
+
+            page, hit = cache.get_or_render(key, render)
+            body, holes = cache.fill_holes(page)
+            response = make_response(body, page.status)
+            # Lets compression.py reuse the page's compressed bytes.
+            g.page_cache_entry = (page, holes)
+            response.headers["X-Page-Cache"] = "HIT" if hit else "MISS"
+            # The page last changed when it was rendered into the cache.
+            response.last_modified = page.created_at
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def note_hole_value(value):
+    """
+    Record a per-request value printed into a page rendered uncached.
+
+    ``cache_policy.py`` blanks these values out of the body before
+    computing its ETag, so the page still validates on the next visit.
+
+    Args:
+        value: The string written into the page (e.g. a CSRF token).
+
+    Returns:
+        ``value`` unchanged.
+    """
+    g.setdefault("page_hole_values", set()).add(value)
+    return value
+
+
+def tree_signature(root):
+    """
+    Return a cheap signature of every file under ``root``.
+
+    Args:
+        root: Directory to scan.
+
+    Returns:
+        A tuple of (file count, newest mtime, total size).
+    """
+    count = 0
+    newest = 0.0
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            count += 1
+            newest = max(newest, stat.st_mtime)
+            total += stat.st_size
+    return (count, newest, total)
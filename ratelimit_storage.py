@@ -0,0 +1,279 @@
+"""
+SQLite storage backend for Flask-Limiter.
+
+With ``RATELIMIT_STORAGE_URI = "memory://"`` every worker process keeps
+its own counters, so N workers allow N times the configured limit.
+Redis is not available on our host, so this module registers a
+``sqlite://`` storage scheme with the ``limits`` library that keeps the
+counters in one local database file shared by every worker:
+
+* Each update runs in a ``BEGIN IMMEDIATE`` transaction, which takes
+  SQLite's write lock up front, so check-and-increment is atomic across
+  processes and threads.
+* The database runs in WAL mode with ``synchronous=OFF``.  Counters are
+  short-lived and losing them in a power cut is harmless, so commits
+  never wait on an fsync.
+* Fixed-window counters live in a ``WITHOUT ROWID`` table keyed by the
+  limit key; moving-window hits live in an events table indexed by
+  (key, timestamp).  Expired rows are swept at most once a minute.
+
+URIs follow the SQLAlchemy convention: ``sqlite:///relative/path.db`` or
+``sqlite:////absolute/path.db``.
+
+Importing this module is enough to register the scheme; ``extensions.py``
+does so before the limiter is initialised.  ``benchmarks/ratelimit_storage.py``
+compares it with ``memory://``.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import MovingWindowSupport, Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_events_key_ts ON events (key, ts);
+"""
+
+# Seconds between sweeps of expired counters and events.
+SWEEP_INTERVAL = 60.0
+
+
+def parse_path(uri):
+    """
+    Extract the database path from a ``sqlite://`` URI.
+
+    Args:
+        uri: E.g. ``sqlite:////srv/app/instance/ratelimit.sqlite3``.
+
+    Returns:
+        The filesystem path.
+    """
+    path = uri.split("://", 1)[1]
+    # "sqlite:///x.db" -> "x.db" (relative); "sqlite:////x.db" -> "/x.db".
+    return path[1:] if path.startswith("/") else path
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """
+    Rate-limit storage shared by every process on the host via SQLite.
+
+    Supports the ``fixed-window`` and ``moving-window`` strategies.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=5.0, **options):
+        """
+        Args:
+            uri: A ``sqlite://`` URI naming the database file.
+            wrap_exceptions: Wrap SQLite errors in ``limits.errors.StorageError``.
+            timeout: Seconds to wait for another process's write lock.
+        """
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = parse_path(uri)
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._next_sweep = 0.0
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # ------------------------------------------------------------------
+    # Connection handling
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        """Return this thread's connection, reopening it after a fork."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _transaction(self):
+        """Begin an immediate (write-locked) transaction."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+    def _maybe_sweep(self, connection, now):
+        """Delete expired rows, at most once per SWEEP_INTERVAL per process."""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + SWEEP_INTERVAL
+        connection.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        # Moving-window limits here are at most a day long.
+        connection.execute("DELETE FROM events WHERE ts <= ?", (now - 86400,))
+
+    # ------------------------------------------------------------------
+    # Fixed window
+    # ------------------------------------------------------------------
+
+    def incr(self, key, expiry, amount=1):
+        """
+        Increment a counter, starting a new window if it has expired.
+
+        Args:
+            key: The rate-limit key.
+            expiry: Window length in seconds.
+            amount: How much to add.
+
+        Returns:
+            The counter value after incrementing.
+        """
+        now = time.time()
+        connection = self._transaction()
+        try:
+            row = connection.execute(
+                "SELECT value, expires_at FROM counters WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                value = row[0] + amount
+                connection.execute(
+                    "UPDATE counters SET value = ? WHERE key = ?", (value, key)
+                )
+            else:
+                value = amount
+                connection.execute(
+                    "INSERT OR REPLACE INTO counters (key, value, expires_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, value, now + expiry),
+                )
+            self._maybe_sweep(connection, now)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def get(self, key):
+        """Return the current (unexpired) counter value for ``key``."""
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        """Return when the counter for ``key`` expires (epoch seconds)."""
+        row = self._connection().execute(
+            "SELECT expires_at FROM counters WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    # ------------------------------------------------------------------
+    # Moving window
+    # ------------------------------------------------------------------
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        """
+        Record ``amount`` hits if the moving window has room for them.
+
+        Args:
+            key: The rate-limit key.
+            limit: Hits allowed per window.
+            expiry: Window length in seconds.
+            amount: Hits to record.
+
+        Returns:
+            True if the hits were recorded, False if over the limit.
+        """
+        if amount > limit:
+            return False
+        now = time.time()
+        connection = self._transaction()
+        try:
+            connection.execute(
+                "DELETE FROM events WHERE key = ? AND ts <= ?", (key, now - expiry)
+            )
+            (count,) = connection.execute(
+                "SELECT COUNT(*) FROM events WHERE key = ?", (key,)
+            ).fetchone()
+            allowed = count + amount <= limit
+            if allowed:
+                connection.executemany(
+                    "INSERT INTO events (key, ts) VALUES (?, ?)",
+                    [(key, now)] * amount,
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed
+
+    def get_moving_window(self, key, limit, expiry):
+        """
+        Return the start of the moving window and the hits inside it.
+
+        Args:
+            key: The rate-limit key.
+            limit: Hits allowed per window (unused; kept for the API).
+            expiry: Window length in seconds.
+
+        Returns:
+            A tuple of (oldest hit timestamp, number of hits).
+        """
+        now = time.time()
+        oldest, count = self._connection().execute(
+            "SELECT MIN(ts), COUNT(*) FROM events WHERE key = ? AND ts > ?",
+            (key, now - expiry),
+        ).fetchone()
+        if not count:
+            return now, 0
+        return oldest, count
+
+    # ------------------------------------------------------------------
+    # Housekeeping
+    # ------------------------------------------------------------------
+
+    def check(self):
+        """Return True if the database answers a trivial query."""
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        """Delete every counter and event; return how many were removed."""
+        connection = self._transaction()
+        try:
+            removed = connection.execute("DELETE FROM counters").rowcount
+            removed += connection.execute("DELETE FROM events").rowcount
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def clear(self, key):
+        """Forget every counter and event for ``key``."""
+        connection = self._transaction()
+        try:
+            connection.execute("DELETE FROM counters WHERE key = ?", (key,))
+            connection.execute("DELETE FROM events WHERE key = ?", (key,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
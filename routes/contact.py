@@ -1,10 +1,12 @@
 """
 Contact / Quote Request blueprint for the Ironforge Welding website.
 
-Handles both GET (render the form) and POST (process the submission)
-requests.  When MAIL_ENABLED is true in the app config, form
-submissions are emailed to the business owner via Flask-Mail.
-Otherwise they are logged to the console (useful during development).
+Handles both GET (render the form, served from the page cache) and
+POST (process the submission) requests.  When MAIL_ENABLED is true in
+the app config, form submissions are emailed to the business owner via
+Flask-Mail, through the background mail queue so the visitor is
+redirected immediately.  Otherwise they are logged to the console
+(useful during development).
 
 Rate limiting is applied to the POST endpoint to prevent abuse.
 """
@@ -20,11 +22,18 @@ from flask import (
     request,
     url_for,
 )
-from flask_mail import Message
 
-# Import the shared limiter and mail instances so the decorator and
-# the send function can be used from this module.
-from extensions import limiter, mail
+# Import the shared limiter, mail queue/digest, spam filter and submission
+# store so the decorator and the send function can be used from this module.
+from extensions import (
+    limiter,
+    mail_digest,
+    mail_queue,
+    metrics,
+    spam_filter,
+    submission_store,
+)
+from page_cache import cached_page
 
 # Module-level logger for this blueprint.
 logger = logging.getLogger(__name__)
@@ -42,6 +51,12 @@ VALID_SERVICE_TYPES = {
     "other",
 }
 
+# Flashed after a submission (also after a silently dropped one).
+THANKS_MESSAGE = (
+    "Thanks, %s! Your quote request has been received. "
+    "We'll be in touch within 24 hours."
+)
+
 # Human-readable labels for the notification email.
 SERVICE_LABELS = {
     "mig": "MIG Welding",
@@ -97,8 +112,10 @@ def send_quote_email(name, email, phone, service_type, message_body):
     Send a quote-request notification email to the business owner.
 
     If MAIL_ENABLED is false the email content is logged instead.
-    Any SMTP errors are caught and logged so the user still sees a
-    success message (the submission is not lost — it's in the logs).
+    Otherwise the message is queued for background delivery (or held
+    for the next digest when MAIL_DIGEST_WINDOW is set); SMTP errors
+    are retried and, if delivery finally fails, the full message is
+    logged so the submission is not lost.
 
     Args:
         name: Customer's full name.
@@ -136,9 +153,18 @@ def send_quote_email(name, email, phone, service_type, message_body):
         )
         return
 
+    # Deferred: flask_mail is only imported when mail is enabled.
+    from flask_mail import Message  # pylint: disable=import-outside-toplevel
+
     recipient = current_app.config.get("QUOTE_RECIPIENT_EMAIL")
     subject = "New Quote Request from %s" % name
 
+    # In digest mode the notification waits to be folded into a single
+    # email with any others arriving in the same window.
+    if mail_digest.enabled:
+        mail_digest.add(subject, body_text, reply_to=email, description=email)
+        return
+
     msg = Message(
         subject=subject,
         recipients=[recipient],
@@ -146,28 +172,22 @@ def send_quote_email(name, email, phone, service_type, message_body):
         reply_to=email,  # Let the owner reply straight to the customer.
     )
 
-    try:
-        mail.send(msg)
-        logger.info(
-            "Quote notification email sent to %s for customer %s.",
-            recipient,
-            email,
-        )
-    except Exception:  # pylint: disable=broad-except
-        # Log the full traceback so we can diagnose SMTP issues without
-        # crashing the request.  The user still gets a success flash —
-        # the submission is preserved in the application logs.
-        logger.exception(
-            "Failed to send quote notification email for customer %s.",
-            email,
-        )
+    # Hand the message to the background queue; delivery, retries and
+    # failure logging happen off the request thread (see mail_queue.py).
+    mail_queue.submit(msg, description=email)
 
 
 @contact_bp.route("/contact", methods=["GET"])
+@cached_page()
 def contact():
     """
     Render the contact / quote request form.
 
+    The empty form is served from the page cache; the CSRF token and the
+    spam filter's form timestamp are filled in per request.  Redirects
+    back here after a submission carry a flash message and so bypass
+    the cache.
+
     Returns:
         Rendered HTML for the contact page.
     """
@@ -194,6 +214,14 @@ def contact_submit():
     """
     logger.info("Contact form submitted (POST).")
 
+    # Bots and resubmissions stop here, before validation, storage or
+    # any mail work.  They get the normal "thanks" so they learn nothing.
+    dropped = spam_filter.check(request.form)
+    if dropped:
+        logger.info("Quote submission dropped by spam filter (%s).", dropped)
+        flash(THANKS_MESSAGE % request.form.get("name", "").strip(), "success")
+        return redirect(url_for("contact.contact"))
+
     is_valid, errors = validate_contact_form(request.form)
 
     if not is_valid:
@@ -224,13 +252,18 @@ def contact_submit():
         phone,
     )
 
+    # Persist the lead first so it survives even if the email fails.
+    submission_store.record(
+        name, email, phone, service_type, message_body, request.remote_addr
+    )
+    # Only now does the message count for the duplicate check, so a
+    # resubmission after a validation error is not dropped.
+    spam_filter.remember(request.form)
+
     # Attempt to send (or log) the notification email.
-    send_quote_email(name, email, phone, service_type, message_body)
+    with metrics.timer("quote_email_seconds", "send_quote_email"):
+        send_quote_email(name, email, phone, service_type, message_body)
 
-    flash(
-        "Thanks, " + name + "! Your quote request has been received. "
-        "We'll be in touch within 24 hours.",
-        "success",
-    )
+    flash(THANKS_MESSAGE % name, "success")
 
     return redirect(url_for("contact.contact"))
@@ -1,161 +1,174 @@
 """
 Portfolio / Gallery page blueprint for the Ironforge Welding website.
 
-Renders a filterable gallery of completed projects.  Project data is
-defined here as placeholder content for the prototype; in production
-this would come from a database or CMS with admin-uploaded photos.
+Renders a filterable gallery of completed projects.  Projects and
+categories are loaded from ``content/projects.json`` and
+``content/categories.json`` by the content store (see ``content.py``).
+
+Projects are grouped by category once per content load, into a
+``GalleryIndex``.  Both the HTML page and the ``/api/gallery`` JSON
+endpoint serve pages of ``GALLERY_PAGE_SIZE`` projects from that index
+using an opaque cursor (the id of the first project on the next page),
+so a request costs a dict lookup and a slice regardless of how large
+the portfolio grows.
 """
 
 import logging
 
-from flask import Blueprint, render_template, request
+from flask import Blueprint, current_app, jsonify, render_template, request
+
+from extensions import content_store, image_meta, responsive_images
+from page_cache import cached_page
 
 # Module-level logger for this blueprint.
 logger = logging.getLogger(__name__)
 
 gallery_bp = Blueprint("gallery", __name__)
 
-# Valid categories used for client-side filtering buttons.
-CATEGORIES = [
-    {"slug": "all", "label": "All Projects"},
-    {"slug": "fabrication", "label": "Fabrication"},
-    {"slug": "repair", "label": "Repair"},
-    {"slug": "structural", "label": "Structural"},
-    {"slug": "decorative", "label": "Decorative"},
-]
-
-# Placeholder portfolio items for the prototype.
-# Each item maps to an image in static/images/ and a filter category.
-PROJECTS = [
-    {
-        "id": "proj-1",
-        "title": "Custom Driveway Gate",
-        "category": "fabrication",
-        "image": "driveway-gate.jpg",
-        "image_alt": (
-            "Ornamental wrought-iron driveway gate with scrollwork "
-            "detail, installed between stone pillars"
-        ),
-        "description": (
-            "Hand-built double-swing driveway gate with decorative "
-            "scrollwork. Powder-coated satin black for durability."
-        ),
-    },
-    {
-        "id": "proj-2",
-        "title": "Trailer Frame Repair",
-        "category": "repair",
-        "image": "trailer-frame.jpg",
-        "image_alt": (
-            "Repaired flatbed trailer frame showing fresh weld beads "
-            "on reinforced cross-members"
-        ),
-        "description": (
-            "Cracked cross-members on a 24-foot flatbed trailer. "
-            "Cut out the damaged sections, plated and re-welded. "
-            "Back on the road the same week."
-        ),
-    },
-    {
-        "id": "proj-3",
-        "title": "Staircase Railing",
-        "category": "decorative",
-        "image": "stair-railing.jpg",
-        "image_alt": (
-            "Modern steel staircase railing with clean horizontal "
-            "steel runs in a residential interior"
-        ),
-        "description": (
-            "Contemporary steel railing for a two-story "
-            "interior staircase. Brushed stainless steel"
-            "posts with horizontal brushed stainless infill."
-        ),
-    },
-    {
-        "id": "proj-4",
-        "title": "Structural Beam Reinforcement",
-        "category": "structural",
-        "image": "i-beam-weld.jpg",
-        "image_alt": (
-            "Heavy steel I-beam with fresh gusset plates welded "
-            "at the connection point inside a commercial building"
-        ),
-        "description": (
-            "Gusset plate reinforcement on load-bearing I-beam "
-            "connections for a commercial renovation. Passed "
-            "structural inspection on the first attempt."
-        ),
-    },
-    {
-        "id": "proj-5",
-        "title": "Custom Fire Pit",
-        "category": "fabrication",
-        "image": "custom-fire-pit.jpg",
-        "image_alt": (
-            "Square steel fire pit with decorative cut-out patterns "
-            "firewood stacked inside, set on a sand patio"
-        ),
-        "description": (
-            "36-inch square fire pit. Finished with high-heat " "clear coat."
-        ),
-    },
-    {
-        "id": "proj-6",
-        "title": "Equipment Repair",
-        "category": "repair",
-        "image": "equipment-repair.jpg",
-        "image_alt": (
-            "Professional welder repairing a cracked excavator scoop "
-            "with heavy-duty welding equipment in a workshop"
-        ),
-        "description": (
-            "Structural repair and reinforcement of a worn excavator "
-            "scoop. Cracks were welded, weak points rebuilt, and "
-            "high-wear areas reinforced to restore strength and "
-            "extend the life of the equipment."
-        ),
-    },
-]
+# ``sizes`` attribute for gallery card images (one column on phones,
+# ~380px cards otherwise).  Shared by the template and the JSON API.
+GALLERY_IMAGE_SIZES = "(max-width: 768px) 100vw, 380px"
+
+
+def _requested_category(index):
+    """
+    Read and validate the ``category`` query argument.
+
+    Args:
+        index: The ``GalleryIndex`` of the current content snapshot.
+
+    Returns:
+        A valid slug, falling back to ``"all"`` if unrecognised.
+    """
+    category = request.args.get("category", "all").strip().lower()
+    if category not in index.slugs:
+        logger.warning(
+            "Unknown gallery category '%s'. Falling back to 'all'.",
+            category,
+        )
+        category = "all"
+    return category
+
+
+def _cache_args(values):
+    """
+    Normalise the gallery query for the page-cache key.
+
+    Unknown categories and cursors render the same fallback page as
+    ``all`` / the first page, so they share its cache entry.
+
+    Args:
+        values: Stripped ``category`` and ``cursor``.  Slugs are
+            matched case-insensitively; cursors are project ids, which
+            keep their case.
+
+    Returns:
+        The values :func:`gallery` will actually render.
+    """
+    index = content_store.snapshot().gallery
+    category = values["category"].lower() or "all"
+    if category not in index.slugs:
+        category = "all"
+    cursor = values["cursor"]
+    if cursor and cursor not in index.positions[category]:
+        cursor = ""
+    return {"category": category, "cursor": cursor}
+
+
+def _page_size():
+    """Return the configured number of projects per page."""
+    return max(1, int(current_app.config.get("GALLERY_PAGE_SIZE", 12)))
 
 
 @gallery_bp.route("/gallery")
+@cached_page(query_args=("category", "cursor"), normalise=_cache_args)
 def gallery():
     """
     Render the portfolio / gallery page.
 
-    Accepts an optional ``category`` query parameter for server-side
-    filtering (the page also supports client-side JS filtering).
+    Accepts optional ``category`` and ``cursor`` query parameters for
+    server-side filtering and pagination.  With JavaScript enabled,
+    ``main.js`` filters and loads further pages through ``/api/gallery``
+    instead; the "Load more" link is the fallback.
 
     Returns:
         Rendered HTML for the gallery page.
     """
-    # Read optional category filter from query string.
-    active_category = request.args.get("category", "all").strip().lower()
-
-    # Validate category — fall back to "all" if unrecognised.
-    valid_slugs = {cat["slug"] for cat in CATEGORIES}
-    if active_category not in valid_slugs:
-        logger.warning(
-            "Unknown gallery category '%s'. Falling back to 'all'.",
-            active_category,
-        )
-        active_category = "all"
+    content = content_store.snapshot()
+    active_category = _requested_category(content.gallery)
+    cursor = request.args.get("cursor", "").strip() or None
 
-    # Filter projects if a specific category was requested.
-    if active_category == "all":
-        filtered_projects = PROJECTS
-    else:
-        filtered_projects = [p for p in PROJECTS if p["category"] == active_category]
+    try:
+        projects, next_cursor = content.gallery.page(active_category, cursor, _page_size())
+    except KeyError:
+        # Stale or hand-edited link — start from the first page.
+        logger.warning("Unknown gallery cursor '%s'. Showing first page.", cursor)
+        projects, next_cursor = content.gallery.page(active_category, None, _page_size())
 
     logger.info(
         "Gallery page requested — category: '%s', showing %d projects.",
         active_category,
-        len(filtered_projects),
+        len(projects),
     )
 
     return render_template(
         "gallery.html",
-        projects=filtered_projects,
-        categories=CATEGORIES,
+        projects=projects,
+        categories=content.categories,
         active_category=active_category,
+        next_cursor=next_cursor,
+        image_sizes=GALLERY_IMAGE_SIZES,
+    )
+
+
+@gallery_bp.route("/api/gallery")
+def gallery_api():
+    """
+    Return one page of gallery projects as compact JSON.
+
+    Query parameters are the same as for :func:`gallery`.  The response
+    is ``{"category", "sizes", "items": [...], "next"}``, where ``next``
+    is the cursor for the following page (or null) and each item carries
+    the image ``src``/``srcset`` ready for an ``<img>`` element, plus its
+    intrinsic ``width``/``height`` and a ``placeholder`` style (see
+    ``image_meta.py``).
+
+    Returns:
+        A JSON response, or a 400 JSON error for an unknown cursor.
+    """
+    content = content_store.snapshot()
+    category = _requested_category(content.gallery)
+    cursor = request.args.get("cursor", "").strip() or None
+
+    try:
+        projects, next_cursor = content.gallery.page(category, cursor, _page_size())
+    except KeyError:
+        return jsonify(error="unknown cursor"), 400
+
+    items = []
+    for project in projects:
+        filename = "images/" + project.image
+        src, srcset = responsive_images.image_attributes(filename)
+        width, height = image_meta.dimensions(project.image)
+        items.append(
+            {
+                "id": project.id,
+                "title": project.title,
+                "category": project.category,
+                "description": project.description,
+                "alt": project.image_alt,
+                "src": src,
+                "srcset": srcset,
+                "full": responsive_images.image_url(filename, 1600),
+                "width": width,
+                "height": height,
+                "placeholder": image_meta.placeholder_style(project.image),
+            }
+        )
+
+    return jsonify(
+        category=category,
+        sizes=GALLERY_IMAGE_SIZES,
+        items=items,
+        next=next_cursor,
     )
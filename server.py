@@ -0,0 +1,682 @@
+"""
+Pre-forking production server for the Ironforge Welding website.
+
+``python app.py`` runs Werkzeug's single-process development server.
+For production on a plain Linux box (no gunicorn, no systemd unit
+required) run::
+
+    python server.py [--bind 127.0.0.1:8000] [--workers N] [--threads N]
+
+The master process binds the socket and preloads
+``create_app("production")`` once, so workers start already warm and
+share the loaded code copy-on-write.  It then forks ``--workers``
+processes that accept from the shared socket.  Each worker serves up to
+``--threads`` requests concurrently, so a quote POST waiting on SMTP
+does not hold up page views, and keeps idle HTTP/1.1 connections open
+for ``--keep-alive`` seconds.
+
+* A worker that has served ``--max-requests`` requests (plus a random
+  jitter) stops accepting, finishes what it has, and exits; the master
+  forks its replacement at once.
+* A worker that dies is replaced; one that dies straight after starting
+  is replaced after a short delay so a broken deploy does not spin.
+* ``SIGTERM`` / ``SIGINT`` stop gracefully: workers finish in-flight
+  requests (up to ``--graceful-timeout`` seconds) before exiting.
+* ``SIGHUP`` reloads with no downtime.  The master first checks that
+  the code on disk still starts (in a throw-away subprocess), then
+  re-executes itself under the same pid, keeping the listening socket.
+  The old workers keep serving while the new master preloads; once its
+  workers are up the old ones are stopped gracefully.  If the check
+  fails the old code keeps running and the error is logged.
+
+With ``--early-hints`` the server gives the app a ``wsgi.early_hints``
+callable, so ``early_hints.py`` sends ``103 Early Hints`` before each
+page.
+
+Behind a reverse proxy such as nginx, set ``PROXY_FIX_X_FOR`` to the
+number of proxies (usually 1); otherwise every request appears to come
+from the proxy's address and all visitors share one rate limit.
+
+Defaults come from the ``SERVE_*`` settings in ``config.py``; options
+given on the command line win.  Unix only (it uses ``fork``).
+"""
+
+import atexit
+import errno
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+from config import CONFIG_MAP
+from early_hints import EARLY_HINTS_ENVIRON_KEY
+from log_pipeline import BackgroundQueueHandler
+
+logger = logging.getLogger("server")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Handed from the old master image to the re-executed one on SIGHUP.
+LISTEN_FD_ENV = "SERVE_LISTEN_FD"
+OLD_WORKERS_ENV = "SERVE_OLD_WORKERS"
+
+# Socket timeout while reading a request when keep-alive is off.
+REQUEST_TIMEOUT = 30.0
+
+# A worker exiting this soon after it started counts as a crash; its
+# replacement waits CRASH_BACKOFF seconds.
+CRASH_WINDOW = 2.0
+CRASH_BACKOFF = 1.0
+
+
+def parse_bind(bind):
+    """
+    Split ``"host:port"`` (or ``"[v6addr]:port"``) into its parts.
+
+    Args:
+        bind: The address to listen on.
+
+    Returns:
+        A tuple of (host, port).
+
+    Raises:
+        click.BadParameter: If the port is missing or not a number.
+    """
+    host, _sep, port = bind.rpartition(":")
+    if not host or not port.isdigit():
+        raise click.BadParameter("expected HOST:PORT, got %r" % bind, param_hint="--bind")
+    return host.strip("[]"), int(port)
+
+
+def _quiesce_logging():
+    """
+    Flush and stop the log listener thread before forking or exec.
+
+    A thread holding a lock at fork time leaves that lock held forever
+    in the child.  The listener restarts on the next log line.
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, BackgroundQueueHandler):
+            handler.stop()
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+
+class RequestHandler(WSGIRequestHandler):
+    """
+    Werkzeug's handler with HTTP/1.1 keep-alive and early hints.
+
+    Werkzeug's handler always sends ``Connection: close`` and, after the
+    response, discards whatever else is readable on the socket.  For a
+    kept-alive connection the request body is read through a stream that
+    stops at ``Content-Length``, so that discard can never swallow the
+    next request; requests with chunked bodies still close.
+
+    Access lines come from the ``requests`` logger in ``log_pipeline.py``,
+    so Werkzeug's own per-request line is not written.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.timeout = self.server.keep_alive or REQUEST_TIMEOUT
+        self.keep_alive = False
+        self.status = None
+        super().setup()
+        # Headers and body go out in separate writes; without this the
+        # body waits for the client's delayed ACK on a kept-alive socket.
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def run_wsgi(self):
+        length = self.headers.get("Content-Length") or "0"
+        self.keep_alive = (
+            not self.close_connection
+            and length.isdigit()
+            and "chunked" not in self.headers.get("Transfer-Encoding", "").lower()
+            and self.server.can_keep_alive()
+        )
+        if not self.keep_alive:
+            return super().run_wsgi()
+        rfile = self.rfile
+        self.rfile = LimitedStream(rfile, int(length))
+        try:
+            super().run_wsgi()
+            self.rfile.exhaust()
+        finally:
+            self.rfile = rfile
+        if self.status is None or self.status >= 500:
+            self.close_connection = True
+        return None
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if self.keep_alive and keyword.lower() == "connection" and value.lower() == "close":
+            return
+        super().send_header(keyword, value)
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        # A stopping worker closes each connection after its response.
+        if self.server.stopping:
+            self.close_connection = True
+
+    def make_environ(self):
+        environ = super().make_environ()
+        if self.server.early_hints and self.request_version == "HTTP/1.1":
+            environ[EARLY_HINTS_ENVIRON_KEY] = self.send_early_hints
+        return environ
+
+    def send_early_hints(self, headers):
+        """
+        Write a ``103 Early Hints`` interim response.
+
+        Args:
+            headers: List of (name, value) tuples, e.g. ``Link`` headers.
+        """
+        lines = ["HTTP/1.1 103 Early Hints"]
+        lines.extend("%s: %s" % header for header in headers)
+        self.wfile.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def log_request(self, code="-", size="-"):
+        pass
+
+    def log_error(self, format, *args):  # pylint: disable=redefined-builtin
+        # An idle keep-alive connection timing out is routine.
+        if not format.startswith("Request timed out"):
+            super().log_error(format, *args)
+
+
+class WorkerServer(BaseWSGIServer):
+    """
+    One worker's server: the shared socket, a bounded thread pool.
+
+    A connection is only accepted while a thread is free, so a busy
+    worker leaves new connections to its siblings.  An idle kept-alive
+    connection holds its thread, so connections are only kept alive
+    while another thread is free and nobody is waiting to connect.
+
+    Args:
+        app: The preloaded WSGI application.
+        listener: The master's listening socket.
+        threads: Requests handled concurrently.
+        keep_alive: Idle keep-alive timeout in seconds (0 disables).
+        max_requests: Stop after this many requests (0 = never).
+        early_hints: Offer ``wsgi.early_hints`` to the app.
+        multiprocess: Other workers share the socket.
+        on_stop: Called once when the worker starts stopping.
+    """
+
+    multithread = True
+
+    def __init__(self, app, listener, threads, keep_alive, max_requests,
+                 early_hints, multiprocess, on_stop):
+        self.multiprocess = multiprocess
+        host, port = listener.getsockname()[:2]
+        super().__init__(host, port, self._count, handler=RequestHandler, fd=listener.fileno())
+        # Every worker wakes for a new connection; the losers' accept()
+        # must fail instead of blocking.
+        self.socket.setblocking(False)
+
+        self.wsgi_app = app
+        self.threads = threads
+        self.keep_alive = keep_alive
+        self.max_requests = max_requests
+        self.early_hints = early_hints
+        self.on_stop = on_stop
+        self.stopping = False
+        self.handled = 0
+        self.busy = 0  # Threads holding a connection.
+        self._count_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="request")
+
+    def _count(self, environ, start_response):
+        """WSGI wrapper counting requests towards ``max_requests``."""
+        with self._count_lock:
+            self.handled += 1
+            recycle = self.max_requests and self.handled == self.max_requests
+        if recycle:
+            self.stop("served %d requests" % self.handled)
+        return self.wsgi_app(environ, start_response)
+
+    def get_request(self):
+        if not self._slots.acquire(timeout=0.5):
+            raise OSError(errno.EAGAIN, "all request threads busy")
+        try:
+            connection = super().get_request()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._count_lock:
+            self.busy += 1
+        return connection
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._count_lock:
+                self.busy -= 1
+            self._slots.release()
+
+    def can_keep_alive(self):
+        """Return True if a connection may stay open after this response."""
+        if self.stopping or not self.keep_alive or self.busy >= self.threads:
+            return False
+        # Connections already queued on the socket would have to wait.
+        readable, _w, _x = select.select([self.socket], [], [], 0)
+        return not readable
+
+    def stop(self, reason):
+        """
+        Stop accepting connections; in-flight requests carry on.
+
+        Safe to call from a signal handler or a request thread.
+
+        Args:
+            reason: Logged with the worker's pid.
+        """
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Worker %d stopping: %s.", os.getpid(), reason)
+        self.on_stop()
+        # shutdown() waits for serve_forever(), so never call it from
+        # the thread running that loop.
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self, timeout):
+        """
+        Wait for every request thread to finish.
+
+        Args:
+            timeout: Maximum seconds to wait.
+
+        Returns:
+            True if all requests finished in time.
+        """
+        deadline = time.monotonic() + timeout
+        for _index in range(self.threads):
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+
+def run_worker(app, listener, settings, master_pid, retire_fd):
+    """
+    Serve requests until stopped; the body of a forked worker.
+
+    Args:
+        app: The preloaded WSGI application.
+        listener: The shared listening socket.
+        settings: The resolved server settings (see :func:`serve`).
+        master_pid: Stop if the parent process goes away.
+        retire_fd: Pipe to the master; the pid is written to it when the
+                   worker starts stopping, so a replacement is forked
+                   without waiting for the exit.
+
+    Returns:
+        The process exit status.
+    """
+    pid = os.getpid()
+
+    def announce_stop():
+        try:
+            os.write(retire_fd, b"%d\n" % pid)
+        except OSError:
+            pass  # The master was re-executed; it already knows.
+
+    max_requests = settings["max_requests"]
+    if max_requests:
+        max_requests += random.randint(0, settings["max_requests_jitter"])
+    server = WorkerServer(
+        app,
+        listener,
+        threads=settings["threads"],
+        keep_alive=settings["keep_alive"],
+        max_requests=max_requests,
+        early_hints=settings["early_hints"],
+        multiprocess=settings["workers"] > 1,
+        on_stop=announce_stop,
+    )
+    signal.signal(signal.SIGTERM, lambda _sig, _frame: server.stop("SIGTERM"))
+    # Ctrl-C and terminal hang-ups reach the whole process group; the
+    # master decides what happens.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    def watch_master():
+        while not server.stopping:
+            if os.getppid() != master_pid:
+                server.stop("master exited")
+            time.sleep(1.0)
+
+    threading.Thread(target=watch_master, name="watch-master", daemon=True).start()
+    server.serve_forever()
+    if not server.drain(settings["graceful_timeout"]):
+        logger.warning("Worker %d exiting with requests still running.", pid)
+        return 1
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Master
+# ---------------------------------------------------------------------------
+
+
+class Master:
+    """
+    Forks, watches, recycles and reloads the workers.
+
+    Args:
+        app: The preloaded WSGI application.
+        listener: The bound, listening socket.
+        settings: The resolved server settings (see :func:`serve`).
+    """
+
+    def __init__(self, app, listener, settings):
+        self.app = app
+        self.listener = listener
+        self.settings = settings
+        self.workers = {}  # pid -> time.monotonic() at fork
+        self.retiring = {}  # pid -> deadline for SIGKILL
+        self._signals = []
+        self._next_spawn = 0.0
+        self._wake_r, self._wake_w = os.pipe()
+        self._retire_r, self._retire_w = os.pipe()
+
+    def run(self, old_workers=()):
+        """
+        Serve until SIGTERM/SIGINT.
+
+        Args:
+            old_workers: Pids of the previous generation after a
+                         reload; stopped once the new workers are up.
+
+        Returns:
+            The process exit status.
+        """
+        os.set_blocking(self._wake_w, False)
+        signal.set_wakeup_fd(self._wake_w)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, self._on_signal)
+
+        self._spawn_missing()
+        for pid in old_workers:
+            self._retire(pid)
+
+        while True:
+            self._reap()
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    return self.stop()
+                if signum == signal.SIGHUP:
+                    self.reload()
+            self._kill_overdue()
+            self._spawn_missing()
+            self._wait(1.0)
+
+    def _on_signal(self, signum, _frame):
+        if signum != signal.SIGCHLD:
+            self._signals.append(signum)
+
+    def _wait(self, timeout):
+        """Sleep until a signal, a retiring worker, or ``timeout``."""
+        readable, _w, _x = select.select([self._wake_r, self._retire_r], [], [], timeout)
+        if self._wake_r in readable:
+            os.read(self._wake_r, 4096)
+        if self._retire_r in readable:
+            for line in os.read(self._retire_r, 4096).split():
+                pid = int(line)
+                if pid in self.workers:
+                    del self.workers[pid]
+                    self.retiring[pid] = time.monotonic() + self.settings["graceful_timeout"]
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _spawn_missing(self):
+        while len(self.workers) < self.settings["workers"] and time.monotonic() >= self._next_spawn:
+            self._spawn()
+
+    def _spawn(self):
+        _quiesce_logging()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                for fd in (self._wake_r, self._wake_w, self._retire_r):
+                    os.close(fd)
+                status = run_worker(
+                    self.app, self.listener, self.settings, os.getppid(), self._retire_w
+                )
+            except BaseException:  # pylint: disable=broad-except
+                logger.exception("Worker %d failed.", os.getpid())
+            finally:
+                # os._exit() skips atexit; run it for the mail queue,
+                # submission store and log queue to flush.
+                atexit._run_exitfuncs()  # pylint: disable=protected-access
+                os._exit(status)  # pylint: disable=protected-access
+        self.workers[pid] = time.monotonic()
+        logger.info("Booted worker %d.", pid)
+
+    def _retire(self, pid):
+        """Ask a worker to stop gracefully."""
+        self.workers.pop(pid, None)
+        self.retiring.setdefault(pid, time.monotonic() + self.settings["graceful_timeout"])
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.retiring.pop(pid, None)
+
+    def _kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                logger.warning("Worker %d did not stop in time; killing it.", pid)
+                self.retiring[pid] = float("inf")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _reap(self):
+        """Collect exited workers."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            code = os.waitstatus_to_exitcode(status)
+            started = self.workers.pop(pid, None)
+            self.retiring.pop(pid, None)
+            if started is None:
+                logger.info("Worker %d exited (status %d).", pid, code)
+                continue
+            logger.error("Worker %d died unexpectedly (status %d).", pid, code)
+            if time.monotonic() - started < CRASH_WINDOW:
+                self._next_spawn = time.monotonic() + CRASH_BACKOFF
+
+    # ------------------------------------------------------------------
+    # Stop / reload
+    # ------------------------------------------------------------------
+
+    def stop(self):
+        """
+        Stop every worker gracefully, killing stragglers at the deadline.
+
+        A second SIGTERM/SIGINT kills them at once.
+
+        Returns:
+            The process exit status.
+        """
+        logger.info("Shutting down %d worker(s).", len(self.workers))
+        for pid in list(self.workers):
+            self._retire(pid)
+        while self.retiring:
+            self._reap()
+            if any(s in (signal.SIGTERM, signal.SIGINT) for s in self._signals):
+                self._signals.clear()
+                for pid in self.retiring:
+                    self.retiring[pid] = 0.0
+            self._kill_overdue()
+            if self.retiring:
+                self._wait(0.2)
+        self.listener.close()
+        logger.info("Server stopped.")
+        return 0
+
+    def reload(self):
+        """
+        Re-execute the master with the code on disk; no downtime.
+
+        Returns without reloading if the new code fails to start.
+        """
+        logger.info("SIGHUP: checking that the new code starts.")
+        check = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import app; app.create_app(%r)" % self.settings["config"],
+            ],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=300,
+            check=False,
+        )
+        if check.returncode != 0:
+            logger.error(
+                "Reload aborted; the new code does not start:\n%s",
+                "\n".join(check.stderr.decode("utf-8", "replace").splitlines()[-20:]),
+            )
+            return
+
+        old = sorted(set(self.workers) | set(self.retiring))
+        logger.info("Reloading master %d; %d old worker(s) keep serving.", os.getpid(), len(old))
+        os.environ[LISTEN_FD_ENV] = str(self.listener.fileno())
+        os.environ[OLD_WORKERS_ENV] = ",".join(str(pid) for pid in old)
+        os.set_inheritable(self.listener.fileno(), True)
+        _quiesce_logging()
+        os.execv(sys.executable, sys.orig_argv)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def _listener(host, port):
+    """Return the socket inherited across a reload, or bind a new one."""
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited is not None:
+        listener = socket.socket(fileno=int(inherited))
+        os.set_inheritable(listener.fileno(), False)
+        return listener
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=2048)
+
+
+@click.command("serve")
+@click.option("--config", "config_name", default="production", show_default=True,
+              help="Configuration name passed to create_app().")
+@click.option("--bind", default=None, help="HOST:PORT to listen on [SERVE_BIND].")
+@click.option("--workers", type=int, default=None,
+              help="Worker processes; 0 = one per CPU [SERVE_WORKERS].")
+@click.option("--threads", type=int, default=None,
+              help="Concurrent requests per worker [SERVE_THREADS].")
+@click.option("--keep-alive", type=float, default=None,
+              help="Idle keep-alive timeout in seconds; 0 disables [SERVE_KEEPALIVE].")
+@click.option("--max-requests", type=int, default=None,
+              help="Recycle a worker after this many requests; 0 = never "
+                   "[SERVE_MAX_REQUESTS].")
+@click.option("--graceful-timeout", type=float, default=None,
+              help="Seconds a stopping worker may take [SERVE_GRACEFUL_TIMEOUT].")
+@click.option("--early-hints/--no-early-hints", default=None,
+              help="Send 103 Early Hints [SERVE_EARLY_HINTS].")
+@click.option("--pid-file", type=click.Path(dir_okay=False), default=None,
+              help="Write the master's pid here (for kill -HUP).")
+def serve(config_name, bind, workers, threads, keep_alive, max_requests,
+          graceful_timeout, early_hints, pid_file):
+    """Run the site with a pre-forking, multi-threaded server."""
+    config_class = CONFIG_MAP.get(config_name)
+    if config_class is None:
+        raise click.BadParameter("unknown config %r" % config_name, param_hint="--config")
+    host, port = parse_bind(bind or config_class.SERVE_BIND)
+    listener = _listener(host, port)
+
+    # Deferred so a bad --bind fails before the app is loaded.
+    from app import create_app  # pylint: disable=import-outside-toplevel
+
+    app = create_app(config_name)
+    config = app.config
+
+    def pick(value, key):
+        return config[key] if value is None else value
+
+    settings = {
+        "config": config_name,
+        "workers": pick(workers, "SERVE_WORKERS") or os.cpu_count() or 1,
+        "threads": max(1, pick(threads, "SERVE_THREADS")),
+        "keep_alive": pick(keep_alive, "SERVE_KEEPALIVE"),
+        "max_requests": pick(max_requests, "SERVE_MAX_REQUESTS"),
+        "max_requests_jitter": config["SERVE_MAX_REQUESTS_JITTER"],
+        "graceful_timeout": pick(graceful_timeout, "SERVE_GRACEFUL_TIMEOUT"),
+        "early_hints": pick(early_hints, "SERVE_EARLY_HINTS"),
+    }
+    if pid_file:
+        tmp_path = "%s.%d.tmp" % (pid_file, os.getpid())
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            handle.write("%d\n" % os.getpid())
+        os.replace(tmp_path, pid_file)
+
+    old_workers = [int(pid) for pid in os.environ.pop(OLD_WORKERS_ENV, "").split(",") if pid]
+    logger.info(
+        "Serving on http://%s:%d (master %d, %d worker(s) x %d thread(s)).",
+        host if ":" not in host else "[%s]" % host,
+        listener.getsockname()[1],
+        os.getpid(),
+        settings["workers"],
+        settings["threads"],
+    )
+    status = Master(app, listener, settings).run(old_workers)
+    if pid_file:
+        try:
+            os.remove(pid_file)
+        except OSError:
+            pass
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    serve()  # pylint: disable=no-value-for-parameter
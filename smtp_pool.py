@@ -0,0 +1,213 @@
+"""
+Pooled, reusable SMTP connections for outbound email.
+
+Flask-Mail's ``mail.send()`` opens a new SMTP session for every message:
+TCP connect, STARTTLS and LOGIN cost more than the message itself.  The
+pool keeps a few authenticated ``flask_mail.Connection`` objects alive
+and hands them out to the mail queue workers:
+
+* A connection idle for longer than ``MAIL_POOL_IDLE_TIMEOUT`` is closed
+  instead of reused (servers drop idle sessions anyway).
+* A connection idle for longer than ``MAIL_POOL_HEALTH_CHECK_AFTER`` is
+  probed with ``NOOP`` before reuse.
+* If a reused connection turns out to be dead mid-send, the message is
+  retried once on a fresh connection before the error is reported.
+
+Sockets must not be shared across processes, so the pool discards
+anything it holds when it notices it is running in a forked child.
+"""
+
+import atexit
+import logging
+import os
+import smtplib
+import threading
+import time
+
+from flask import current_app
+
+# Module-level logger for the connection pool.
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    """A live Flask-Mail connection plus the time it was last used."""
+
+    __slots__ = ("connection", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """
+    Keeps authenticated SMTP sessions alive between messages.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+
+    Args:
+        mail: The Flask-Mail ``Mail`` instance whose settings are used.
+    """
+
+    def __init__(self, mail, app=None):
+        self.mail = mail
+        self.enabled = False
+        self.max_idle = 2
+        self.idle_timeout = 120.0
+        self.health_check_after = 10.0
+        self.opened = 0
+        self.reused = 0
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Read pool settings from the app config.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.enabled = app.config.get("MAIL_POOL_ENABLED", False)
+        self.max_idle = max(1, int(app.config.get("MAIL_POOL_SIZE", 2)))
+        self.idle_timeout = float(app.config.get("MAIL_POOL_IDLE_TIMEOUT", 120.0))
+        self.health_check_after = float(
+            app.config.get("MAIL_POOL_HEALTH_CHECK_AFTER", 10.0)
+        )
+        app.extensions["smtp_pool"] = self
+        atexit.register(self.close_all)
+
+    # ------------------------------------------------------------------
+    # Sending
+    # ------------------------------------------------------------------
+
+    def send(self, message):
+        """
+        Send one message over a pooled connection.
+
+        Must be called inside an app context, like ``mail.send()``.
+
+        Args:
+            message: A ``flask_mail.Message``.
+
+        Raises:
+            smtplib.SMTPException or OSError: If delivery fails on a
+            fresh connection.
+        """
+        pooled, reused = self._acquire()
+        try:
+            pooled.connection.send(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self._discard(pooled)
+            if not reused:
+                raise
+            # The server closed a session we thought was alive; one more
+            # try on a brand-new connection.
+            logger.info("Pooled SMTP connection was stale; reconnecting.")
+            pooled, _reused = self._acquire(fresh=True)
+            try:
+                pooled.connection.send(message)
+            except BaseException:
+                self._discard(pooled)
+                raise
+        except BaseException:
+            self._discard(pooled)
+            raise
+        self._release(pooled)
+
+    # ------------------------------------------------------------------
+    # Pool management
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        """Open and authenticate a new connection."""
+        # Deferred: flask_mail is only imported when mail is enabled.
+        from flask_mail import Connection  # pylint: disable=import-outside-toplevel
+
+        state = current_app.extensions["mail"]
+        connection = Connection(state)
+        connection.host = None if state.suppress else connection.configure_host()
+        self.opened += 1
+        return _PooledConnection(connection)
+
+    def _acquire(self, fresh=False):
+        """
+        Take a healthy idle connection or open a new one.
+
+        Args:
+            fresh: Skip the idle list and always open a new connection.
+
+        Returns:
+            A tuple of (pooled connection, was_reused).
+        """
+        self._check_fork()
+        while not fresh:
+            with self._lock:
+                if not self._idle:
+                    break
+                pooled = self._idle.pop()
+
+            idle_for = time.monotonic() - pooled.last_used
+            if idle_for > self.idle_timeout:
+                self._discard(pooled)
+                continue
+            if idle_for > self.health_check_after and not _is_alive(pooled):
+                self._discard(pooled)
+                continue
+
+            self.reused += 1
+            return pooled, True
+
+        return self._open(), False
+
+    def _release(self, pooled):
+        """Return a connection to the pool, or close it if the pool is full."""
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(pooled)
+                return
+        self._discard(pooled)
+
+    def _discard(self, pooled):
+        """Close a connection, ignoring errors from an already-dead socket."""
+        host = pooled.connection.host
+        if host is None:
+            return
+        try:
+            host.quit()
+        except (smtplib.SMTPException, OSError):
+            host.close()
+
+    def _check_fork(self):
+        """Forget (without closing) connections inherited from a parent."""
+        if self._pid != os.getpid():
+            with self._lock:
+                self._idle = []
+                self._pid = os.getpid()
+
+    def close_all(self):
+        """Close every idle connection (called at interpreter exit)."""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+
+def _is_alive(pooled):
+    """Return True if the connection still answers ``NOOP``."""
+    host = pooled.connection.host
+    if host is None:
+        return True
+    try:
+        return host.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
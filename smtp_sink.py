@@ -0,0 +1,191 @@
+"""
+Local SMTP stand-in for development, load tests and mail-queue checks.
+
+Accepts every message on a local port and keeps it in memory instead of
+delivering it, so the quote pipeline can be exercised end-to-end with no
+network access.  It speaks just enough SMTP for ``smtplib`` (and hence
+Flask-Mail): EHLO/HELO, AUTH PLAIN/LOGIN (any credentials), MAIL, RCPT,
+DATA, RSET, NOOP and QUIT.  STARTTLS is not offered, so run the app with
+``MAIL_USE_TLS=false``.
+
+Usage:
+    python smtp_sink.py --port 1025 [--delay 0.5]
+
+    MAIL_ENABLED=true MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 \\
+        MAIL_USE_TLS=false python app.py
+
+In-process use::
+
+    sink = SMTPSink(port=0).start()
+    ... app.config["MAIL_PORT"] = sink.port ...
+    sink.stop()
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SinkMessage:
+    """
+    One message accepted by the sink.
+
+    Attributes:
+        sender: The envelope sender from ``MAIL FROM``.
+        recipients: Envelope recipients from ``RCPT TO``.
+        data: The raw message text (headers and body).
+    """
+
+    __slots__ = ("sender", "recipients", "data")
+
+    def __init__(self, sender, recipients, data):
+        self.sender = sender
+        self.recipients = recipients
+        self.data = data
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Handle one SMTP session."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+
+    def handle(self):
+        sink = self.server.sink
+        sender = None
+        recipients = []
+        self.reply("220 localhost smtp-sink ready")
+
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+
+            if sink.delay:
+                # Simulate a slow remote server.
+                time.sleep(sink.delay)
+
+            if verb == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "AUTH":
+                parts = line.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    # Username, then password, each base64 on its own line.
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply("334 ")
+                    self.rfile.readline()
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                sender = line.split(":", 1)[1].strip() if ":" in line else ""
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(line.split(":", 1)[1].strip() if ":" in line else "")
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    if data_line.startswith(b".."):
+                        data_line = data_line[1:]
+                    lines.append(data_line)
+                sink.add(SinkMessage(sender, recipients, b"".join(lines).decode("utf-8", "replace")))
+                self.reply("250 OK: queued")
+            elif verb in ("RSET", "NOOP"):
+                if verb == "RSET":
+                    sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    Threaded SMTP server that stores every message in memory.
+
+    Args:
+        host: Interface to bind (default loopback only).
+        port: Port to bind; 0 picks a free one (see :attr:`port`).
+        delay: Seconds to sleep before every reply, to mimic a slow
+               remote server.
+    """
+
+    def __init__(self, host="127.0.0.1", port=1025, delay=0.0):
+        self.host = host
+        self.delay = delay
+        self.messages = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def port(self):
+        """The port the sink is actually listening on."""
+        return self._server.server_address[1]
+
+    def add(self, message):
+        """Record an accepted message."""
+        with self._lock:
+            self.messages.append(message)
+
+    def start(self):
+        """Serve in a background thread and return ``self``."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    """Run the sink in the foreground, printing each accepted message."""
+    parser = argparse.ArgumentParser(description="Local SMTP sink.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per reply")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.delay)
+    print("SMTP sink listening on %s:%d" % (args.host, sink.port))
+    seen = 0
+    sink.start()
+    try:
+        while True:
+            time.sleep(0.5)
+            while seen < len(sink.messages):
+                message = sink.messages[seen]
+                print("--- message %d from %s to %s ---" % (seen + 1, message.sender, ", ".join(message.recipients)))
+                print(message.data)
+                seen += 1
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Cheap bot and duplicate filter for the quote form.
+
+Runs at the top of ``contact_submit``, before validation, the
+submission store and any mail work.  A submission is dropped when:
+
+* ``honeypot`` — the hidden ``website`` field, which people never see,
+  was filled in;
+* ``stale_form`` — the signed form timestamp is missing, forged, or
+  older than ``SPAM_MAX_FORM_AGE`` (bots that post without loading the
+  form);
+* ``too_fast`` — the form was submitted less than
+  ``SPAM_MIN_FILL_SECONDS`` after it was rendered;
+* ``duplicate`` — the same message (ignoring case, digits, punctuation
+  and spacing) was accepted within ``SPAM_DEDUPE_TTL`` seconds; for
+  messages under 40 characters only when it came from the same
+  address.  The fingerprints live in a bounded per-process TTL cache
+  (``SPAM_DEDUPE_MAX_ENTRIES``) and are only added by
+  :meth:`SpamFilter.remember`, once the submission has passed
+  validation and been stored — a corrected resubmission of a form that
+  failed validation is not a duplicate;
+* ``score`` — a quick heuristic score (links, markup, stock spam
+  phrases, shouting) reaches ``SPAM_SCORE_THRESHOLD``.
+
+A dropped submission gets the same redirect and "thanks" message as a
+real one, so bots learn nothing, and is logged as a single INFO line.
+Outcomes are counted per process in :attr:`SpamFilter.counts` and,
+across workers, as ``contact_submissions_total{outcome}`` on
+``/metrics``.
+
+The timestamp and honeypot are rendered into the form by the
+``spam_fields()`` template global.  The timestamp is a page-cache hole
+(see ``page_cache.py``), so a cached contact page still gets a fresh
+one on every request.  A form re-rendered after a failed POST keeps
+the timestamp it was submitted with, so a quick correction is not
+dropped as ``too_fast``.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import g, request
+from itsdangerous import BadSignature, SignatureExpired, TimestampSigner
+from markupsafe import Markup
+
+from page_cache import note_hole_value
+
+logger = logging.getLogger(__name__)
+
+# Form field names.
+TIMESTAMP_FIELD = "form_ts"
+HONEYPOT_FIELD = "website"
+
+# Rendered in place of the signed timestamp while the contact page is
+# being rendered for the shared page cache.
+FORM_TS_PLACEHOLDER = "__PAGE_CACHE_FORM_TS__"
+
+# Every outcome that is counted ("accepted" plus the drop reasons).
+OUTCOMES = ("accepted", "honeypot", "stale_form", "too_fast", "duplicate", "score")
+
+URL_RE = re.compile(r"https?://|www\.", re.I)
+MARKUP_RE = re.compile(r"<a\s|\[url[=\]]|\[link[=\]]", re.I)
+SPAM_PHRASES_RE = re.compile(
+    r"\b(?:seo|backlinks?|casino|crypto|bitcoin|forex|viagra|cialis|loans?|"
+    r"rank(?:ing)? (?:on|in) google|click here|buy now|limited offer|"
+    r"guest post|web ?design services?)\b",
+    re.I,
+)
+NON_WORD_RE = re.compile(r"[^a-z]+")
+
+
+def fingerprint(text):
+    """
+    Return a digest of ``text`` that ignores case, digits and punctuation.
+
+    "Need a gate welded!!" and "need a gate   welded 2" collide; that
+    is the "near-identical" the duplicate check drops.
+    """
+    normalised = NON_WORD_RE.sub(" ", text.lower()).strip()
+    return hashlib.sha1(normalised.encode("utf-8")).hexdigest()
+
+
+def spam_score(name, email, message):
+    """
+    Score a submission; higher is more likely spam.
+
+    Args:
+        name: The name field.
+        email: The email field.
+        message: The project description.
+
+    Returns:
+        An integer score (0 for an ordinary enquiry).
+    """
+    score = 0
+    links = len(URL_RE.findall(message))
+    # One link can be a photo or a reference; several rarely are.
+    score += 2 * max(0, links - 1) + (1 if links else 0)
+    if MARKUP_RE.search(message):
+        score += 3
+    score += 2 * len(SPAM_PHRASES_RE.findall(message))
+    if URL_RE.search(name) or len(name) > 80:
+        score += 3
+    letters = [c for c in message if c.isalpha()]
+    if len(letters) > 20 and sum(c.isupper() for c in letters) > 0.7 * len(letters):
+        score += 2
+    if email.lower() in message.lower() and links:
+        score += 1
+    return score
+
+
+class TTLCache:
+    """
+    Bounded set of keys that expire ``ttl`` seconds after insertion.
+
+    Keys are kept in insertion order, which with a fixed TTL is also
+    expiry order, so pruning only ever looks at the oldest entries.
+
+    Args:
+        ttl: Seconds each key is remembered.
+        max_entries: Oldest keys are evicted beyond this size.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+            if expires > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def seen(self, keys):
+        """Return True if any of ``keys`` is present (and unexpired)."""
+        with self._lock:
+            self._prune(time.monotonic())
+            return any(key in self._entries for key in keys)
+
+    def add(self, keys):
+        """Remember ``keys`` for ``ttl`` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                self._entries.pop(key, None)
+                self._entries[key] = now + self.ttl
+            self._prune(now)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SpamFilter:
+    """
+    Honeypot, fill-time, duplicate and score checks for quote requests.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.app = None
+        self.signer = None
+        self.min_fill = 3.0
+        self.max_age = 86400
+        self.threshold = 5
+        self.recent = TTLCache(3600, 1024)
+        self.counts = Counter()
+        self._counts_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Read the settings and register the ``spam_fields()`` template global.
+
+        Call after ``page_cache.init_app(app)`` so the timestamp can be
+        registered as a page-cache hole.
+
+        Args:
+            app: The Flask application instance.
+        """
+        self.app = app
+        self.enabled = app.config.get("SPAM_FILTER_ENABLED", True)
+        self.min_fill = float(app.config.get("SPAM_MIN_FILL_SECONDS", 3))
+        self.max_age = int(app.config.get("SPAM_MAX_FORM_AGE", 86400))
+        self.threshold = int(app.config.get("SPAM_SCORE_THRESHOLD", 5))
+        self.recent = TTLCache(
+            float(app.config.get("SPAM_DEDUPE_TTL", 3600)),
+            int(app.config.get("SPAM_DEDUPE_MAX_ENTRIES", 1024)),
+        )
+        self.signer = TimestampSigner(app.config["SECRET_KEY"], salt="contact-form")
+        app.extensions["spam_filter"] = self
+        app.add_template_global(self.spam_fields, "spam_fields")
+        page_cache = app.extensions.get("page_cache")
+        if page_cache is not None:
+            page_cache.add_hole(FORM_TS_PLACEHOLDER, self.form_timestamp)
+        if self.enabled:
+            app.logger.info(
+                "Quote spam filter ENABLED (min fill %.0fs, score threshold %d).",
+                self.min_fill,
+                self.threshold,
+            )
+
+    def form_timestamp(self):
+        """Return a freshly signed timestamp for the form."""
+        return self.signer.sign(b"contact").decode("ascii")
+
+    def submitted_timestamp(self):
+        """Return the POSTed form timestamp if its signature is valid, else None."""
+        if request.method != "POST":
+            return None
+        timestamp = request.form.get(TIMESTAMP_FIELD, "")
+        try:
+            self.signer.unsign(timestamp, max_age=self.max_age)
+        except (BadSignature, SignatureExpired):
+            return None
+        return timestamp
+
+    def spam_fields(self):
+        """The hidden timestamp and honeypot inputs for the quote form."""
+        if not self.enabled:
+            return ""
+        if g.get("page_cache_rendering"):
+            timestamp = FORM_TS_PLACEHOLDER
+        else:
+            # Re-rendered after a failed POST: keep the original time.
+            timestamp = note_hole_value(
+                self.submitted_timestamp() or self.form_timestamp()
+            )
+        return Markup(
+            '<input type="hidden" name="%s" value="%s">\n'
+            '<div class="hp-field" aria-hidden="true">\n'
+            '    <label for="%s">Leave this field empty</label>\n'
+            '    <input type="text" id="%s" name="%s" tabindex="-1" autocomplete="off">\n'
+            "</div>"
+            % (TIMESTAMP_FIELD, timestamp, HONEYPOT_FIELD, HONEYPOT_FIELD, HONEYPOT_FIELD)
+        )
+
+    def check(self, form):
+        """
+        Decide whether a submission goes on to the quote pipeline.
+
+        Nothing is remembered here: call :meth:`remember` once the
+        submission has been validated and stored.
+
+        Args:
+            form: ``request.form``.
+
+        Returns:
+            ``None`` to accept, otherwise the drop reason (one of
+            :data:`OUTCOMES`).
+        """
+        if not self.enabled:
+            return None
+        reason = self._reason(form)
+        if reason:
+            self._count(reason)
+        return reason
+
+    def remember(self, form):
+        """
+        Record an accepted submission for the duplicate check.
+
+        Args:
+            form: ``request.form`` of a validated, stored submission.
+        """
+        if not self.enabled:
+            return
+        self.recent.add(self._dedupe_keys(form))
+        self._count("accepted")
+
+    def _reason(self, form):
+        if form.get(HONEYPOT_FIELD, "").strip():
+            return "honeypot"
+
+        try:
+            _value, signed_at = self.signer.unsign(
+                form.get(TIMESTAMP_FIELD, ""), max_age=self.max_age, return_timestamp=True
+            )
+        except (BadSignature, SignatureExpired):
+            return "stale_form"
+        if time.time() - signed_at.timestamp() < self.min_fill:
+            return "too_fast"
+
+        name = form.get("name", "").strip()
+        email = form.get("email", "").strip().lower()
+        message = form.get("message", "").strip()
+        if spam_score(name, email, message) >= self.threshold:
+            return "score"
+
+        if self.recent.seen(self._dedupe_keys(form)):
+            return "duplicate"
+        return None
+
+    @staticmethod
+    def _dedupe_keys(form):
+        """Return the duplicate-check keys for a submission."""
+        email = form.get("email", "").strip().lower()
+        message = form.get("message", "").strip()
+        # Short stock messages ("please call me") are only duplicates
+        # when they also come from the same address.
+        message_key = fingerprint(message)
+        keys = ["e:%s:%s" % (email, message_key)]
+        if len(message) >= 40:
+            keys.append("m:" + message_key)
+        return keys
+
+    def _count(self, outcome):
+        with self._counts_lock:
+            self.counts[outcome] += 1
+        metrics = self.app.extensions.get("metrics")
+        if metrics is not None:
+            metrics.inc("contact_submissions_total", outcome)
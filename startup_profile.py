@@ -0,0 +1,169 @@
+"""
+Startup profiler for the application factory.
+
+Worker recycles make cold start matter, so ``create_app`` records how
+long each phase takes (config, logging, each extension, blueprints,
+warm-up...) in a :class:`StartupProfile` stored on
+``app.extensions["startup_profile"]``.  ``app.py`` also records how long
+its own imports took.
+
+* ``STARTUP_PROFILE=true`` logs the phase report when the app is created.
+* ``flask startup profile`` prints the phase report together with an
+  import-time breakdown measured in a fresh interpreter
+  (``python -X importtime -c "import app"``), so the numbers reflect a
+  real cold start rather than the already-warm CLI process.
+  ``--json`` emits the same data for CI comparisons.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# CLI group: ``flask startup <command>``.
+startup_cli = AppGroup("startup", help="Inspect application start-up cost.")
+
+
+class StartupProfile:
+    """
+    Ordered list of named start-up phases and their durations.
+
+    Args:
+        imports_ms: Time already spent importing ``app.py``'s
+                    dependencies, recorded as the first phase.
+    """
+
+    def __init__(self, imports_ms=None):
+        self.phases = []
+        if imports_ms is not None:
+            self.phases.append(("imports", imports_ms))
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block as one phase.
+
+        Args:
+            name: Label shown in the report.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000))
+
+    @property
+    def total_ms(self):
+        """Sum of every recorded phase, in milliseconds."""
+        return sum(ms for _name, ms in self.phases)
+
+    def as_dict(self):
+        """Return the phases as a JSON-serialisable dict."""
+        return {
+            "total_ms": round(self.total_ms, 2),
+            "phases": [{"name": name, "ms": round(ms, 2)} for name, ms in self.phases],
+        }
+
+    def report(self):
+        """Return a human-readable table of the phases."""
+        total = self.total_ms or 1.0
+        lines = ["Start-up phases (%.1f ms total):" % self.total_ms]
+        for name, ms in self.phases:
+            lines.append("  %-24s %8.1f ms  %5.1f%%" % (name, ms, 100.0 * ms / total))
+        return "\n".join(lines)
+
+
+def import_times(root, module="app"):
+    """
+    Measure import cost of ``module`` in a fresh interpreter.
+
+    Args:
+        root: Directory to run in (the project root).
+        module: Module to import.
+
+    Returns:
+        A list of dicts ``{"module", "self_us", "cumulative_us",
+        "depth"}`` for ``module`` and everything it imported, in the
+        order reported by ``-X importtime`` (children before parents).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        cwd=root,
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append(
+            {
+                "module": name.strip(),
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                # -X importtime indents nested imports by two spaces.
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            }
+        )
+
+    # A module is reported after everything it imported, so the subtree
+    # for ``module`` is the run of nested entries just before its own
+    # top-level line.  Interpreter start-up imports come earlier.
+    for end in range(len(entries) - 1, -1, -1):
+        if entries[end]["depth"] == 0 and entries[end]["module"] == module:
+            break
+    else:
+        return []
+    start = end
+    while start > 0 and entries[start - 1]["depth"] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@startup_cli.command("profile")
+@click.option("--top", default=15, show_default=True, help="Modules to list by self time.")
+@click.option("--json", "as_json", is_flag=True, help="Print JSON instead of a table.")
+def profile_command(top, as_json):
+    """Report create_app phase timings and a cold import breakdown."""
+    profile = current_app.extensions["startup_profile"]
+    entries = import_times(current_app.root_path)
+    direct = [e for e in entries if e["depth"] == 1]
+    slowest = sorted(entries, key=lambda e: e["self_us"], reverse=True)[:top]
+
+    if as_json:
+        click.echo(
+            json.dumps(
+                {
+                    "create_app": profile.as_dict(),
+                    "import_total_us": sum(e["cumulative_us"] for e in entries if e["depth"] == 0),
+                    "direct_imports": direct,
+                    "slowest_modules": slowest,
+                },
+                indent=2,
+            )
+        )
+        return
+
+    click.echo(profile.report())
+    click.echo("")
+    click.echo("Cold imports of app.py (fresh interpreter):")
+    for entry in sorted(direct, key=lambda e: e["cumulative_us"], reverse=True):
+        click.echo("  %-32s %8.1f ms" % (entry["module"], entry["cumulative_us"] / 1000))
+    click.echo("")
+    click.echo("Slowest modules by self time:")
+    for entry in slowest:
+        click.echo("  %-32s %8.1f ms" % (entry["module"], entry["self_us"] / 1000))
@@ -3,11 +3,12 @@
  * @description Client-side interactivity for the Ironforge Welding website.
  *
  * Handles:
+ *  - Applying the asynchronously loaded stylesheet (critical CSS is inlined)
  *  - Mobile navigation toggle (hamburger menu)
  *  - Flash message dismiss buttons
  *  - Service card expand / collapse
  *  - Client-side contact form validation
- *  - Gallery category filtering
+ *  - Gallery category filtering and infinite scroll (via /api/gallery)
  *  - Gallery lightbox (open, close, keyboard navigation)
  *  - Hero background video reduced-motion preference
  *
@@ -40,6 +41,24 @@ function qsa(selector, parent) {
     return Array.from((parent || document).querySelectorAll(selector));
 }
 
+/* ==========================================================================
+   Asynchronous Stylesheet
+   ========================================================================== */
+
+/**
+ * Apply stylesheets that were loaded as media="print" so they don't block
+ * the first render (the page's critical CSS is inlined in <head>).  Runs
+ * immediately rather than on DOMContentLoaded, so the full styles apply
+ * as soon as they arrive.
+ */
+function applyAsyncStylesheets() {
+    qsa("link[data-async-css]").forEach(function (link) {
+        link.media = "all";
+    });
+}
+
+applyAsyncStylesheets();
+
 /* ==========================================================================
    Mobile Navigation Toggle
    ========================================================================== */
@@ -222,34 +241,184 @@ function initFormValidation() {
 }
 
 /* ==========================================================================
-   Gallery Category Filtering
+   Gallery Filtering & Infinite Scroll
    ========================================================================== */
 
 /**
- * Initialise client-side category filtering on the gallery page.
+ * Build a gallery card element from one /api/gallery item.
+ * Mirrors the markup in templates/gallery.html.
+ * @param {Object} item - Project data from the API.
+ * @param {string} sizes - The img "sizes" attribute.
+ * @returns {Element} The <article> element.
+ */
+function buildGalleryCard(item, sizes) {
+    var card = document.createElement("article");
+    card.className = "gallery-card";
+    card.setAttribute("data-category", item.category);
+
+    var wrapper = document.createElement("div");
+    wrapper.className = "gallery-image-wrapper";
+
+    var img = document.createElement("img");
+    img.className = "gallery-image";
+    img.src = item.src;
+    if (item.srcset) {
+        img.srcset = item.srcset;
+        img.sizes = sizes;
+    }
+    img.alt = item.alt;
+    img.loading = "lazy";
+    if (item.width) {
+        img.width = item.width;
+        img.height = item.height;
+    }
+    if (item.placeholder) {
+        img.setAttribute("style", item.placeholder);
+    }
+
+    var overlay = document.createElement("div");
+    overlay.className = "gallery-overlay";
+
+    var zoomBtn = document.createElement("button");
+    zoomBtn.className = "gallery-zoom-btn";
+    zoomBtn.setAttribute("data-image", item.full);
+    zoomBtn.setAttribute("data-alt", item.alt);
+    zoomBtn.setAttribute("data-title", item.title);
+    zoomBtn.setAttribute("data-description", item.description);
+    zoomBtn.setAttribute("aria-label", "View full-size image of " + item.title);
+
+    var icon = document.createElement("span");
+    icon.className = "zoom-icon";
+    icon.setAttribute("aria-hidden", "true");
+    icon.textContent = "\u2295";
+
+    zoomBtn.appendChild(icon);
+    overlay.appendChild(zoomBtn);
+    wrapper.appendChild(img);
+    wrapper.appendChild(overlay);
+
+    var body = document.createElement("div");
+    body.className = "gallery-card-body";
+
+    var badge = document.createElement("span");
+    badge.className = "gallery-category-badge";
+    badge.textContent = item.category;
+
+    var title = document.createElement("h3");
+    title.className = "gallery-card-title";
+    title.textContent = item.title;
+
+    var desc = document.createElement("p");
+    desc.className = "gallery-card-desc";
+    desc.textContent = item.description;
+
+    body.appendChild(badge);
+    body.appendChild(title);
+    body.appendChild(desc);
+
+    card.appendChild(wrapper);
+    card.appendChild(body);
+    return card;
+}
+
+/**
+ * Initialise category filtering and infinite scroll on the gallery page.
  *
- * When a filter button is clicked the page does NOT reload — the JS
- * shows/hides cards instantly by toggling a CSS class.  The href on
- * each button provides a server-side fallback for visitors with JS
- * disabled.
+ * The server renders only the first page of projects.  Clicking a
+ * filter button fetches that category's first page from /api/gallery
+ * and replaces the grid without reloading; further pages are appended
+ * as the "Load more" link scrolls into view.  The hrefs on the buttons
+ * and on the link provide a server-side fallback for visitors with JS
+ * disabled (or if a fetch fails).
  */
 function initGalleryFilters() {
+    var grid = qs("#gallery-grid");
     var filterButtons = qsa(".filter-btn");
-    var galleryCards = qsa(".gallery-card");
+    var moreLink = qs("#gallery-more");
     var emptyState = qs("#gallery-empty");
 
     // Bail out if we're not on the gallery page.
-    if (filterButtons.length === 0 || galleryCards.length === 0) {
+    if (!grid || !moreLink || !window.fetch) {
         return;
     }
 
+    var apiUrl = grid.getAttribute("data-api");
+    var moreContainer = moreLink.parentElement;
+    var loading = false;
+    // Infinite scroll starts loading this many pixels before the link.
+    var scrollMargin = 400;
+    var infiniteScroll = "IntersectionObserver" in window;
+
+    /**
+     * Fetch one page and add its cards to the grid.
+     * @param {string} category - Category slug.
+     * @param {string} cursor - Cursor from the previous page ("" for the first).
+     * @param {boolean} replace - Clear the grid first (new filter).
+     * @param {string} fallbackUrl - Page to navigate to if the fetch fails.
+     */
+    function loadPage(category, cursor, replace, fallbackUrl) {
+        if (loading) {
+            return;
+        }
+        loading = true;
+
+        var params = new URLSearchParams({ category: category });
+        if (cursor) {
+            params.set("cursor", cursor);
+        }
+
+        fetch(apiUrl + "?" + params.toString(), {
+            headers: { Accept: "application/json" },
+        })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error("HTTP " + response.status);
+                }
+                return response.json();
+            })
+            .then(function (page) {
+                if (replace) {
+                    grid.textContent = "";
+                }
+                page.items.forEach(function (item) {
+                    grid.appendChild(buildGalleryCard(item, page.sizes));
+                });
+
+                // Point the "Load more" link at the following page.
+                moreLink.setAttribute("data-category", page.category);
+                moreLink.setAttribute("data-cursor", page.next || "");
+                if (page.next) {
+                    var next = new URLSearchParams({
+                        category: page.category,
+                        cursor: page.next,
+                    });
+                    moreLink.href = window.location.pathname + "?" + next.toString();
+                }
+                moreContainer.hidden = !page.next;
+
+                if (emptyState) {
+                    emptyState.hidden = grid.children.length > 0;
+                }
+                loading = false;
+
+                // The observer only fires when the link enters or leaves
+                // the viewport; if the new cards did not push it out
+                // (short page, tall screen), keep loading.
+                if (infiniteScroll && moreLinkInView()) {
+                    loadMore();
+                }
+            })
+            .catch(function () {
+                // Fall back to a full page load.
+                window.location.href = fallbackUrl;
+            });
+    }
+
     filterButtons.forEach(function (btn) {
         btn.addEventListener("click", function (event) {
-            // Prevent the link from navigating (JS handles filtering).
+            // Prevent the link from navigating (JS fetches the category).
             event.preventDefault();
 
-            var category = btn.getAttribute("data-category");
-
             // Update active state on buttons.
             filterButtons.forEach(function (b) {
                 b.classList.remove("active");
@@ -258,24 +427,48 @@ function initGalleryFilters() {
             btn.classList.add("active");
             btn.setAttribute("aria-pressed", "true");
 
-            // Show / hide cards based on selected category.
-            var visibleCount = 0;
-            galleryCards.forEach(function (card) {
-                var cardCategory = card.getAttribute("data-category");
-                if (category === "all" || cardCategory === category) {
-                    card.classList.remove("hidden");
-                    visibleCount++;
-                } else {
-                    card.classList.add("hidden");
-                }
-            });
-
-            // Toggle empty-state message.
-            if (emptyState) {
-                emptyState.hidden = visibleCount > 0;
-            }
+            // Keep the address bar shareable without adding history entries.
+            window.history.replaceState(null, "", btn.href);
+            loadPage(btn.getAttribute("data-category"), "", true, btn.href);
         });
     });
+
+    /**
+     * Load the page the "Load more" link currently points at.
+     */
+    function loadMore() {
+        var cursor = moreLink.getAttribute("data-cursor");
+        if (cursor && !moreContainer.hidden) {
+            loadPage(moreLink.getAttribute("data-category"), cursor, false, moreLink.href);
+        }
+    }
+
+    /**
+     * Whether the "Load more" link is within the infinite-scroll margin.
+     * @returns {boolean}
+     */
+    function moreLinkInView() {
+        var rect = moreLink.getBoundingClientRect();
+        return rect.top < window.innerHeight + scrollMargin && rect.bottom > -scrollMargin;
+    }
+
+    moreLink.addEventListener("click", function (event) {
+        event.preventDefault();
+        loadMore();
+    });
+
+    // Infinite scroll: load the next page shortly before the link is reached.
+    if (infiniteScroll) {
+        var observer = new IntersectionObserver(
+            function (entries) {
+                if (entries[0].isIntersecting) {
+                    loadMore();
+                }
+            },
+            { rootMargin: scrollMargin + "px 0px" }
+        );
+        observer.observe(moreLink);
+    }
 }
 
 /* ==========================================================================
@@ -350,17 +543,20 @@ function initLightbox() {
         }
     }
 
-    // Attach click handlers to all zoom buttons in the gallery.
-    qsa(".gallery-zoom-btn").forEach(function (btn) {
-        btn.addEventListener("click", function () {
-            triggerElement = btn;
-            openLightbox(
-                btn.getAttribute("data-image"),
-                btn.getAttribute("data-alt"),
-                btn.getAttribute("data-title"),
-                btn.getAttribute("data-description")
-            );
-        });
+    // One delegated handler covers zoom buttons on cards added later by
+    // the infinite scroll as well as those rendered by the server.
+    document.addEventListener("click", function (event) {
+        var btn = event.target.closest(".gallery-zoom-btn");
+        if (!btn) {
+            return;
+        }
+        triggerElement = btn;
+        openLightbox(
+            btn.getAttribute("data-image"),
+            btn.getAttribute("data-alt"),
+            btn.getAttribute("data-title"),
+            btn.getAttribute("data-description")
+        );
     });
 
     // Close on the X button.
@@ -0,0 +1,353 @@
+"""
+Durable store for quote-request submissions.
+
+Until now a quote request only existed in a log line and an email, so a
+failed SMTP send meant a lost lead.  Every valid submission is now also
+written to a local SQLite database:
+
+* The database runs in WAL mode with ``synchronous=NORMAL``, so readers
+  never block the writer and a commit does not wait for a full fsync of
+  the main database file.
+* Writes are *write-behind*: ``contact_submit`` appends the row to an
+  in-memory buffer and returns; a background thread commits buffered
+  rows in one transaction every ``SUBMISSIONS_FLUSH_INTERVAL`` seconds
+  (or as soon as ``SUBMISSIONS_BATCH_SIZE`` rows are waiting).  A burst
+  of submissions therefore costs one commit, not one per request.  The
+  buffer is flushed on interpreter exit.
+* ``created_at`` and ``email`` are indexed for fast lookups.
+* Rows older than ``SUBMISSIONS_RETENTION_DAYS`` are purged once a day
+  by the writer thread; ``flask submissions compact`` also reclaims the
+  freed space.
+
+Like the mail queue, the writer thread starts lazily and is recreated
+after a fork.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# Module-level logger for the submission store.
+logger = logging.getLogger(__name__)
+
+# CLI group: ``flask submissions <command>``.
+submissions_cli = AppGroup("submissions", help="Inspect and maintain stored quote requests.")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone TEXT,
+    service_type TEXT,
+    message TEXT NOT NULL,
+    remote_addr TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_submissions_created_at ON submissions (created_at);
+CREATE INDEX IF NOT EXISTS ix_submissions_email ON submissions (email COLLATE NOCASE);
+"""
+
+COLUMNS = ("created_at", "name", "email", "phone", "service_type", "message", "remote_addr")
+
+INSERT_SQL = "INSERT INTO submissions (%s) VALUES (%s)" % (
+    ", ".join(COLUMNS),
+    ", ".join("?" for _ in COLUMNS),
+)
+
+# Seconds between automatic retention purges.
+PURGE_INTERVAL = 24 * 60 * 60
+
+
+def connect(path):
+    """
+    Open the submissions database, creating the schema if needed.
+
+    Args:
+        path: Filesystem path of the SQLite database.
+
+    Returns:
+        A ``sqlite3.Connection`` with WAL mode enabled and rows
+        returned as ``sqlite3.Row``.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=5.0)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SubmissionStore:
+    """
+    SQLite-backed quote submission store with batched writes.
+
+    Instantiated without an app in ``extensions.py`` and bound later via
+    :meth:`init_app`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.path = None
+        self.batch_size = 50
+        self.flush_interval = 0.5
+        self.retention_days = 0
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._next_purge = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Read store settings from the app config and create the schema.
+
+        Args:
+            app: The Flask application instance.
+        """
+        app.extensions["submission_store"] = self
+        app.cli.add_command(submissions_cli)
+
+        self.enabled = app.config.get("SUBMISSIONS_ENABLED", False)
+        self.path = database_path(app)
+        self.batch_size = max(1, int(app.config.get("SUBMISSIONS_BATCH_SIZE", 50)))
+        self.flush_interval = float(app.config.get("SUBMISSIONS_FLUSH_INTERVAL", 0.5))
+        self.retention_days = int(app.config.get("SUBMISSIONS_RETENTION_DAYS", 0))
+        if not self.enabled:
+            return
+
+        # Create the file and schema up front so a bad path fails loudly
+        # at startup rather than on the first submission.
+        connect(self.path).close()
+        atexit.register(self.flush)
+        app.logger.info("Quote submissions stored in %s.", self.path)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record(self, name, email, phone, service_type, message, remote_addr=None):
+        """
+        Buffer one submission for the next batched commit.
+
+        Args:
+            name: Customer's full name.
+            email: Customer's email address.
+            phone: Customer's phone number (or "not provided").
+            service_type: The service slug (or "not specified").
+            message: Free-text project description.
+            remote_addr: The client's IP address, if known.
+        """
+        if not self.enabled:
+            return
+        self._ensure_writer()
+        row = (time.time(), name, email, phone, service_type, message, remote_addr)
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self, connection=None):
+        """
+        Commit every buffered row in a single transaction.
+
+        Args:
+            connection: An open connection to reuse (the writer thread
+                        keeps one); a short-lived one is opened if None.
+
+        Returns:
+            The number of rows written.
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        try:
+            own_connection = connection is None
+            if own_connection:
+                connection = connect(self.path)
+            try:
+                with connection:
+                    connection.executemany(INSERT_SQL, rows)
+            finally:
+                if own_connection:
+                    connection.close()
+        except sqlite3.Error:
+            # Put the rows back so the next flush retries them.  The
+            # submissions are also in the logs and the email.
+            logger.exception("Failed to store %d quote submission(s).", len(rows))
+            with self._lock:
+                self._buffer[:0] = rows
+            return 0
+        return len(rows)
+
+    def _ensure_writer(self):
+        """Start the writer thread in this process if not running."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Rows buffered by a parent process belong to the parent.
+            self._buffer = []
+            self._thread = threading.Thread(
+                target=self._writer, name="submission-writer", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _writer(self):
+        """Flush the buffer periodically and run the retention purge."""
+        connection = connect(self.path)
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush(connection)
+            if self.retention_days and time.monotonic() >= self._next_purge:
+                self._next_purge = time.monotonic() + PURGE_INTERVAL
+                try:
+                    self.purge(self.retention_days)
+                except sqlite3.Error:
+                    logger.exception("Submission retention purge failed.")
+
+    # ------------------------------------------------------------------
+    # Reading and maintenance
+    # ------------------------------------------------------------------
+
+    def recent(self, limit=20):
+        """
+        Return the most recent submissions, newest first.
+
+        Args:
+            limit: Maximum number of rows.
+
+        Returns:
+            A list of ``sqlite3.Row`` objects.
+        """
+        connection = connect(self.path)
+        try:
+            return connection.execute(
+                "SELECT * FROM submissions ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def find_by_email(self, email):
+        """
+        Return every submission from one email address, newest first.
+
+        Args:
+            email: Address to look up (case-insensitive).
+
+        Returns:
+            A list of ``sqlite3.Row`` objects.
+        """
+        connection = connect(self.path)
+        try:
+            return connection.execute(
+                "SELECT * FROM submissions WHERE email = ? COLLATE NOCASE "
+                "ORDER BY created_at DESC",
+                (email,),
+            ).fetchall()
+        finally:
+            connection.close()
+
+    def purge(self, days):
+        """
+        Delete submissions older than ``days`` days.
+
+        Args:
+            days: Retention period in days.
+
+        Returns:
+            The number of rows deleted.
+        """
+        cutoff = time.time() - days * 86400
+        connection = connect(self.path)
+        try:
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM submissions WHERE created_at < ?", (cutoff,)
+                ).rowcount
+        finally:
+            connection.close()
+        if deleted:
+            logger.info("Purged %d quote submission(s) older than %d days.", deleted, days)
+        return deleted
+
+    def compact(self):
+        """Checkpoint the WAL and rebuild the database file to reclaim space."""
+        connection = connect(self.path)
+        try:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+
+
+def database_path(app):
+    """
+    Return where the submissions database lives.
+
+    Args:
+        app: The Flask application instance.
+    """
+    return app.config.get("SUBMISSIONS_DB_PATH") or os.path.join(
+        app.instance_path, "submissions.sqlite3"
+    )
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+@submissions_cli.command("list")
+@click.option("--email", default=None, help="Only show submissions from this address.")
+@click.option("--limit", default=20, show_default=True, help="Maximum rows to show.")
+def list_command(email, limit):
+    """Show stored quote requests, newest first."""
+    store = current_app.extensions["submission_store"]
+    rows = store.find_by_email(email)[:limit] if email else store.recent(limit)
+    for row in rows:
+        click.echo(
+            "%s  %-24s %-30s %-12s %s"
+            % (
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"])),
+                row["name"][:24],
+                row["email"][:30],
+                row["service_type"] or "",
+                row["message"][:60].replace("\n", " "),
+            )
+        )
+
+
+@submissions_cli.command("compact")
+@click.option(
+    "--days",
+    default=None,
+    type=int,
+    help="Retention in days (default: SUBMISSIONS_RETENTION_DAYS).",
+)
+def compact_command(days):
+    """Purge submissions past retention and reclaim disk space."""
+    store = current_app.extensions["submission_store"]
+    days = days if days is not None else store.retention_days
+    deleted = store.purge(days) if days else 0
+    store.compact()
+    click.echo("Purged %d submission(s); database compacted." % deleted)
@@ -0,0 +1,146 @@
+"""
+Template bytecode cache and startup warm-up.
+
+Jinja compiles each template to Python the first time it is rendered,
+so the first visitors after a deploy or worker recycle pay for compiling
+``base.html`` and the page they asked for.  Two settings remove that:
+
+* ``JINJA_BYTECODE_CACHE`` stores compiled templates under
+  ``instance/jinja-cache/`` (or ``JINJA_BYTECODE_CACHE_DIR``).  Every
+  worker shares the directory, so a template is compiled once per
+  change rather than once per worker.  Entries are keyed by template
+  name and source checksum, so an edited template is never served stale.
+* ``TEMPLATE_WARMUP`` (opt-in) makes ``create_app`` compile every
+  template and render every argument-free GET route once before it
+  returns, so the worker is fully warm when it starts taking traffic.
+  This also fills the page cache, including each page's compressed
+  form (see ``compression.py``), and checks that every page with an
+  ETag answers a repeat request for it with ``304 Not Modified``.
+"""
+
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+# Endpoints with nothing to warm (file responses, /metrics).
+SKIP_ENDPOINTS = {"static", "image_derivative", "metrics"}
+
+
+def configure_bytecode_cache(app):
+    """
+    Attach a shared on-disk bytecode cache to the app's Jinja environment.
+
+    Args:
+        app: The Flask application instance.
+    """
+    if not app.config.get("JINJA_BYTECODE_CACHE", False):
+        return
+    directory = app.config.get("JINJA_BYTECODE_CACHE_DIR") or os.path.join(
+        app.instance_path, "jinja-cache"
+    )
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.logger.info("Jinja bytecode cache in %s.", directory)
+
+
+def precompile_templates(app):
+    """
+    Load every template so it is compiled (and written to the bytecode cache).
+
+    Args:
+        app: The Flask application instance.
+
+    Returns:
+        The number of templates compiled.
+    """
+    names = app.jinja_env.list_templates(extensions=("html",))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_routes(app):
+    """
+    Render every GET route that takes no URL arguments.
+
+    Requests go through the full stack (blueprints, page cache, after-
+    request hooks) via the test client.  A response with an ETag is
+    requested again with ``If-None-Match`` to check it revalidates.
+    The rate limiter is switched off for the duration so warm-up
+    requests don't count against localhost.
+
+    Args:
+        app: The Flask application instance.
+
+    Returns:
+        A list of (path, status code, milliseconds, revalidation status)
+        tuples; the last is None for responses without an ETag.
+    """
+    # Flask-Limiter registers a set of limiters under "limiter".
+    limiters = [(lim, lim.enabled) for lim in app.extensions.get("limiter", ())]
+    for lim, _enabled in limiters:
+        lim.enabled = False
+
+    results = []
+    try:
+        client = app.test_client()
+        for rule in app.url_map.iter_rules():
+            if (
+                rule.endpoint in SKIP_ENDPOINTS
+                or rule.arguments
+                or "GET" not in rule.methods
+            ):
+                continue
+            started = time.perf_counter()
+            # Accept-Encoding so cached pages are compressed now too.
+            response = client.get(rule.rule, headers={"Accept-Encoding": "br, gzip"})
+            elapsed = (time.perf_counter() - started) * 1000
+            response.close()
+
+            revalidated = None
+            etag = response.headers.get("ETag")
+            if etag:
+                repeat = client.get(
+                    rule.rule,
+                    headers={"Accept-Encoding": "br, gzip", "If-None-Match": etag},
+                )
+                revalidated = repeat.status_code
+                repeat.close()
+            results.append((rule.rule, response.status_code, elapsed, revalidated))
+    finally:
+        for lim, enabled in limiters:
+            lim.enabled = enabled
+    return results
+
+
+def warm_up(app):
+    """
+    Precompile templates and render every GET route, logging the timings.
+
+    Args:
+        app: The Flask application instance.
+    """
+    started = time.perf_counter()
+    compiled = precompile_templates(app)
+    compiled_ms = (time.perf_counter() - started) * 1000
+
+    results = warm_routes(app)
+    for path, status, elapsed, revalidated in results:
+        if status != 200:
+            app.logger.warning("Warm-up: %s returned %d.", path, status)
+        if revalidated not in (None, 304):
+            app.logger.warning(
+                "Warm-up: %s returned %d, not 304, for its own ETag.", path, revalidated
+            )
+        app.logger.debug("Warm-up: %s rendered in %.1f ms.", path, elapsed)
+
+    app.logger.info(
+        "Warm-up complete: %d templates compiled in %.0f ms, %d routes "
+        "rendered in %.0f ms (total %.0f ms).",
+        compiled,
+        compiled_ms,
+        len(results),
+        sum(result[2] for result in results),
+        (time.perf_counter() - started) * 1000,
+    )